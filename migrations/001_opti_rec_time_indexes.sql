@@ -0,0 +1,14 @@
+-- Indexes for the attendance hot paths (apply to opti_db and opti_test):
+--   mysql -u root -p opti_db   < migrations/001_opti_rec_time_indexes.sql
+--   mysql -u root -p opti_test < migrations/001_opti_rec_time_indexes.sql
+--
+-- api_scan looks up today's record per employee   -> (id_employee, time_in)
+-- dashboard / exports / payroll filter by day range -> (time_in)
+-- Both only help once queries compare time_in against a half-open range
+-- (time_in >= day AND time_in < day + 1) instead of DATE(time_in) = day.
+-- The composite index also covers the opti_rec -> opti foreign key, so MySQL
+-- may drop the implicit FK index it created on id_employee.
+
+ALTER TABLE opti_rec
+    ADD INDEX idx_opti_rec_emp_time (id_employee, time_in),
+    ADD INDEX idx_opti_rec_time_in (time_in);
@@ -0,0 +1,32 @@
+-- Per-employee, per-day payroll rollup for opti_test (monthly_payroll and
+-- /api/payroll read this instead of re-aggregating opti_rec):
+--   mysql -u root -p opti_test < migrations/002_opti_daily_pay.sql
+-- The backfill is safe to re-run: it overwrites each day from opti_rec.
+
+CREATE TABLE IF NOT EXISTS opti_daily_pay (
+    id_employee INT NOT NULL,
+    work_date DATE NOT NULL,                 -- DATE(opti_rec.time_in)
+    shifts INT NOT NULL DEFAULT 0,
+    minutes INT NOT NULL DEFAULT 0,
+    salary DECIMAL(12,2) NOT NULL DEFAULT 0,
+    late_minutes INT NOT NULL DEFAULT 0,
+    undertime_minutes INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_employee, work_date),
+    INDEX idx_opti_daily_pay_date (work_date),
+    FOREIGN KEY (id_employee) REFERENCES opti(id_employee) ON DELETE CASCADE
+);
+
+INSERT INTO opti_daily_pay
+    (id_employee, work_date, shifts, minutes, salary, late_minutes, undertime_minutes)
+SELECT id_employee, DATE(time_in), COUNT(*),
+       IFNULL(SUM(duration), 0), IFNULL(SUM(salary), 0),
+       IFNULL(SUM(late_minutes), 0), IFNULL(SUM(undertime_minutes), 0)
+FROM opti_rec
+WHERE time_in IS NOT NULL
+GROUP BY id_employee, DATE(time_in)
+ON DUPLICATE KEY UPDATE
+    shifts = VALUES(shifts),
+    minutes = VALUES(minutes),
+    salary = VALUES(salary),
+    late_minutes = VALUES(late_minutes),
+    undertime_minutes = VALUES(undertime_minutes);
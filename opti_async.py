@@ -0,0 +1,39 @@
+# -----------------------------
+# Concurrency Mode
+# -----------------------------
+# "threading": one OS thread per request / Socket.IO client (Werkzeug).
+# "eventlet":  cooperative green threads on one OS thread. eventlet patches
+#              socket, select, threading, queue and time, so PyMySQL, the
+#              connection pool and every lock / Event / Condition in the opti_*
+#              modules become green-thread aware without code changes.
+#
+# setup_async_mode() has to run before flask, pymysql or any opti_* module is
+# imported, otherwise they keep references to the unpatched stdlib.
+
+ASYNC_MODES = ("threading", "eventlet")
+
+_mode = "threading"
+
+
+def setup_async_mode(mode):
+    global _mode
+    if mode not in ASYNC_MODES:
+        raise ValueError(f"async mode must be one of: {', '.join(ASYNC_MODES)}")
+    if mode == "eventlet":
+        import eventlet
+        eventlet.monkey_patch()
+    _mode = mode
+    return mode
+
+
+def async_mode():
+    return _mode
+
+
+def blocking_call(fn, *args, **kwargs):
+    """Run a call that eventlet cannot make cooperative (pyserial on Windows,
+    fsync) on a real OS thread from eventlet's pool; a plain call otherwise."""
+    if _mode == "eventlet":
+        from eventlet import tpool
+        return tpool.execute(fn, *args, **kwargs)
+    return fn(*args, **kwargs)
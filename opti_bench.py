@@ -0,0 +1,902 @@
+"""Benchmarks for the OPTI hot paths against a scratch MySQL/MariaDB database.
+
+    python opti_bench.py delete --employees 2000 --history-days 30
+    python opti_bench.py export --employees 500 --history-days 365
+    python opti_bench.py payroll --employees 3000 --history-days 365
+    python opti_bench.py async --employees 2000 --history-days 1 --clients 2000
+    python opti_bench.py storm --employees 2000 --history-days 30 --concurrency 50
+    python opti_bench.py cooldown --lookups 200000 --workers 4
+    python opti_bench.py workers --employees 5000 --history-days 1 --workers 4 --concurrency 64
+    python opti_bench.py startup --employees 5000 --history-days 30 --runs 5
+
+Each benchmark (re)creates the `opti_bench` database, so it never touches
+opti_db or opti_test (cooldown needs no database). Connection settings default to the ones the apps use.
+With --spawn-mysqld a throwaway mysqld / mariadbd is started on a temporary
+datadir (on --port, which must be free) instead of using a running server.
+"""
+import argparse
+import concurrent.futures
+import csv
+import io
+import json
+import multiprocessing
+import os
+import http.cookiejar
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.parse
+import urllib.request
+from datetime import date, datetime, time as dt_time, timedelta
+
+import pymysql
+
+from opti_cooldown import CooldownStore, SharedCooldown
+from opti_export import stream_attendance_csv, stream_attendance_xlsx
+from opti_payroll import recompute_payroll
+from opti_pool import ConnectionPool
+from opti_scan import ScanRules
+from opti_serial import FakeArduino
+from opti_sql import delete_employee, period_range
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BENCH_DB = "opti_bench"
+
+# Same tables as opti_db.sql / opti_test.sql. The foreign key is declared
+# ON UPDATE CASCADE here only so the legacy renumbering loop can run to
+# completion on employees that have history; the shipped schema rejects it.
+BENCH_SCHEMA = [
+    f"DROP DATABASE IF EXISTS {BENCH_DB}",
+    f"CREATE DATABASE {BENCH_DB}",
+    f"USE {BENCH_DB}",
+    """CREATE TABLE opti (
+        id_employee INT PRIMARY KEY,
+        name VARCHAR(100) NOT NULL,
+        age INT,
+        sex ENUM('Male','Female') NOT NULL,
+        email VARCHAR(100),
+        number VARCHAR(20),
+        rfid VARCHAR(50) UNIQUE,
+        password VARCHAR(255) DEFAULT NULL
+    )""",
+    """CREATE TABLE opti_rec (
+        id INT AUTO_INCREMENT PRIMARY KEY,
+        id_employee INT NOT NULL,
+        time_in DATETIME,
+        time_out DATETIME,
+        duration INT DEFAULT 0,
+        salary DECIMAL(10,2) DEFAULT 0,
+        late_minutes INT DEFAULT 0,
+        undertime_minutes INT DEFAULT 0,
+        INDEX idx_opti_rec_emp_time (id_employee, time_in),
+        INDEX idx_opti_rec_time_in (time_in),
+        FOREIGN KEY (id_employee) REFERENCES opti(id_employee) ON DELETE CASCADE ON UPDATE CASCADE
+    )""",
+    """CREATE TABLE opti_daily_pay (
+        id_employee INT NOT NULL,
+        work_date DATE NOT NULL,
+        shifts INT NOT NULL DEFAULT 0,
+        minutes INT NOT NULL DEFAULT 0,
+        salary DECIMAL(12,2) NOT NULL DEFAULT 0,
+        late_minutes INT NOT NULL DEFAULT 0,
+        undertime_minutes INT NOT NULL DEFAULT 0,
+        PRIMARY KEY (id_employee, work_date),
+        FOREIGN KEY (id_employee) REFERENCES opti(id_employee) ON DELETE CASCADE ON UPDATE CASCADE
+    )""",
+]
+
+
+# -----------------------------
+# Round-trip Counting
+# -----------------------------
+class CountingCursor(pymysql.cursors.DictCursor):
+    """DictCursor that counts statements sent to the server."""
+    round_trips = 0
+
+    def execute(self, query, args=None):
+        CountingCursor.round_trips += 1
+        return super().execute(query, args)
+
+
+class Meter:
+    def __init__(self, conn):
+        self._conn = conn
+        self._commit = conn.commit
+        conn.commit = self._counting_commit
+
+    def _counting_commit(self):
+        CountingCursor.round_trips += 1
+        return self._commit()
+
+    def __enter__(self):
+        CountingCursor.round_trips = 0
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
+        self.round_trips = CountingCursor.round_trips
+
+
+def connect(args, database=None):
+    return pymysql.connect(host=args.host, port=args.port, user=args.user, password=args.password,
+                           database=database, cursorclass=CountingCursor)
+
+
+# -----------------------------
+# Seeding
+# -----------------------------
+def seed(args):
+    """Fresh opti_bench with --employees staff and --history-days of shifts each."""
+    conn = connect(args)
+    with conn.cursor() as cur:
+        for stmt in BENCH_SCHEMA:
+            cur.execute(stmt)
+        cur.executemany(
+            "INSERT INTO opti (id_employee, name, age, sex, email, number, rfid) VALUES (%s,%s,%s,%s,%s,%s,%s)",
+            [(i, f"Employee {i}", 20 + i % 40, "Male" if i % 2 else "Female",
+              f"emp{i}@example.com", f"0917{i:07d}", f"RFID{i:08d}")
+             for i in range(1, args.employees + 1)])
+        today = datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        rng = random.Random(42)
+        rows = []
+        for day in range(args.history_days, 0, -1):
+            base = today - timedelta(days=day)
+            for i in range(1, args.employees + 1):
+                time_in = base + timedelta(hours=7, minutes=rng.randint(30, 90))
+                time_out = base + timedelta(hours=16, minutes=rng.randint(30, 90))
+                duration = int((time_out - time_in).total_seconds() // 60)
+                rows.append((i, time_in, time_out, duration, duration * 5,
+                             max(0, int((time_in - base).total_seconds() // 60) - 480),
+                             max(0, 1020 - int((time_out - base).total_seconds() // 60))))
+                if len(rows) >= 5000:
+                    _insert_history(cur, rows)
+                    rows = []
+        if rows:
+            _insert_history(cur, rows)
+    conn.commit()
+    return conn
+
+
+def _insert_history(cur, rows):
+    cur.executemany(
+        "INSERT INTO opti_rec (id_employee, time_in, time_out, duration, salary, late_minutes, undertime_minutes) "
+        "VALUES (%s,%s,%s,%s,%s,%s,%s)", rows)
+
+
+# -----------------------------
+# Benchmarks
+# -----------------------------
+def legacy_drop(connection, emp_id):
+    # drop_employee / api_drop_employee before stable ids: one UPDATE per later row
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM opti WHERE id_employee=%s", (emp_id,))
+    connection.commit()
+    cursor.execute("SELECT id_employee FROM opti ORDER BY id_employee ASC")
+    employees = cursor.fetchall()
+    for index, emp in enumerate(employees, start=1):
+        if emp['id_employee'] != index:
+            cursor.execute("UPDATE opti SET id_employee=%s WHERE id_employee=%s", (index, emp['id_employee']))
+    connection.commit()
+
+
+def bench_delete(args):
+    modes = [
+        ("legacy loop", legacy_drop),
+        ("stable ids", delete_employee),
+    ]
+    print(f"delete employee #{args.victim} of {args.employees} "
+          f"({args.history_days} days of history each)")
+    for name, drop in modes:
+        conn = seed(args)
+        meter = Meter(conn)
+        with meter:
+            drop(conn, args.victim)
+        print(f"  {name:<22} {meter.round_trips:>6} round trips  {meter.seconds * 1000:>10.1f} ms")
+        conn.close()
+
+
+def legacy_csv_export(pool, first, last):
+    # export_excel before streaming: fetchall -> StringIO -> BytesIO copy
+    start, end = period_range(first, last)
+    with pool.connection() as conn, conn.cursor() as cursor:
+        cursor.execute("""
+            SELECT opti.name, opti_rec.time_in, opti_rec.time_out, opti_rec.duration, opti_rec.salary
+            FROM opti_rec
+            JOIN opti ON opti_rec.id_employee = opti.id_employee
+            WHERE opti_rec.time_in >= %s AND opti_rec.time_in < %s
+            ORDER BY opti_rec.time_in DESC
+        """, (start, end))
+        records = cursor.fetchall()
+    output = io.StringIO()
+    writer = csv.writer(output)
+    writer.writerow(["Name", "Time In", "Time Out", "Duration (min)", "Salary"])
+    for r in records:
+        writer.writerow([
+            r["name"],
+            r["time_in"].strftime("%H:%M") if r["time_in"] else "",
+            r["time_out"].strftime("%H:%M") if r["time_out"] else "",
+            r.get("duration", ""),
+            r.get("salary", "")
+        ])
+    yield io.BytesIO(output.getvalue().encode()).getvalue()
+
+
+EXPORTS = {
+    "csv (legacy fetchall)": legacy_csv_export,
+    "csv (streaming)": lambda pool, first, last: stream_attendance_csv(pool, first, last),
+    "xlsx (streaming)": lambda pool, first, last: stream_attendance_xlsx(pool, first, last, with_late_undertime=True),
+}
+
+
+def _export_worker(kind, args, results):
+    # Runs in a fresh process so each export's peak RSS is its own.
+    pool = ConnectionPool(size=2, host=args.host, port=args.port, user=args.user, password=args.password,
+                          database=BENCH_DB, cursorclass=pymysql.cursors.DictCursor)
+    first, last = date.today() - timedelta(days=args.history_days), date.today()
+    tracing = resource is None
+    if tracing:
+        import tracemalloc
+        tracemalloc.start()
+    started = time.perf_counter()
+    size = 0
+    for chunk in EXPORTS[kind](pool, first, last):
+        size += len(chunk)
+    seconds = time.perf_counter() - started
+    if tracing:
+        peak_kb = tracemalloc.get_traced_memory()[1] // 1024
+    else:
+        peak_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    pool.close()
+    results.put((seconds, size, peak_kb))
+
+
+def bench_export(args):
+    conn = seed(args)
+    with conn.cursor() as cur:
+        cur.execute("SELECT COUNT(*) AS n FROM opti_rec")
+        rows = cur.fetchone()["n"]
+    conn.close()
+    print(f"export {rows} attendance rows ({args.employees} employees x {args.history_days} days)")
+    memory = "peak RSS" if resource is not None else "peak Python heap"
+    for kind in EXPORTS:
+        results = multiprocessing.Queue()
+        worker = multiprocessing.Process(target=_export_worker, args=(kind, args, results))
+        worker.start()
+        seconds, size, peak_kb = results.get()
+        worker.join()
+        print(f"  {kind:<22} {rows / seconds:>10,.0f} rows/s  {size / 1048576:>8.1f} MiB out  "
+              f"{memory} {peak_kb / 1024:>8.1f} MiB")
+
+
+def legacy_recompute(connection, rules, first, last):
+    # what a recompute looks like written like api_scan: one row at a time
+    start, end = period_range(first, last)
+    totals = {"minutes": 0, "salary": 0, "late_minutes": 0, "undertime_minutes": 0}
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT id, time_in, time_out FROM opti_rec WHERE time_in >= %s AND time_in < %s",
+                       (start, end))
+        for r in cursor.fetchall():
+            totals["late_minutes"] += rules.late_minutes(r["time_in"])
+            if r["time_out"]:
+                out = rules.time_out_fields(r["time_in"], r["time_out"])
+                totals["minutes"] += out["duration"]
+                totals["salary"] += out["salary"]
+                totals["undertime_minutes"] += out["undertime_minutes"]
+    return totals
+
+
+def bench_payroll(args):
+    conn = seed(args)
+    first, last = date.today() - timedelta(days=args.history_days), date.today()
+    rules = ScanRules(6, shift_start=dt_time(8, 30), shift_end=dt_time(17, 30))
+    print(f"recompute {args.employees * args.history_days} shifts at a new rate and shift window")
+    modes = [
+        ("python loop (dry run)", lambda: legacy_recompute(conn, rules, first, last)),
+        ("numpy (dry run)", lambda: recompute_payroll(conn, rules, first, last, dry_run=True)),
+        ("numpy (write back)", lambda: recompute_payroll(conn, rules, first, last, dry_run=False)),
+    ]
+    meter = Meter(conn)
+    for name, run in modes:
+        with meter:
+            result = run()
+        changed = f"{result['changed']:>9,} rows written" if not result.get("dry_run", True) else ""
+        print(f"  {name:<22} {meter.seconds * 1000:>10.1f} ms  {changed}")
+    conn.close()
+
+
+# The async benchmark runs the real app (--app) in a subprocess per mode,
+# with OPTI_ASYNC_MODE / OPTI_DB_NAME pointing it at opti_bench and
+# OPTI_DB_HOST / OPTI_DB_PORT at the --host / --port server that was seeded.
+# The app still connects as root / saquilon, so --user / --password must
+# match those.
+SERVE_APP = """
+import sys
+try:
+    import resource
+    resource.setrlimit(resource.RLIMIT_NOFILE, (resource.getrlimit(resource.RLIMIT_NOFILE)[1],) * 2)
+except (ImportError, ValueError, OSError):
+    pass
+app = __import__(sys.argv[1])
+app.create_app()
+app.socketio.run(app.app, host="127.0.0.1", port=int(sys.argv[2]), allow_unsafe_werkzeug=True)
+"""
+
+IDLE_CLIENTS = """
+import eventlet
+eventlet.monkey_patch()
+import json, sys
+import opti_bench
+print(json.dumps(opti_bench.idle_clients(int(sys.argv[1]), int(sys.argv[2]), float(sys.argv[3]))), flush=True)
+"""
+
+
+def _app_env(args, **overrides):
+    """Environment for an app subprocess: the seeded opti_bench on --host / --port."""
+    return {**os.environ, "OPTI_DB_HOST": args.host, "OPTI_DB_PORT": str(args.port),
+            "OPTI_DB_NAME": BENCH_DB, **overrides}
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_http(port, timeout=30, path="/"):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1).read()
+            return True
+        except OSError:
+            time.sleep(0.2)
+    return False
+
+
+def idle_clients(port, count, hold):
+    """Open `count` Socket.IO websocket clients that just answer pings for
+    `hold` seconds. Returns (connected, still connected at the end).
+    Runs under eventlet (see IDLE_CLIENTS) so each client is a green thread."""
+    import eventlet
+    import simple_websocket
+    if resource is not None:
+        resource.setrlimit(resource.RLIMIT_NOFILE, (resource.getrlimit(resource.RLIMIT_NOFILE)[1],) * 2)
+    url = f"ws://127.0.0.1:{port}/socket.io/?EIO=4&transport=websocket"
+    deadline = time.monotonic() + hold
+    stats = {"connected": 0, "alive": 0}
+
+    def client():
+        try:
+            ws = simple_websocket.Client(url)
+            ws.receive(timeout=10)                 # engine.io open packet
+            ws.send("40")                          # socket.io connect
+            while True:
+                msg = ws.receive(timeout=10)
+                if msg and msg.startswith("40"):
+                    stats["connected"] += 1
+                    break
+            while time.monotonic() < deadline:
+                msg = ws.receive(timeout=max(deadline - time.monotonic(), 0.01))
+                if msg == "2":
+                    ws.send("3")                   # engine.io pong
+            if ws.connected:
+                stats["alive"] += 1
+            ws.close()
+        except Exception:
+            pass
+
+    pool = eventlet.GreenPool(count)
+    for _ in range(count):
+        pool.spawn_n(client)
+        eventlet.sleep(0.002)
+    pool.waitall()
+    return stats
+
+
+def _scan(port, uid):
+    req = urllib.request.Request(f"http://127.0.0.1:{port}/api/scan", data=json.dumps({"uid": uid}).encode(),
+                                 headers={"Content-Type": "application/json"})
+    started = time.perf_counter()
+    with urllib.request.urlopen(req, timeout=30) as response:
+        response.read()
+    return (time.perf_counter() - started) * 1000
+
+
+def _percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p / 100))] if values else 0.0
+
+
+def bench_async(args):
+    seed(args).close()
+    uids = [f"RFID{i:08d}" for i in range(1, args.employees + 1)]
+    print(f"{args.app}: {args.clients} idle Socket.IO clients held {args.hold:.0f}s, "
+          f"{len(uids) * 2} scans from {args.concurrency} concurrent terminals")
+    for mode in ("threading", "eventlet"):
+        with connect(args, BENCH_DB) as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM opti_rec WHERE time_in >= CURDATE()")
+            cur.execute("DELETE FROM opti_daily_pay WHERE work_date >= CURDATE()")
+            conn.commit()
+        port = _free_port()
+        env = _app_env(args, OPTI_ASYNC_MODE=mode)
+        server = subprocess.Popen([sys.executable, "-c", SERVE_APP, args.app, str(port)], env=env,
+                                  stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_for_http(port):
+                print(f"  {mode:<10} server did not start")
+                continue
+            idle = subprocess.Popen([sys.executable, "-c", IDLE_CLIENTS, str(port), str(args.clients),
+                                     str(args.hold)], stdout=subprocess.PIPE, text=True)
+            time.sleep(min(args.hold / 3, 10))    # let the idle clients pile up first
+            latencies, errors = [], 0
+            started = time.perf_counter()
+            with concurrent.futures.ThreadPoolExecutor(args.concurrency) as executor:
+                # every uid twice: a time_in round, then a time_out round
+                for future in [executor.submit(_scan, port, uid) for uid in uids + uids]:
+                    try:
+                        latencies.append(future.result())
+                    except OSError:
+                        errors += 1
+            seconds = time.perf_counter() - started
+            clients = json.loads(idle.communicate()[0] or "{}")
+        finally:
+            server.terminate()
+            server.wait()
+        print(f"  {mode:<10} clients {clients.get('connected', 0):>6} connected "
+              f"{clients.get('alive', 0):>6} alive  scans {len(latencies) / seconds:>8,.0f}/s  "
+              f"p50 {_percentile(latencies, 50):>7.1f} ms  p99 {_percentile(latencies, 99):>7.1f} ms  "
+              f"errors {errors}")
+
+
+# -----------------------------
+# Shift-start Scan Storm
+# -----------------------------
+def _db_statements(args):
+    # server-wide statement counter; the SHOW itself counts as one
+    with connect(args) as conn, conn.cursor() as cur:
+        cur.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+        return int(cur.fetchone()["Value"])
+
+
+def _run_phase(args, name, requests):
+    """requests: callables each doing one HTTP request. Runs them over
+    --concurrency terminals and prints throughput, latency and DB statements."""
+    def timed(request):
+        started = time.perf_counter()
+        request()
+        return (time.perf_counter() - started) * 1000
+
+    before = _db_statements(args)
+    latencies, errors = [], 0
+    started = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(args.concurrency) as executor:
+        for future in [executor.submit(timed, r) for r in requests]:
+            try:
+                latencies.append(future.result())
+            except OSError:
+                errors += 1
+    seconds = time.perf_counter() - started
+    statements = _db_statements(args) - before - 1
+    print(f"  {name:<16} {len(requests):>6} req  {len(latencies) / seconds:>8,.0f} req/s  "
+          f"p50 {_percentile(latencies, 50):>7.1f}  p95 {_percentile(latencies, 95):>7.1f}  "
+          f"p99 {_percentile(latencies, 99):>7.1f} ms  db {statements / max(len(requests), 1):>6.1f} stmt/req  "
+          f"errors {errors}")
+
+
+def bench_storm(args):
+    seed(args).close()
+    uids = [f"RFID{i:08d}" for i in range(1, args.employees + 1)]
+    random.Random(7).shuffle(uids)
+
+    # The board is a pty; drain what the app writes (beeps / forwarded uids)
+    # and answer each line like a sketch would, exercising the reader too.
+    fake = FakeArduino()
+    arduino_lines = []
+
+    def board():
+        try:
+            while True:
+                line = fake.readline(timeout=3600)
+                if line is None:
+                    return
+                arduino_lines.append(line)
+                fake.send(f"ACK {line}")
+        except (OSError, ValueError):
+            return    # unplugged at the end of the run
+    threading.Thread(target=board, daemon=True).start()
+
+    port = _free_port()
+    base = f"http://127.0.0.1:{port}"
+    env = _app_env(args, OPTI_ARDUINO_PORT=fake.port)
+    server = subprocess.Popen([sys.executable, "-c", SERVE_APP, args.app, str(port)], env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        if not _wait_for_http(port):
+            print("app did not start")
+            return
+        time.sleep(2.5)    # SerialLink lets the "board" settle after opening the port
+        admin = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+        admin.open(f"{base}/log_in_admin",
+                   urllib.parse.urlencode({"username": "admin", "password": "admin123"}).encode()).read()
+
+        def get(opener, path):
+            return lambda: opener.open(base + path, timeout=60).read()
+
+        print(f"{args.app}: {args.employees} employees, {args.history_days} days of history, "
+              f"{args.concurrency} concurrent terminals")
+        # a time_in for everyone, then a time_out for everyone
+        _run_phase(args, "scan (time in)", [lambda uid=uid: _scan(port, uid) for uid in uids])
+        _run_phase(args, "scan (time out)", [lambda uid=uid: _scan(port, uid) for uid in uids])
+        _run_phase(args, "admin_dashboard", [get(admin, "/admin_dashboard")] * args.requests)
+        _run_phase(args, "export_excel", [get(admin, "/export_excel")] * args.requests)
+        if args.app == "opti_test":
+            # monthly_payroll renders monthly_payroll.html, which the repo does
+            # not ship; the JSON route runs the same payroll query
+            _run_phase(args, "monthly_payroll", [get(admin, "/api/monthly_payroll")] * args.requests)
+        print(f"  arduino: {len(arduino_lines)} lines received by the fake board")
+    finally:
+        server.terminate()
+        server.wait()
+        fake.unplug()
+
+
+# -----------------------------
+# Throwaway Server
+# -----------------------------
+class TemporaryMySQL:
+    """mysqld / mariadbd on a temporary datadir, root password set to
+    --password, removed again on exit."""
+
+    def __init__(self, args):
+        self.args = args
+        self.process = None
+        self.datadir = None
+
+    def __enter__(self):
+        binary = shutil.which("mariadbd") or shutil.which("mysqld")
+        if binary is None:
+            raise SystemExit("--spawn-mysqld needs mariadbd or mysqld on PATH")
+        self.datadir = tempfile.mkdtemp(prefix="opti_bench_")
+        sock = os.path.join(self.datadir, "mysqld.sock")
+        user = ["--user=root"] if hasattr(os, "geteuid") and os.geteuid() == 0 else []
+        installer = shutil.which("mariadb-install-db") or shutil.which("mysql_install_db")
+        if "mariadb" in os.path.basename(binary) and installer:
+            init = [installer, f"--datadir={self.datadir}", "--auth-root-authentication-method=normal", *user]
+        else:
+            init = [binary, "--initialize-insecure", f"--datadir={self.datadir}", *user]
+        subprocess.run(init, check=True, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        self.process = subprocess.Popen(
+            [binary, f"--datadir={self.datadir}", f"--socket={sock}", f"--port={self.args.port}",
+             "--bind-address=127.0.0.1", *user],
+            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.monotonic() + 60
+        while True:
+            try:
+                conn = pymysql.connect(unix_socket=sock, user="root")
+                break
+            except pymysql.MySQLError:
+                if time.monotonic() > deadline or self.process.poll() is not None:
+                    self.__exit__()
+                    raise SystemExit("temporary MySQL server did not start")
+                time.sleep(0.5)
+        with conn.cursor() as cur:
+            cur.execute("ALTER USER 'root'@'localhost' IDENTIFIED BY %s", (self.args.password,))
+            cur.execute("CREATE USER IF NOT EXISTS 'root'@'127.0.0.1' IDENTIFIED BY %s", (self.args.password,))
+            cur.execute("GRANT ALL PRIVILEGES ON *.* TO 'root'@'127.0.0.1' WITH GRANT OPTION")
+        conn.close()
+        print(f"temporary {os.path.basename(binary)} on port {self.args.port}")
+        return self
+
+    def __exit__(self, *exc):
+        if self.process is not None:
+            self.process.terminate()
+            self.process.wait()
+        if self.datadir is not None:
+            shutil.rmtree(self.datadir, ignore_errors=True)
+
+
+# -----------------------------
+# Scan Cooldown
+# -----------------------------
+def legacy_cooldown_hit(last_scan_time, uid, cooldown_seconds):
+    # what opti_test.py did: a module-level dict that only ever grows
+    now = time.monotonic()
+    if uid in last_scan_time and now - last_scan_time[uid] < cooldown_seconds:
+        return True
+    last_scan_time[uid] = now
+    return False
+
+
+def _cooldown_uids(count, seed):
+    # mostly known cards, plus a tail of one-off reader noise
+    rng = random.Random(seed)
+    return [f"RFID{rng.randrange(2000):08d}" if rng.random() < 0.8 else f"NOISE{rng.getrandbits(40):x}"
+            for _ in range(count)]
+
+
+def _cooldown_worker(address, uids, start, results):
+    store = SharedCooldown(1, address=address)
+    store.hit("warmup")
+    latencies = []
+    start.wait()
+    started = time.perf_counter()
+    for uid in uids:
+        t = time.perf_counter()
+        store.hit(uid)
+        latencies.append(time.perf_counter() - t)
+    elapsed = time.perf_counter() - started
+    results.put((elapsed, _percentile(latencies, 50) * 1e6, _percentile(latencies, 99) * 1e6,
+                 store.stats()["fallbacks"]))
+    store.close()
+
+
+def _cooldown_race(address, uids, start, results):
+    store = SharedCooldown(3600, address=address)
+    store.hit("warmup")
+    start.wait()
+    results.put(sum(not store.hit(uid) for uid in uids))
+    store.close()
+
+
+def bench_cooldown(args):
+    uids = _cooldown_uids(args.lookups, 11)
+    print(f"{args.lookups} cooldown lookups, ~{sum(u.startswith('NOISE') for u in uids)} distinct noise uids")
+
+    last_scan_time = {}
+    started = time.perf_counter()
+    for uid in uids:
+        legacy_cooldown_hit(last_scan_time, uid, 1)
+    seconds = time.perf_counter() - started
+    print(f"  {'dict (legacy)':<28} {len(uids) / seconds:>12,.0f} lookups/s  entries {len(last_scan_time):>8}")
+
+    store = CooldownStore(1, capacity=10000)
+    now = 0.0
+    started = time.perf_counter()
+    for uid in uids:
+        now += 0.001    # a tap per millisecond of simulated time, so entries expire
+        store.hit(uid, now)
+    seconds = time.perf_counter() - started
+    print(f"  {'CooldownStore (local)':<28} {len(uids) / seconds:>12,.0f} lookups/s  entries {len(store):>8}")
+
+    address = ("127.0.0.1", _free_port())
+    owner = SharedCooldown(1, address=address)
+    owner.hit("warmup")    # binds the port: this process owns the store
+    workers = max(1, args.workers)
+    share = len(uids) // workers
+    results = multiprocessing.Queue()
+    start = multiprocessing.Event()
+    procs = [multiprocessing.Process(target=_cooldown_worker,
+                                     args=(address, uids[i * share:(i + 1) * share], start, results))
+             for i in range(workers)]
+    for proc in procs:
+        proc.start()
+    time.sleep(1)
+    start.set()
+    runs = [results.get() for _ in procs]
+    for proc in procs:
+        proc.join()
+    wall = max(r[0] for r in runs)
+    print(f"  {f'SharedCooldown x{workers} procs':<28} {share * workers / wall:>12,.0f} lookups/s  "
+          f"entries {owner.stats()['entries']:>8}  p50 {max(r[1] for r in runs):.0f}us  "
+          f"p99 {max(r[2] for r in runs):.0f}us  fallbacks {sum(r[3] for r in runs)}")
+    owner.close()
+
+    # every process taps the same cards at once: each card must be accepted
+    # exactly once across all of them
+    address = ("127.0.0.1", _free_port())
+    owner = SharedCooldown(3600, address=address)
+    owner.hit("warmup")
+    cards = [f"RFID{i:08d}" for i in range(500)]
+    start = multiprocessing.Event()
+    procs = [multiprocessing.Process(target=_cooldown_race, args=(address, cards, start, results))
+             for _ in range(workers)]
+    for proc in procs:
+        proc.start()
+    time.sleep(1)
+    start.set()
+    accepted = sum(results.get() for _ in procs)
+    for proc in procs:
+        proc.join()
+    owner.close()
+    print(f"  consistency: {len(cards)} cards tapped by {workers} processes -> {accepted} accepted "
+          f"({'ok' if accepted == len(cards) else 'MISMATCH'})")
+
+
+# -----------------------------
+# Multi-process Scaling
+# -----------------------------
+def _load_process(port, uids, threads, results):
+    latencies, errors = [], 0
+    with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+        for future in [executor.submit(_scan, port, uid) for uid in uids]:
+            try:
+                latencies.append(future.result())
+            except OSError:
+                errors += 1
+    results.put((latencies, errors))
+
+
+def _scan_load(port, uids, concurrency):
+    """Scans spread over several client processes, so the load generator
+    isn't the bottleneck once the server runs on several cores."""
+    processes = max(1, min(8, (os.cpu_count() or 2) // 2, concurrency))
+    results = multiprocessing.Queue()
+    procs = [multiprocessing.Process(target=_load_process,
+                                     args=(port, uids[i::processes], max(1, concurrency // processes), results))
+             for i in range(processes)]
+    started = time.perf_counter()
+    for proc in procs:
+        proc.start()
+    runs = [results.get() for _ in procs]
+    seconds = time.perf_counter() - started
+    for proc in procs:
+        proc.join()
+    latencies = [ms for run, _ in runs for ms in run]
+    return len(latencies) / seconds, latencies, sum(errors for _, errors in runs)
+
+
+def bench_workers(args):
+    seed(args).close()
+    uids = [f"RFID{i:08d}" for i in range(1, args.employees + 1)]
+    random.Random(7).shuffle(uids)
+    fake = FakeArduino()
+
+    def board():
+        try:
+            while fake.readline(timeout=3600) is not None:
+                pass
+        except (OSError, ValueError):
+            return
+    threading.Thread(target=board, daemon=True).start()
+
+    counts, n = [], 1
+    while n < args.workers:
+        counts.append(n)
+        n *= 2
+    counts.append(args.workers)
+    print(f"{args.app}: {len(uids) * 2} scans from {args.concurrency} terminals, "
+          f"{len(counts)} runs of opti_workers.py ({os.cpu_count()} cpus)")
+    base = None
+    for workers in counts:
+        with connect(args, BENCH_DB) as conn, conn.cursor() as cur:
+            cur.execute("DELETE FROM opti_rec WHERE time_in >= CURDATE()")
+            conn.commit()
+        port = _free_port()
+        env = _app_env(args, OPTI_ARDUINO_PORT=fake.port)
+        launcher = subprocess.Popen([sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                                                  "opti_workers.py"),
+                                     args.app, "--workers", str(workers), "--port", str(port),
+                                     "--relay", f"tcp://127.0.0.1:{_free_port()}"],
+                                    env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            if not _wait_for_http(port):
+                print(f"  {workers:>2} workers  did not start")
+                continue
+            time.sleep(2.5)    # every worker up, the owner's serial port settled
+            # a time_in round, then a time_out round
+            rate_in, latencies, errors = _scan_load(port, uids, args.concurrency)
+            rate_out, more, more_errors = _scan_load(port, uids, args.concurrency)
+        finally:
+            launcher.terminate()
+            launcher.wait()
+        rate = (rate_in + rate_out) / 2
+        base = base or rate
+        latencies += more
+        print(f"  {workers:>2} workers  scans {rate:>8,.0f}/s  x{rate / base:>4.2f}  "
+              f"p50 {_percentile(latencies, 50):>7.1f} ms  p99 {_percentile(latencies, 99):>7.1f} ms  "
+              f"errors {errors + more_errors}")
+    fake.unplug()
+
+
+# -----------------------------
+# Start-up Time
+# -----------------------------
+def _poll(port, path, deadline, started):
+    # ms from `started` until `path` answers 200, None if it never does
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}{path}", timeout=1).read()
+            return (time.monotonic() - started) * 1000
+        except OSError:
+            time.sleep(0.01)
+    return None
+
+
+def _ms(value):
+    return f"{value:>8.0f} ms" if value is not None else f"{'never':>11}"
+
+
+def bench_startup(args):
+    seed(args).close()
+    # accepts connections but never sends the MySQL greeting: a hung server
+    hung = socket.socket()
+    hung.bind(("127.0.0.1", 0))
+    hung.listen(64)
+    scenarios = [
+        ("mysql up", {}),
+        ("mysql hung", {"OPTI_DB_HOST": "127.0.0.1", "OPTI_DB_PORT": str(hung.getsockname()[1])}),
+    ]
+    print(f"{args.app}: ms from process start (no Arduino attached), median of {args.runs} runs")
+    for name, overrides in scenarios:
+        runs = []
+        for _ in range(args.runs):
+            port = _free_port()
+            env = _app_env(args, OPTI_ARDUINO_PORT=os.path.join(tempfile.gettempdir(), "opti-no-arduino"),
+                           **overrides)
+            started = time.monotonic()
+            server = subprocess.Popen([sys.executable, "-c", SERVE_APP, args.app, str(port)], env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                deadline = started + 30
+                first = _poll(port, "/healthz", deadline, started)
+                login = _poll(port, "/", deadline, started)
+                ready = _poll(port, "/readyz", min(deadline, time.monotonic() + 10), started)
+                try:
+                    scan = _scan(port, "RFID00000001") if ready is not None else None
+                except OSError:
+                    scan = None
+            finally:
+                server.terminate()
+                server.wait()
+            runs.append((first, login, ready, scan))
+        columns = [sorted(r[i] for r in runs if r[i] is not None) for i in range(4)]
+        first, login, ready, scan = [c[len(c) // 2] if len(c) * 2 > args.runs else None for c in columns]
+        print(f"  {name:<12} first response {_ms(first)}  login page {_ms(login)}  ready {_ms(ready)}  "
+              f"first scan latency {_ms(scan)}")
+    hung.close()
+
+
+BENCHMARKS = {
+    "async": bench_async,
+    "cooldown": bench_cooldown,
+    "delete": bench_delete,
+    "export": bench_export,
+    "payroll": bench_payroll,
+    "startup": bench_startup,
+    "storm": bench_storm,
+    "workers": bench_workers,
+}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS))
+    parser.add_argument("--host", default="localhost")
+    parser.add_argument("--port", type=int, default=3306)
+    parser.add_argument("--user", default="root")
+    parser.add_argument("--password", default="saquilon")
+    parser.add_argument("--employees", type=int, default=2000)
+    parser.add_argument("--history-days", type=int, default=30)
+    parser.add_argument("--victim", type=int, default=3, help="employee id deleted by the delete benchmark")
+    parser.add_argument("--app", default="opti_staff", choices=["opti_staff", "opti_test"],
+                        help="app module the async and storm benchmarks serve")
+    parser.add_argument("--clients", type=int, default=1000, help="idle Socket.IO clients (async)")
+    parser.add_argument("--hold", type=float, default=30, help="seconds the idle clients stay connected (async)")
+    parser.add_argument("--concurrency", type=int, default=50, help="concurrent terminals (async, storm)")
+    parser.add_argument("--requests", type=int, default=200,
+                        help="requests per read endpoint (storm)")
+    parser.add_argument("--lookups", type=int, default=200000, help="cooldown lookups (cooldown)")
+    parser.add_argument("--workers", type=int, default=4, help="worker processes (cooldown: sharing the store; workers: largest run)")
+    parser.add_argument("--runs", type=int, default=5, help="app starts per scenario (startup)")
+    parser.add_argument("--spawn-mysqld", action="store_true",
+                        help="run against a throwaway mysqld / mariadbd instead of a running server")
+    args = parser.parse_args(argv)
+    if args.spawn_mysqld:
+        with TemporaryMySQL(args):
+            BENCHMARKS[args.benchmark](args)
+    else:
+        BENCHMARKS[args.benchmark](args)
+
+
+if __name__ == "__main__":
+    main()
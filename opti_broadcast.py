@@ -0,0 +1,182 @@
+import collections
+import threading
+
+from flask import request
+from flask_socketio import join_room, leave_room
+
+from opti_serial import LineBatcher
+
+# -----------------------------
+# Attendance Broadcasting
+# -----------------------------
+# Scans publish() their update instead of emitting it. Updates are buffered
+# for `interval` seconds and sent as one "attendance_batch" frame per room:
+#
+#   all            every update
+#   employee:<id>  that employee's updates only
+#
+# Every update gets a global, increasing seq and each frame carries the last
+# seq it covers, so a client that reconnects sends subscribe(since=last seq)
+# and gets back only what it missed from the in-memory history (or
+# {"reset": true} when the gap is older than the history and it must reload).
+#
+# With several worker processes (opti_workers.py) attach() sends publish()
+# through the relay's "attendance" channel instead: the relay hands out the
+# seq, every worker keeps the same history and emits the frames to its own
+# clients only, so a client may reconnect to any worker with its last seq.
+# While the relay is unreachable a worker falls back to the local path (its
+# own next seq, frames and legacy emit), so scans keep reaching the clients
+# connected to it; the seq gap when the relay is back resets their history.
+#
+# Client events:
+#   subscribe   {"rooms": ["all" | "employee:<id>", ...], "since": <seq>}
+#   unsubscribe {"rooms": [...]}
+#
+# Clients that never send subscribe (the mobile app, anything written against
+# the original API) keep getting one `legacy_event` ("attendance_update",
+# {"name", "status", ...}) per scan, as soon as it is published: they sit in
+# LEGACY_ROOM from connect until their first subscribe. legacy_event=None
+# turns that off.
+
+ALL_ROOM = "all"
+LEGACY_ROOM = "legacy"
+
+
+def employee_room(id_employee):
+    return f"employee:{id_employee}"
+
+
+def _valid_room(room):
+    if room == ALL_ROOM:
+        return True
+    prefix, _, value = str(room).partition(":")
+    return prefix == "employee" and value.isdigit()
+
+
+class AttendanceBroadcaster:
+    def __init__(self, socketio, event="attendance_batch", interval=0.25, max_batch=500, history=5000,
+                 legacy_event="attendance_update"):
+        self._socketio = socketio
+        self.event = event
+        self.legacy_event = legacy_event
+        self._lock = threading.Lock()
+        self._seq = 0
+        self._history = collections.deque(maxlen=history)
+        self._batcher = LineBatcher(self._flush, interval=interval, max_batch=max_batch,
+                                    name="attendance-broadcast")
+        # stats
+        self.published = 0
+        self.frames = 0
+        self.legacy_emits = 0
+        self._relay = None
+        self._emit_options = {}
+        if legacy_event is not None:
+            socketio.on_event("connect", self._on_connect)
+        socketio.on_event("subscribe", self._on_subscribe)
+        socketio.on_event("unsubscribe", self._on_unsubscribe)
+
+    @property
+    def seq(self):
+        return self._seq
+
+    def start(self):
+        self._batcher.start()
+        return self
+
+    def attach(self, relay, channel="attendance"):
+        self._relay = relay
+        self._channel = channel
+        # every worker gets every event from the relay: emit to local clients
+        # only instead of fanning out once more through the client manager
+        self._emit_options = {"ignore_queue": True}
+        relay.subscribe(channel, self._apply)
+
+    def publish(self, id_employee, update):
+        if self._relay is not None:
+            if self._relay.publish(self._channel, {"id_employee": id_employee, **update}):
+                return None
+            # relay down: at least this worker's clients see the scan
+        with self._lock:
+            self._seq += 1
+            event = {"seq": self._seq, "id_employee": id_employee, **update}
+            self._history.append(event)
+            self.published += 1
+            self._batcher.add(event)
+        self._emit_legacy(update)
+        return event["seq"]
+
+    def _apply(self, seq, update, origin):
+        with self._lock:
+            if seq != self._seq + 1:
+                # missed some (joined late / relay reconnect): older history
+                # can't be replayed correctly any more
+                self._history.clear()
+            self._seq = seq
+            event = {"seq": seq, **update}
+            self._history.append(event)
+            self.published += 1
+            self._batcher.add(event)
+        self._emit_legacy({k: v for k, v in update.items() if k != "id_employee"})
+
+    def _emit_legacy(self, update):
+        if self.legacy_event is None:
+            return
+        self.legacy_emits += 1
+        self._socketio.emit(self.legacy_event, update, to=LEGACY_ROOM, **self._emit_options)
+
+    def _flush(self, events):
+        by_room = collections.defaultdict(list)
+        for event in events:
+            by_room[employee_room(event["id_employee"])].append(event)
+        self._emit(ALL_ROOM, events)
+        for room, room_events in by_room.items():
+            self._emit(room, room_events)
+
+    def _emit(self, room, events, to=None):
+        self.frames += 1
+        self._socketio.emit(self.event, {"room": room, "seq": events[-1]["seq"], "events": events},
+                            to=to or room, **self._emit_options)
+
+    def missed(self, room, since):
+        """Events for `room` after seq `since`, or None if history no longer
+        reaches back that far."""
+        with self._lock:
+            history = list(self._history)
+            seq = self._seq
+        if since > seq or (history and since < history[0]["seq"] - 1):
+            # ahead of us (the server restarted) or older than the history
+            return None
+        wanted = None if room == ALL_ROOM else room
+        return [e for e in history
+                if e["seq"] > since and (wanted is None or employee_room(e["id_employee"]) == wanted)]
+
+    # -- Socket.IO handlers --------------------------------------------------
+    def _on_connect(self, auth=None):
+        join_room(LEGACY_ROOM)
+
+    def _on_subscribe(self, data=None):
+        data = data or {}
+        leave_room(LEGACY_ROOM)
+        rooms = [r for r in data.get("rooms", [ALL_ROOM]) if _valid_room(r)]
+        since = data.get("since")
+        for room in rooms:
+            join_room(room)
+            if not isinstance(since, int):
+                continue
+            events = self.missed(room, since)
+            if events is None:
+                self._socketio.emit(self.event, {"room": room, "seq": self._seq, "reset": True, "events": []},
+                                    to=request.sid, **self._emit_options)
+            elif events:
+                self._emit(room, events, to=request.sid)
+        return {"rooms": rooms, "seq": self._seq}
+
+    def _on_unsubscribe(self, data=None):
+        rooms = [r for r in (data or {}).get("rooms", []) if _valid_room(r)]
+        for room in rooms:
+            leave_room(room)
+        return {"rooms": rooms}
+
+    def stats(self):
+        return {"seq": self._seq, "published": self.published, "frames": self.frames,
+                "legacy_emits": self.legacy_emits, "history": len(self._history)}
@@ -0,0 +1,402 @@
+import heapq
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from datetime import datetime, timedelta, time as dt_time
+
+# -----------------------------
+# In-process Caches
+# -----------------------------
+
+
+class RfidIndex:
+    """RFID uid -> employee row, loaded once from `opti`.
+
+    Known cards resolve without a database round trip. A uid missing from
+    the index is re-checked against MySQL once (another admin or process may
+    have just added it) and then remembered as unknown for `negative_ttl`
+    seconds, so a flood of bogus card reads costs one query per uid per TTL.
+    """
+
+    def __init__(self, pool, negative_ttl=60, negative_max=10000):
+        self._pool = pool
+        self.negative_ttl = negative_ttl
+        self.negative_max = negative_max
+        self._by_rfid = None
+        self._misses = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _load(self):
+        with self._lock:
+            if self._by_rfid is None:
+                with self._pool.connection() as conn, conn.cursor() as cur:
+                    cur.execute("SELECT * FROM opti WHERE rfid IS NOT NULL")
+                    self._by_rfid = {row["rfid"]: row for row in cur.fetchall()}
+                self._misses.clear()
+            return self._by_rfid
+
+    def warm(self):
+        self._load()
+
+    def lookup(self, uid):
+        if not uid:
+            return None
+        by_rfid = self._by_rfid if self._by_rfid is not None else self._load()
+        employee = by_rfid.get(uid)
+        if employee is not None:
+            return employee
+        if self._is_known_miss(uid):
+            return None
+
+        with self._pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT * FROM opti WHERE rfid=%s", (uid,))
+            employee = cur.fetchone()
+        if employee:
+            self.put(employee)
+        else:
+            self._remember_miss(uid)
+        return employee
+
+    def _is_known_miss(self, uid):
+        with self._lock:
+            expires = self._misses.get(uid)
+            if expires is None:
+                return False
+            if expires > time.monotonic():
+                return True
+            del self._misses[uid]
+            return False
+
+    def _remember_miss(self, uid):
+        with self._lock:
+            self._misses[uid] = time.monotonic() + self.negative_ttl
+            self._misses.move_to_end(uid)
+            while len(self._misses) > self.negative_max:
+                self._misses.popitem(last=False)
+
+    def put(self, employee):
+        """Patch in a newly added employee (add_employee / api_add_employee)."""
+        rfid = employee.get("rfid")
+        if not rfid:
+            return
+        with self._lock:
+            self._misses.pop(rfid, None)
+            if self._by_rfid is not None:
+                by_rfid = dict(self._by_rfid)
+                by_rfid[rfid] = employee
+                self._by_rfid = by_rfid
+
+    def discard(self, id_employee):
+        """Forget a deleted employee (drop routes with stable ids)."""
+        with self._lock:
+            if self._by_rfid is not None:
+                self._by_rfid = {rfid: emp for rfid, emp in self._by_rfid.items()
+                                 if emp["id_employee"] != id_employee}
+
+    def invalidate(self):
+        """Drop everything; the next lookup reloads from `opti`."""
+        with self._lock:
+            self._by_rfid = None
+            self._misses.clear()
+
+
+class ShiftState:
+    """Today's attendance state per employee, so /api/scan can decide
+    time_in / time_out / already_done without re-reading opti_rec.
+
+    get() returns None (not in yet) or {"id", "time_in", "time_out"} where
+    time_out is None while the shift is open. The table is rebuilt from
+    opti_rec on first use after start-up and whenever the calendar day
+    changes, and is patched by opened()/closed() after each committed write.
+    Hold lock_for(id_employee) across get -> write -> opened/closed so two
+    taps of the same card cannot both insert a time_in.
+
+    before_rebuild, if set, runs before opti_rec is re-read (the write-behind
+    writer uses it to drain queued mutations first). mark_stale() flags one
+    employee whose row another worker process wrote; the next get() for them
+    re-reads just that row.
+    """
+
+    LOCK_STRIPES = 64
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._day = None
+        self._records = {}
+        self._stale = set()
+        self._lock = threading.Lock()
+        self._stripes = [threading.Lock() for _ in range(self.LOCK_STRIPES)]
+        self.before_rebuild = None
+
+    def lock_for(self, id_employee):
+        return self._stripes[hash(id_employee) % self.LOCK_STRIPES]
+
+    @contextmanager
+    def lock_all_for(self, ids):
+        # lock_for() of every id, taken in stripe order so two batches can't
+        # deadlock; a live scan only ever holds one stripe
+        with ExitStack() as stack:
+            for stripe in sorted({hash(i) % self.LOCK_STRIPES for i in ids}):
+                stack.enter_context(self._stripes[stripe])
+            yield
+
+    def _rebuild(self, day):
+        if self.before_rebuild is not None:
+            self.before_rebuild()
+        start = datetime.combine(day, dt_time.min)
+        with self._pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, id_employee, time_in, time_out FROM opti_rec
+                WHERE time_in >= %s AND time_in < %s
+                ORDER BY id ASC
+            """, (start, start + timedelta(days=1)))
+            records = {}
+            for row in cur.fetchall():
+                records.setdefault(row["id_employee"], {
+                    "id": row["id"], "time_in": row["time_in"], "time_out": row["time_out"]
+                })
+        self._records = records
+        self._stale = set()
+        self._day = day
+
+    def _today(self, now):
+        day = now.date()
+        if self._day != day:
+            with self._lock:
+                if self._day != day:
+                    self._rebuild(day)
+        return self._records
+
+    def warm(self):
+        self._today(datetime.now())
+
+    def get(self, id_employee, now):
+        records = self._today(now)
+        if id_employee in self._stale:
+            self._reload(records, id_employee, now.date())
+        return records.get(id_employee)
+
+    def _reload(self, records, id_employee, day):
+        # caller holds lock_for(id_employee)
+        self._stale.discard(id_employee)
+        start = datetime.combine(day, dt_time.min)
+        with self._pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("""
+                SELECT id, time_in, time_out FROM opti_rec
+                WHERE id_employee = %s AND time_in >= %s AND time_in < %s
+                ORDER BY id ASC LIMIT 1
+            """, (id_employee, start, start + timedelta(days=1)))
+            row = cur.fetchone()
+        if row is None:
+            records.pop(id_employee, None)
+        else:
+            records[id_employee] = row
+
+    def mark_stale(self, id_employee):
+        self._stale.add(id_employee)
+
+    def opened(self, id_employee, record_id, time_in):
+        self._today(time_in)[id_employee] = {"id": record_id, "time_in": time_in, "time_out": None}
+
+    def closed(self, id_employee, time_out):
+        record = self._today(time_out).get(id_employee)
+        if record is not None:
+            record["time_out"] = time_out
+
+    def forget(self, id_employee):
+        self._records.pop(id_employee, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._day = None
+            self._records = {}
+
+
+class IdAllocator:
+    """Hands out the smallest unused id_employee.
+
+    Seeded once from `opti`: every gap goes into a min-heap and `_next` is one
+    past the highest id, so allocate() and release() are O(log n) under a
+    lock instead of a full id scan per insert. MySQL's primary key stays the
+    final arbiter; callers retry with a fresh id on a duplicate-key error.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._free = None
+        self._free_set = set()
+        self._next = 1
+        self._lock = threading.Lock()
+
+    def _seed(self):
+        with self._pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT id_employee FROM opti ORDER BY id_employee ASC")
+            ids = [row["id_employee"] for row in cur.fetchall()]
+        free, expected = [], 1
+        for eid in ids:
+            free.extend(range(expected, eid))
+            expected = eid + 1
+        heapq.heapify(free)
+        self._free = free
+        self._free_set = set(free)
+        self._next = expected
+
+    def allocate(self):
+        with self._lock:
+            if self._free is None:
+                self._seed()
+            if self._free:
+                eid = heapq.heappop(self._free)
+                self._free_set.discard(eid)
+                return eid
+            eid = self._next
+            self._next += 1
+            return eid
+
+    def release(self, eid):
+        """Return an id after its employee row was deleted (or never inserted)."""
+        with self._lock:
+            if self._free is None or eid >= self._next or eid in self._free_set:
+                return
+            heapq.heappush(self._free, eid)
+            self._free_set.add(eid)
+
+    def invalidate(self):
+        with self._lock:
+            self._free = None
+            self._free_set = set()
+
+
+class DailySummary:
+    """Dashboard counters for today: headcount, records present, salary.
+
+    Maintained incrementally by the scan and employee routes so
+    admin_dashboard reads them in O(1). Rebuilt from MySQL on first use and
+    at the day rollover; reconcile() recomputes them from opti / opti_rec,
+    swaps in the fresh values and reports any drift.
+
+    Writers hold recording() from before their commit (or write-behind
+    submit) until after the matching time_in() / time_out() /
+    employee_added() bump. A recount waits for the writes in flight and
+    holds new ones back, so it sees each row together with its bump or
+    neither, and never counts a row twice.
+    """
+
+    def __init__(self, pool):
+        self._pool = pool
+        self._day = None
+        self._counters = {}
+        self._lock = threading.Lock()
+        self._gate = threading.Condition(threading.Lock())
+        self._writers = 0
+        self._recounting = False
+        self.before_rebuild = None
+        self.last_drift = {}
+        self.last_reconciled = None
+
+    def _compute(self, day):
+        if self.before_rebuild is not None:
+            self.before_rebuild()
+        start = datetime.combine(day, dt_time.min)
+        with self._pool.connection() as conn, conn.cursor() as cur:
+            cur.execute("SELECT COUNT(*) AS total FROM opti")
+            total = cur.fetchone()["total"]
+            cur.execute("""
+                SELECT COUNT(*) AS present, IFNULL(SUM(salary),0) AS total_salary
+                FROM opti_rec WHERE time_in >= %s AND time_in < %s
+            """, (start, start + timedelta(days=1)))
+            row = cur.fetchone()
+        return {"total_employees": total, "present": row["present"], "total_salary": row["total_salary"]}
+
+    def _today(self, now=None):
+        # caller holds _exclusive() and self._lock
+        day = (now or datetime.now()).date()
+        if self._day != day:
+            self._counters = self._compute(day)
+            self._day = day
+        return self._counters
+
+    @contextmanager
+    def recording(self):
+        with self._gate:
+            self._gate.wait_for(lambda: not self._recounting)
+            self._writers += 1
+        try:
+            yield
+        finally:
+            with self._gate:
+                self._writers -= 1
+                self._gate.notify_all()
+
+    @contextmanager
+    def _exclusive(self):
+        # no recording() in flight while MySQL is recounted; taken before
+        # self._lock, which the bumps need
+        with self._gate:
+            self._gate.wait_for(lambda: not self._recounting)
+            self._recounting = True
+            self._gate.wait_for(lambda: self._writers == 0)
+        try:
+            yield
+        finally:
+            with self._gate:
+                self._recounting = False
+                self._gate.notify_all()
+
+    def snapshot(self):
+        with self._lock:
+            if self._day == datetime.now().date():
+                return dict(self._counters)
+        with self._exclusive(), self._lock:
+            return dict(self._today())
+
+    # Only counters that are loaded for that day are bumped: if they aren't
+    # (start-up, day rollover, invalidate()) the next snapshot recounts from
+    # MySQL, which already includes this write. Call inside recording().
+    def time_in(self, now):
+        with self._lock:
+            if self._day == now.date():
+                self._counters["present"] += 1
+
+    def time_out(self, now, salary):
+        with self._lock:
+            if self._day == now.date():
+                self._counters["total_salary"] += salary
+
+    def employee_added(self):
+        with self._lock:
+            if self._day is not None:
+                self._counters["total_employees"] += 1
+
+    def invalidate(self):
+        with self._lock:
+            self._day = None
+
+    def reconcile(self):
+        """Rebuild from MySQL; returns {counter: (cached, actual)} for mismatches."""
+        with self._exclusive(), self._lock:
+            day = datetime.now().date()
+            fresh = self._compute(day)
+            drift = {}
+            if self._day == day:
+                drift = {k: (self._counters[k], v) for k, v in fresh.items() if self._counters.get(k) != v}
+            self._counters, self._day = fresh, day
+            self.last_drift = drift
+            self.last_reconciled = datetime.now()
+        return drift
+
+    def start_reconciler(self, interval):
+        def loop():
+            while True:
+                time.sleep(interval)
+                try:
+                    drift = self.reconcile()
+                    if drift:
+                        print(f"daily summary drift corrected: {drift}")
+                except Exception as e:
+                    print(f"daily summary reconcile failed: {e}")
+
+        thread = threading.Thread(target=loop, name="summary-reconciler", daemon=True)
+        thread.start()
+        return thread
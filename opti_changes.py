@@ -0,0 +1,164 @@
+import collections
+import threading
+
+from opti_sql import day_range
+
+# -----------------------------
+# Dashboard Change Log
+# -----------------------------
+# Every write path records which employee row (opti) or which employee's
+# attendance row for today (opti_rec, one shift per employee per day) it
+# touched, under a monotonically increasing version. /api/changes?since=v
+# looks up the keys changed after v and returns their current rows; keys
+# that no longer exist come back as deleted. The dashboard patches its
+# tables from that instead of reloading the page.
+#
+# When the log cannot say what changed (history trimmed, a bulk recompute,
+# server restarted) the answer is {"reset": true} and the client reloads
+# once.
+#
+# With several worker processes (opti_workers.py) attach() also publishes
+# record() and reset() on the relay's "changes" channel: the relay numbers
+# them, every worker applies them in that order, and on_remote(table, key)
+# tells a worker about writes made by the others (table None: anything may
+# have changed) so it can drop what it cached. Relay message n becomes
+# version n << LOCAL_BITS on every worker, so a client may poll any of them.
+# record() never waits for the relay: it bumps the local version first (the
+# low bits) and publishes fire-and-forget, so the writer's own next
+# /api/changes sees the change even while the relay is slow or down; once the
+# relay hands it back it is recorded again under the shared number.
+
+CHANGE_TABLES = ("employees", "attendance")
+LOCAL_BITS = 20
+
+
+class ChangeLog:
+    def __init__(self, history=10000):
+        self._lock = threading.Lock()
+        self._version = 0
+        self._reset_version = 0
+        self._trimmed_version = 0
+        self._relay_seq = 0
+        self._entries = collections.deque(maxlen=history)
+        self._relay = None
+        self.on_remote = None
+
+    @property
+    def version(self):
+        return self._version
+
+    def attach(self, relay, on_remote=None, channel="changes"):
+        self._relay = relay
+        self._channel = channel
+        self.on_remote = on_remote
+        relay.subscribe(channel, self._apply)
+
+    def record(self, table, key):
+        with self._lock:
+            self._version += 1
+            self._append(table, key)
+            version = self._version
+        if self._relay is not None:
+            self._relay.publish(self._channel, {"table": table, "key": key})
+        return version
+
+    def reset(self):
+        """Invalidate every client's view (they reload on their next sync)."""
+        with self._lock:
+            self._version += 1
+            self._reset_version = self._version
+            self._entries.clear()
+            version = self._version
+        if self._relay is not None:
+            self._relay.publish(self._channel, {"table": None, "key": None})
+        return version
+
+    def _append(self, table, key):
+        # caller holds self._lock
+        if len(self._entries) == self._entries.maxlen:
+            self._trimmed_version = self._entries[0][0]
+        self._entries.append((self._version, table, key))
+
+    def _apply(self, seq, change, origin):
+        table, key = change["table"], change["key"]
+        with self._lock:
+            gap = seq != self._relay_seq + 1
+            self._relay_seq = seq
+            self._version = max(seq << LOCAL_BITS, self._version + 1)
+            if gap or table is None:
+                # joined late / reconnected after missing some, or a reset
+                self._reset_version = self._version if table is None else self._version - 1
+                self._entries.clear()
+            if table is not None:
+                self._append(table, key)
+        if self.on_remote is not None:
+            if gap:
+                self.on_remote(None, None)
+            elif origin != self._relay.worker_id:
+                self.on_remote(table, key)
+
+    def since(self, version):
+        """(current_version, {table: set(keys)}) changed after `version`, or
+        (current_version, None) if the log no longer covers that far back."""
+        with self._lock:
+            current = self._version
+            if version > current and self._relay is not None and version >> LOCAL_BITS == current >> LOCAL_BITS:
+                # handed out by another worker ahead of us in local changes
+                version = current >> LOCAL_BITS << LOCAL_BITS
+            if version > current or version < self._reset_version:
+                return current, None
+            if version < self._trimmed_version:
+                return current, None
+            changed = {table: set() for table in CHANGE_TABLES}
+            for v, table, key in reversed(self._entries):
+                if v <= version:
+                    break
+                changed[table].add(key)
+        return current, changed
+
+
+def _in(column, keys):
+    return f"{column} IN ({','.join(['%s'] * len(keys))})"
+
+
+def changes_since(cursor, log, since, with_late_undertime=False):
+    """Delta for /api/changes: current rows for changed keys plus deleted keys."""
+    day_start, day_end = day_range()
+    version, changed = log.since(since)
+    result = {"version": version, "date": day_start.date().isoformat()}
+    if changed is None:
+        result["reset"] = True
+        return result
+
+    employees = []
+    keys = sorted(changed["employees"])
+    if keys:
+        cursor.execute(f"""
+            SELECT id_employee, name, email, number, rfid FROM opti
+            WHERE {_in("id_employee", keys)}
+            ORDER BY id_employee ASC
+        """, keys)
+        employees = cursor.fetchall()
+    found = {row["id_employee"] for row in employees}
+    result["employees"] = {"upserted": employees, "deleted": [k for k in keys if k not in found]}
+
+    attendance = []
+    keys = sorted(changed["attendance"])
+    if keys:
+        extra = ", opti_rec.late_minutes, opti_rec.undertime_minutes" if with_late_undertime else ""
+        cursor.execute(f"""
+            SELECT opti_rec.id_employee, opti.name, opti_rec.time_in, opti_rec.time_out,
+                   opti_rec.duration, opti_rec.salary{extra}
+            FROM opti_rec
+            JOIN opti ON opti_rec.id_employee = opti.id_employee
+            WHERE opti_rec.time_in >= %s AND opti_rec.time_in < %s
+              AND {_in("opti_rec.id_employee", keys)}
+            ORDER BY opti_rec.time_in DESC
+        """, (day_start, day_end, *keys))
+        for row in cursor.fetchall():
+            row["time_in"] = row["time_in"].strftime("%H:%M") if row["time_in"] else ""
+            row["time_out"] = row["time_out"].strftime("%H:%M") if row["time_out"] else ""
+            attendance.append(row)
+    found = {row["id_employee"] for row in attendance}
+    result["attendance"] = {"upserted": attendance, "deleted": [k for k in keys if k not in found]}
+    return result
@@ -0,0 +1,184 @@
+import os
+import socket
+import socketserver
+import threading
+import time
+from collections import OrderedDict
+
+# -----------------------------
+# Scan Cooldown
+# -----------------------------
+# Debounces repeat taps of the same card: hit(uid) is True (reject) when uid
+# was accepted less than `cooldown_seconds` ago, otherwise it records the tap
+# and returns False. The check and the update are one atomic step.
+#
+# CooldownStore keeps uid -> expiry in an OrderedDict in expiry order (every
+# entry has the same TTL, so re-inserting at the end keeps it sorted): each
+# hit pops the expired entries off the front, and `capacity` caps the map, so
+# memory stays fixed however many distinct uids (or reader noise) show up.
+#
+# SharedCooldown gives several worker processes on one host a single store:
+# the first process to bind `address` (127.0.0.1 TCP, so it works on Windows
+# too) serves its CooldownStore to the others over a tiny binary protocol
+#
+#   request   <len:1 byte> <uid:len bytes>
+#   response  1 byte: 1 = cooldown, 0 = accepted
+#
+# If the owner goes away the next hit reconnects, taking over the port if it
+# is free. While no owner is reachable at all, hits fall back to a local
+# store so scanning keeps working (per process) instead of failing.
+
+MAX_UID_BYTES = 255
+
+
+class CooldownStore:
+    def __init__(self, cooldown_seconds, capacity=10000):
+        self.cooldown_seconds = cooldown_seconds
+        self.capacity = capacity
+        self._expires = OrderedDict()
+        self._lock = threading.Lock()
+        # stats
+        self.hits = 0
+        self.rejected = 0
+        self.evicted = 0
+
+    def hit(self, uid, now=None):
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.hits += 1
+            expires = self._expires
+            while expires:
+                first, expiry = next(iter(expires.items()))
+                if expiry > now:
+                    break
+                del expires[first]
+            if uid in expires:
+                self.rejected += 1
+                return True
+            expires[uid] = now + self.cooldown_seconds
+            if len(expires) > self.capacity:
+                # still inside its window; only reachable with > capacity
+                # distinct uids per cooldown_seconds
+                expires.popitem(last=False)
+                self.evicted += 1
+            return False
+
+    def __len__(self):
+        return len(self._expires)
+
+    def stats(self):
+        return {"backend": "local", "entries": len(self._expires), "capacity": self.capacity,
+                "hits": self.hits, "rejected": self.rejected, "evicted": self.evicted}
+
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        sock = self.request
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        store = self.server.store
+        reader = sock.makefile("rb")
+        while True:
+            header = reader.read(1)
+            if not header:
+                return
+            uid = reader.read(header[0])
+            if len(uid) != header[0]:
+                return
+            sock.sendall(b"\x01" if store.hit(uid) else b"\x00")
+
+
+class _Server(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    # POSIX SO_REUSEADDR only skips TIME_WAIT (a new owner can take over right
+    # away) and still refuses a second listener; on Windows it would let a
+    # second worker bind the same port, so it stays off there
+    allow_reuse_address = os.name != "nt"
+
+
+class SharedCooldown:
+    def __init__(self, cooldown_seconds, capacity=10000, address=("127.0.0.1", 5098), timeout=0.5):
+        self.cooldown_seconds = cooldown_seconds
+        self.address = address
+        self.timeout = timeout
+        self._store = CooldownStore(cooldown_seconds, capacity)
+        self._server = None
+        self._sock = None
+        self._reader = None
+        self._lock = threading.Lock()
+        # stats
+        self.remote_hits = 0
+        self.fallbacks = 0
+        self.reconnects = 0
+
+    @property
+    def is_owner(self):
+        return self._server is not None
+
+    def _serve(self):
+        try:
+            server = _Server(self.address, _Handler)
+        except OSError:
+            return False
+        server.store = self._store
+        self._server = server
+        threading.Thread(target=server.serve_forever, name="cooldown-server", daemon=True).start()
+        print(f"[cooldown] serving shared scan cooldown on {self.address[0]}:{self.address[1]}")
+        return True
+
+    def _connect(self):
+        sock = socket.create_connection(self.address, timeout=self.timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self._sock, self._reader = sock, sock.makefile("rb")
+        self.reconnects += 1
+
+    def _disconnect(self):
+        if self._sock is not None:
+            try:
+                self._sock.close()
+            except OSError:
+                pass
+        self._sock = self._reader = None
+
+    def hit(self, uid):
+        data = str(uid).encode("utf-8")[:MAX_UID_BYTES]
+        if self._server is not None:
+            return self._store.hit(data)
+        with self._lock:
+            for _ in range(2):
+                try:
+                    if self._sock is None:
+                        if self._serve():
+                            break               # we own the store now
+                        self._connect()
+                    self._sock.sendall(bytes((len(data),)) + data)
+                    reply = self._reader.read(1)
+                    if not reply:
+                        raise ConnectionError("cooldown owner closed the connection")
+                    self.remote_hits += 1
+                    return reply == b"\x01"
+                except OSError:
+                    self._disconnect()
+            else:
+                self.fallbacks += 1
+        return self._store.hit(data)
+
+    def close(self):
+        with self._lock:
+            self._disconnect()
+            if self._server is not None:
+                self._server.shutdown()
+                self._server.server_close()
+                self._server = None
+
+    def stats(self):
+        return {**self._store.stats(), "backend": "socket", "owner": self.is_owner,
+                "address": f"{self.address[0]}:{self.address[1]}", "remote_hits": self.remote_hits,
+                "fallbacks": self.fallbacks, "reconnects": self.reconnects}
+
+
+def make_cooldown(backend, cooldown_seconds, capacity=10000, address=("127.0.0.1", 5098)):
+    if backend == "local":
+        return CooldownStore(cooldown_seconds, capacity)
+    if backend == "socket":
+        return SharedCooldown(cooldown_seconds, capacity, address)
+    raise ValueError("cooldown backend must be 'local' or 'socket'")
@@ -22,5 +22,7 @@ CREATE TABLE IF NOT EXISTS opti_rec (
     time_out DATETIME,
     duration INT DEFAULT 0,
     salary DECIMAL(10,2) DEFAULT 0,
+    INDEX idx_opti_rec_emp_time (id_employee, time_in),   -- api_scan: today's record per employee
+    INDEX idx_opti_rec_time_in (time_in),                 -- dashboard / exports / payroll day ranges
     FOREIGN KEY (id_employee) REFERENCES opti(id_employee) ON DELETE CASCADE
 );
\ No newline at end of file
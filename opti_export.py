@@ -0,0 +1,341 @@
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+
+import pymysql
+
+from opti_sql import period_range
+
+# -----------------------------
+# Streaming Attendance Export
+# -----------------------------
+# /export_excel?from=YYYY-MM-DD&to=YYYY-MM-DD&employee=<id_employee>
+# Rows come off an unbuffered server-side cursor (SSDictCursor) and are
+# written out in small chunks, so memory stays flat for multi-month ranges.
+# The connection is taken and the query sent before the Response is built,
+# so a busy pool or an unreachable MySQL is a 503 (opti_pool.init_app) rather
+# than a 200 download that stops after the header.
+
+EXPORT_CHUNK_ROWS = 500
+
+EXPORT_SQL = """
+    SELECT opti.name, opti_rec.time_in, opti_rec.time_out, opti_rec.duration, opti_rec.salary
+    FROM opti_rec
+    JOIN opti ON opti_rec.id_employee = opti.id_employee
+    WHERE opti_rec.time_in >= %s AND opti_rec.time_in < %s {employee_filter}
+    ORDER BY opti_rec.time_in DESC
+"""
+
+
+def parse_export_args(args):
+    """(first_day, last_day, id_employee or None) from request.args.
+
+    Both days default to today; raises ValueError on malformed input."""
+    today = date.today()
+    first = date.fromisoformat(args["from"]) if args.get("from") else today
+    last = date.fromisoformat(args["to"]) if args.get("to") else (first if args.get("from") else today)
+    if last < first:
+        raise ValueError("'to' is before 'from'")
+    employee = args.get("employee")
+    return first, last, (int(employee) if employee not in (None, "") else None)
+
+
+def export_filename(first, last, ext):
+    if first == last:
+        return f"attendance_{first.isoformat()}.{ext}"
+    return f"attendance_{first.isoformat()}_{last.isoformat()}.{ext}"
+
+
+def iter_attendance(pool, first, last, employee=None):
+    """Iterator over export rows for whole days first..last, straight off the
+    server. The query has been sent when this returns; PoolTimeout /
+    OperationalError are raised here, not while iterating."""
+    rows = _attendance_rows(pool, first, last, employee)
+    next(rows)
+    return rows
+
+
+def _attendance_rows(pool, first, last, employee):
+    start, end = period_range(first, last)
+    params = [start, end]
+    employee_filter = ""
+    if employee is not None:
+        employee_filter = "AND opti_rec.id_employee = %s"
+        params.append(employee)
+
+    conn = pool.acquire()
+    finished = False
+    try:
+        cursor = conn.cursor(pymysql.cursors.SSDictCursor)
+        cursor.execute(EXPORT_SQL.format(employee_filter=employee_filter), params)
+        yield None      # primed by iter_attendance
+        for row in cursor:
+            yield row
+        cursor.close()
+        finished = True
+    finally:
+        if not finished:
+            # Client went away mid-download (or the query failed): closing an
+            # SSCursor would read the rest of the result set just to discard
+            # it, so drop the link.
+            try:
+                conn.close()
+            except Exception:
+                pass
+        pool.release(conn)
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def stream_attendance_csv(pool, first, last, employee=None):
+    return _csv_chunks(iter_attendance(pool, first, last, employee))
+
+
+def _csv_chunks(rows):
+    writer = csv.writer(_Echo())
+    yield writer.writerow(["Date", "Name", "Time In", "Time Out", "Duration (min)", "Salary"])
+    chunk = []
+    for r in rows:
+        chunk.append(writer.writerow([
+            r["time_in"].strftime("%Y-%m-%d") if r["time_in"] else "",
+            r["name"],
+            r["time_in"].strftime("%H:%M") if r["time_in"] else "",
+            r["time_out"].strftime("%H:%M") if r["time_out"] else "",
+            r.get("duration", ""),
+            r.get("salary", "")
+        ]))
+        if len(chunk) >= EXPORT_CHUNK_ROWS:
+            yield "".join(chunk)
+            chunk = []
+    if chunk:
+        yield "".join(chunk)
+
+
+# -----------------------------
+# Streaming XLSX Export
+# -----------------------------
+# A minimal SpreadsheetML writer: rows are serialized straight into a
+# deflated zip entry that is handed to the client chunk by chunk, with typed
+# cells (real dates, times and 2-decimal amounts) and inline strings, so no
+# shared-strings table or whole-sheet DOM has to be held in memory.
+
+XLSX_MIMETYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+_EXCEL_EPOCH = datetime(1899, 12, 30)
+
+# cellXfs indexes in _STYLES_XML
+_STYLE_DATE, _STYLE_TIME, _STYLE_MONEY, _STYLE_HEADER = 1, 2, 3, 4
+
+_CONTENT_TYPES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}</Types>'
+)
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{n}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_WORKBOOK_RELS_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}'
+    '<Relationship Id="rIdStyles" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" Target="styles.xml"/>'
+    '</Relationships>'
+)
+_STYLES_XML = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<numFmts count="1"><numFmt numFmtId="164" formatCode="yyyy-mm-dd"/></numFmts>'
+    '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+    '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill></fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="5">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="164" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="20" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '</cellXfs></styleSheet>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetViews><sheetView workbookViewId="0"><pane ySplit="1" topLeftCell="A2" state="frozen"/></sheetView></sheetViews>'
+    '<cols>{cols}</cols><sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+_XML_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;"})
+# control characters XML 1.0 can't carry even escaped; Excel rejects the file
+_XML_ILLEGAL = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _text_cell(value, style=0):
+    s = f' s="{style}"' if style else ""
+    text = _XML_ILLEGAL.sub("", str(value)).translate(_XML_ESCAPES)
+    return f'<c t="inlineStr"{s}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _number_cell(value, style=0):
+    if value is None or value == "":
+        return "<c/>"
+    s = f' s="{style}"' if style else ""
+    return f'<c{s}><v>{value}</v></c>'
+
+
+def _date_cell(value):
+    if value is None:
+        return "<c/>"
+    return _number_cell((value - _EXCEL_EPOCH).days, _STYLE_DATE)
+
+
+def _time_cell(value):
+    if value is None:
+        return "<c/>"
+    seconds = value.hour * 3600 + value.minute * 60 + value.second
+    return _number_cell(round(seconds / 86400, 10), _STYLE_TIME)
+
+
+def _row(cells):
+    return "<row>" + "".join(cells) + "</row>"
+
+
+def _header_row(titles):
+    return _row(_text_cell(t, _STYLE_HEADER) for t in titles)
+
+
+def _cols(widths):
+    return "".join(f'<col min="{i}" max="{i}" width="{w}" customWidth="1"/>'
+                   for i, w in enumerate(widths, start=1))
+
+
+class _ChunkSink:
+    """Write-only file for ZipFile; the generator drains it between rows."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+
+PAYROLL_SQL = """
+    SELECT o.name,
+           SUM(r.duration) AS total_minutes,
+           SUM(r.salary) AS total_salary{extra_columns}
+    FROM opti_rec r
+    JOIN opti o ON r.id_employee = o.id_employee
+    WHERE r.time_in >= %s AND r.time_in < %s {employee_filter}
+    GROUP BY o.id_employee
+    ORDER BY o.id_employee ASC
+"""
+
+
+def _payroll_rows(pool, first, last, employee, with_late_undertime):
+    start, end = period_range(first, last)
+    params = [start, end]
+    employee_filter = ""
+    if employee is not None:
+        employee_filter = "AND r.id_employee = %s"
+        params.append(employee)
+    extra = ""
+    if with_late_undertime:
+        extra = (",\n           SUM(r.late_minutes) AS total_late"
+                 ",\n           SUM(r.undertime_minutes) AS total_undertime")
+    with pool.connection() as conn, conn.cursor() as cur:
+        cur.execute(PAYROLL_SQL.format(extra_columns=extra, employee_filter=employee_filter), params)
+        return cur.fetchall()
+
+
+def stream_attendance_xlsx(pool, first, last, employee=None, with_late_undertime=False):
+    """Chunks of an .xlsx workbook: an Attendance sheet (one row per opti_rec
+    row) and a Payroll sheet (the monthly_payroll aggregate over the same
+    range). Both queries run before this returns."""
+    payroll = _payroll_rows(pool, first, last, employee, with_late_undertime)
+    rows = iter_attendance(pool, first, last, employee)
+    return _xlsx_chunks(rows, payroll, with_late_undertime)
+
+
+def _xlsx_chunks(rows, payroll, with_late_undertime):
+    sink = _ChunkSink()
+    sheets = ["Attendance", "Payroll"]
+    with zipfile.ZipFile(sink, "w", compression=zipfile.ZIP_DEFLATED, compresslevel=6) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES_XML.format(
+            sheets="".join(_SHEET_CONTENT_TYPE.format(n=n) for n in range(1, len(sheets) + 1))))
+        zf.writestr("_rels/.rels", _ROOT_RELS_XML)
+        zf.writestr("xl/workbook.xml", _WORKBOOK_XML.format(sheets="".join(
+            f'<sheet name="{name}" sheetId="{n}" r:id="rId{n}"/>' for n, name in enumerate(sheets, start=1))))
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS_XML.format(sheets="".join(
+            f'<Relationship Id="rId{n}" '
+            f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+            f'Target="worksheets/sheet{n}.xml"/>' for n in range(1, len(sheets) + 1))))
+        zf.writestr("xl/styles.xml", _STYLES_XML)
+        yield sink.drain()
+
+        with zf.open("xl/worksheets/sheet1.xml", "w", force_zip64=True) as sheet:
+            sheet.write((_SHEET_HEAD.format(cols=_cols([12, 28, 10, 10, 15, 12]))
+                         + _header_row(["Date", "Name", "Time In", "Time Out", "Duration (min)", "Salary"])
+                         ).encode())
+            chunk = []
+            for r in rows:
+                chunk.append(_row([
+                    _date_cell(r["time_in"]),
+                    _text_cell(r["name"]),
+                    _time_cell(r["time_in"]),
+                    _time_cell(r["time_out"]),
+                    _number_cell(r.get("duration")),
+                    _number_cell(r.get("salary"), _STYLE_MONEY),
+                ]))
+                if len(chunk) >= EXPORT_CHUNK_ROWS:
+                    sheet.write("".join(chunk).encode())
+                    chunk = []
+                    yield sink.drain()
+            sheet.write(("".join(chunk) + _SHEET_TAIL).encode())
+        yield sink.drain()
+
+        titles = ["Name", "Total Minutes", "Total Salary"]
+        if with_late_undertime:
+            titles += ["Total Late (min)", "Total Undertime (min)"]
+        with zf.open("xl/worksheets/sheet2.xml", "w", force_zip64=True) as sheet:
+            sheet.write((_SHEET_HEAD.format(cols=_cols([28, 15, 15, 17, 22][:len(titles)]))
+                         + _header_row(titles)).encode())
+            for p in payroll:
+                cells = [_text_cell(p["name"]), _number_cell(p["total_minutes"]),
+                         _number_cell(p["total_salary"], _STYLE_MONEY)]
+                if with_late_undertime:
+                    cells += [_number_cell(p["total_late"]), _number_cell(p["total_undertime"])]
+                sheet.write(_row(cells).encode())
+            sheet.write(_SHEET_TAIL.encode())
+    yield sink.drain()
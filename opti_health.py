@@ -0,0 +1,115 @@
+import threading
+import time
+
+from flask import jsonify
+
+# -----------------------------
+# Start-up / Health Checks
+# -----------------------------
+# Importing the app and create_app() never touch MySQL or the serial port:
+# the pool connects on first use and SerialLink opens (and settles) the port
+# on its own thread. Warmup runs the steps that would otherwise land on the
+# first scans (first MySQL connection, RFID index, today's shifts, dashboard
+# counters) on a background thread, retrying with backoff while MySQL is
+# slow or down, so the process serves HTTP right away.
+#
+#   GET /healthz   liveness: 200 whenever the process answers at all
+#   GET /readyz    readiness: 200 once every step has run and MySQL answers a
+#                  ping, 503 with the reason otherwise; `info` entries (e.g.
+#                  the Arduino link) are reported but don't gate readiness
+
+
+class Warmup:
+    def __init__(self, pool, retry_initial=0.5, retry_max=30.0, ping_timeout=1.0):
+        self.pool = pool
+        self.retry_initial = retry_initial
+        self.retry_max = retry_max
+        self.ping_timeout = ping_timeout
+        self._steps = []
+        self._info = []
+        self._done = set()
+        self._thread = None
+        self.started = time.monotonic()
+        self.ready_seconds = None
+        self.attempts = 0
+        self.last_error = None
+
+    def step(self, name, fn):
+        self._steps.append((name, fn))
+
+    def info(self, name, fn):
+        self._info.append((name, fn))
+
+    @property
+    def warm(self):
+        return self.ready_seconds is not None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="warmup", daemon=True)
+            self._thread.start()
+        return self._thread
+
+    def _run(self):
+        delay = self.retry_initial
+        while True:
+            self.attempts += 1
+            try:
+                for name, fn in self._steps:
+                    if name not in self._done:
+                        fn()
+                        self._done.add(name)
+            except Exception as e:
+                self.last_error = f"{name}: {e}"
+                print(f"[warmup] {self.last_error}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+                delay = min(delay * 2, self.retry_max)
+                continue
+            self.last_error = None
+            self.ready_seconds = time.monotonic() - self.started
+            print(f"[warmup] ready in {self.ready_seconds:.2f}s")
+            return
+
+    def ping(self):
+        with self.pool.connection(self.ping_timeout) as conn:
+            conn.ping(reconnect=True)
+
+    def check(self):
+        """(ready, body) for /readyz."""
+        body = {"steps": {name: name in self._done for name, _ in self._steps}}
+        for name, fn in self._info:
+            try:
+                body[name] = fn()
+            except Exception as e:
+                body[name] = {"error": str(e)}
+        if not self.warm:
+            return False, {"status": "starting", "error": self.last_error, **body}
+        try:
+            self.ping()
+        except Exception as e:
+            return False, {"status": "unavailable", "error": f"mysql: {e}", **body}
+        return True, {"status": "ready", **body}
+
+    def stats(self):
+        return {
+            "ready": self.warm,
+            "ready_seconds": self.ready_seconds,
+            "attempts": self.attempts,
+            "steps_done": len(self._done),
+        }
+
+
+# -----------------------------
+# Flask Integration
+# -----------------------------
+def init_app(app, warmup):
+    app.extensions["opti_warmup"] = warmup
+
+    @app.route("/healthz")
+    def healthz():
+        return jsonify({"status": "alive", "uptime_seconds": round(time.monotonic() - warmup.started, 3)})
+
+    @app.route("/readyz")
+    def readyz():
+        ready, body = warmup.check()
+        return jsonify(body), 200 if ready else 503
@@ -0,0 +1,130 @@
+import functools
+import gzip
+import hashlib
+import threading
+import time
+from datetime import date
+
+from flask import make_response, request, session
+from werkzeug.http import http_date, parse_date
+
+# -----------------------------
+# Read API Response Cache
+# -----------------------------
+# @response_cache.cached keeps the last 200 body of a GET route per path,
+# query string, admin session and calendar day. Write paths call
+# invalidate(), which drops every entry at once; until then repeat polls are
+# answered from memory with a strong ETag and a Last-Modified of the last
+# write, and conditional requests get an empty 304, so an idle poller never
+# reaches MySQL. Bodies of at least gzip_min_size bytes are also kept
+# gzipped for clients that accept it.
+#
+# An entry computed while a write was in flight is not stored: the
+# generation is read before the view runs and checked again before saving.
+
+
+class _Entry:
+    __slots__ = ("generation", "body", "gzip_body", "mimetype", "etag")
+
+    def __init__(self, generation, body, gzip_body, mimetype, etag):
+        self.generation = generation
+        self.body = body
+        self.gzip_body = gzip_body
+        self.mimetype = mimetype
+        self.etag = etag
+
+
+class ResponseCache:
+    def __init__(self, gzip_bodies=True, gzip_min_size=1024, max_entries=1024):
+        self.gzip_bodies = gzip_bodies
+        self.gzip_min_size = gzip_min_size
+        self.max_entries = max_entries
+        self.before_rebuild = None
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._modified = int(time.time())
+        # stats
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+        self.invalidations = 0
+
+    def invalidate(self):
+        with self._lock:
+            self._generation += 1
+            # Last-Modified has 1 s resolution: always move it forward so a
+            # client that polled earlier in the same second isn't told 304
+            self._modified = max(int(time.time()), self._modified + 1)
+            self._entries.clear()
+            self.invalidations += 1
+
+    def _key(self):
+        return (request.path, tuple(sorted(request.args.items(multi=True))),
+                session.get("admin"), date.today())
+
+    def cached(self, view):
+        @functools.wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method not in ("GET", "HEAD"):
+                return view(*args, **kwargs)
+            key = self._key()
+            with self._lock:
+                generation = self._generation
+                entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                if self.before_rebuild is not None:
+                    self.before_rebuild()
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200 or response.is_streamed:
+                    return response
+                entry = self._store(key, generation, response)
+            else:
+                self.hits += 1
+            return self._serve(entry)
+        return wrapper
+
+    def _store(self, key, generation, response):
+        body = response.get_data()
+        gzip_body = None
+        if self.gzip_bodies and len(body) >= self.gzip_min_size:
+            gzip_body = gzip.compress(body, compresslevel=6)
+        etag = hashlib.sha1(body).hexdigest()[:20]
+        entry = _Entry(generation, body, gzip_body, response.mimetype, etag)
+        with self._lock:
+            if generation == self._generation and len(self._entries) < self.max_entries:
+                self._entries[key] = entry
+        return entry
+
+    def _serve(self, entry):
+        use_gzip = entry.gzip_body is not None and "gzip" in request.headers.get("Accept-Encoding", "")
+        # the gzip variant is a different byte stream, so it gets its own strong tag
+        etag = f'"{entry.etag}-gz"' if use_gzip else f'"{entry.etag}"'
+        last_modified = self._modified
+
+        if_none_match = request.headers.get("If-None-Match")
+        if if_none_match is not None:
+            fresh = if_none_match.strip() == "*" or etag in [t.strip() for t in if_none_match.split(",")]
+        else:
+            since = parse_date(request.headers.get("If-Modified-Since"))
+            fresh = since is not None and int(since.timestamp()) >= last_modified
+        if fresh:
+            self.not_modified += 1
+            response = make_response("", 304)
+        else:
+            response = make_response(entry.gzip_body if use_gzip else entry.body)
+            response.mimetype = entry.mimetype
+            if use_gzip:
+                response.headers["Content-Encoding"] = "gzip"
+        response.headers["ETag"] = etag
+        response.headers["Last-Modified"] = http_date(last_modified)
+        response.headers["Cache-Control"] = "private, no-cache"
+        if entry.gzip_body is not None:
+            response.headers["Vary"] = "Accept-Encoding"
+        return response
+
+    def stats(self):
+        return {"entries": len(self._entries), "generation": self._generation, "hits": self.hits,
+                "misses": self.misses, "not_modified": self.not_modified,
+                "invalidations": self.invalidations}
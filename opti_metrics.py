@@ -0,0 +1,234 @@
+import bisect
+import re
+import threading
+import time
+
+import pymysql
+from flask import Response, g, request
+
+# -----------------------------
+# Metrics Registry
+# -----------------------------
+# Process-wide counters and fixed-bucket latency histograms, rendered in the
+# Prometheus text format at /metrics. Every series is created once (routes,
+# statements and events are a small fixed set) and after that recording is a
+# dict lookup, a bisect over a tuple and a few integer adds under a lock.
+#
+# Recorded here:
+#   http_request_seconds{route,method}      per-route latency (before/teardown request)
+#   http_responses_total{route,status}
+#   db_query_seconds{statement}             InstrumentedCursor.execute
+#   db_rows_total{statement}                rows returned / affected
+#   db_commit_seconds                       InstrumentedConnection.commit
+#   db_pool_wait_seconds                    ConnectionPool.acquire
+#   socketio_emits_total{event}             instrument_socketio
+#   serial_write_seconds                    SerialLink writer thread
+# plus whatever stats() dicts are registered with collect().
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count", "_lock")
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+
+    def snapshot(self):
+        with self._lock:
+            return list(self.counts), self.sum, self.count
+
+
+class Counter:
+    __slots__ = ("value", "_lock")
+
+    def __init__(self):
+        self.value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self.value += amount
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._series = {}        # (name, labels) -> Histogram / Counter
+        self._help = {}
+        self._collectors = []
+
+    def _get(self, kind, name, labels, help):
+        key = (name, labels)
+        series = self._series.get(key)
+        if series is None:
+            with self._lock:
+                series = self._series.get(key)
+                if series is None:
+                    series = self._series[key] = kind()
+                    if help:
+                        self._help.setdefault(name, help)
+        return series
+
+    def histogram(self, name, labels=(), help=None):
+        """labels: tuple of (key, value) pairs, e.g. (("route", "/api/scan"),)"""
+        return self._get(Histogram, name, labels, help)
+
+    def counter(self, name, labels=(), help=None):
+        return self._get(Counter, name, labels, help)
+
+    def collect(self, prefix, stats, help=None):
+        """Export the numeric values of stats() as gauges named prefix_<key>."""
+        self._collectors.append((prefix, stats, help))
+
+    def render(self):
+        lines = []
+        with self._lock:
+            series = sorted(self._series.items(), key=lambda item: item[0])
+        seen = set()
+        for (name, labels), s in series:
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {'histogram' if isinstance(s, Histogram) else 'counter'}")
+            if isinstance(s, Histogram):
+                counts, total, count = s.snapshot()
+                cumulative = 0
+                for bound, n in zip(s.buckets + (float("inf"),), counts):
+                    cumulative += n
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+                lines.append(f"{name}_sum{_label_text(labels)} {total}")
+                lines.append(f"{name}_count{_label_text(labels)} {count}")
+            else:
+                lines.append(f"{name}{_label_text(labels)} {s.value}")
+        for prefix, stats, help in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                lines.append(f"# {prefix} collector failed: {e}")
+                continue
+            for key, value in values.items():
+                if isinstance(value, bool):
+                    value = int(value)
+                if isinstance(value, (int, float)):
+                    name = f"{prefix}_{key}"
+                    if help:
+                        lines.append(f"# HELP {name} {help}")
+                    lines.append(f"# TYPE {name} gauge")
+                    lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+
+
+# -----------------------------
+# MySQL Instrumentation
+# -----------------------------
+# Statements are labelled "<verb> <table>" (select opti_rec, insert opti, ...)
+# so the label set stays small; the label of each distinct SQL text is cached.
+_STATEMENT = re.compile(r"^\s*(\w+)\s+(?:.*?\b(?:FROM|INTO|TABLE)\s+)?`?(\w+)", re.S | re.I)
+_statement_labels = {}
+_STATEMENT_CACHE_MAX = 2048
+
+
+def statement_label(query):
+    label = _statement_labels.get(query)
+    if label is None:
+        m = _STATEMENT.match(query)
+        label = ((("statement", f"{m.group(1).lower()} {m.group(2)}"),) if m
+                 else (("statement", "other"),))
+        if len(_statement_labels) < _STATEMENT_CACHE_MAX:
+            _statement_labels[query] = label
+    return label
+
+
+class InstrumentedCursor(pymysql.cursors.DictCursor):
+    """DictCursor that times every statement and counts its rows."""
+
+    # called as query_observer(cursor, query, args, seconds) after every
+    # statement; the apps point it at a SlowQueryLog's bound observe method
+    # (opti_slowlog.py)
+    query_observer = None
+
+    def execute(self, query, args=None):
+        started = time.perf_counter()
+        try:
+            return super().execute(query, args)
+        finally:
+            elapsed = time.perf_counter() - started
+            labels = statement_label(query)
+            metrics.histogram("db_query_seconds", labels, "MySQL statement latency").observe(elapsed)
+            if self.query_observer is not None:
+                self.query_observer(self, query, args, elapsed)
+            if self.rowcount and self.rowcount > 0:
+                metrics.counter("db_rows_total", labels, "Rows returned or affected").inc(self.rowcount)
+
+
+class InstrumentedConnection(pymysql.connections.Connection):
+    def commit(self):
+        started = time.perf_counter()
+        try:
+            return super().commit()
+        finally:
+            metrics.histogram("db_commit_seconds", help="COMMIT latency").observe(time.perf_counter() - started)
+
+
+# -----------------------------
+# Flask / Socket.IO Integration
+# -----------------------------
+def init_app(app):
+    @app.before_request
+    def _start_timer():
+        g.metrics_started = time.perf_counter()
+
+    @app.after_request
+    def _record_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    @app.teardown_request
+    def _observe(exc):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        route = request.url_rule.rule if request.url_rule is not None else "unmatched"
+        metrics.histogram("http_request_seconds", (("route", route), ("method", request.method)),
+                          "Request latency by route").observe(time.perf_counter() - started)
+        status = g.pop("metrics_status", 500)
+        metrics.counter("http_responses_total", (("route", route), ("status", status)),
+                        "Responses by route and status").inc()
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def instrument_socketio(socketio):
+    emit = socketio.emit
+
+    def counted_emit(event, *args, **kwargs):
+        metrics.counter("socketio_emits_total", (("event", event),), "Socket.IO emits by event").inc()
+        return emit(event, *args, **kwargs)
+
+    socketio.emit = counted_emit
@@ -0,0 +1,145 @@
+import base64
+import json
+from datetime import datetime
+
+from opti_sql import period_range
+from opti_export import parse_export_args
+
+# -----------------------------
+# Keyset-paginated JSON APIs
+# -----------------------------
+# /api/attendance  newest first, keyed on (time_in, id)
+# /api/employees   by id_employee (admin session only: rows include rfid)
+# ?limit=  page size (default 50, max 500)
+# ?cursor= opaque token from the previous page's next_cursor
+# ?fields= comma-separated subset of the fields below
+# Each page is one indexed seek (time_in / primary key) plus LIMIT n+1, never
+# an OFFSET scan, so deep pages cost the same as the first one.
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+ATTENDANCE_FIELDS = {
+    "id": "opti_rec.id",
+    "id_employee": "opti_rec.id_employee",
+    "name": "opti.name",
+    "time_in": "opti_rec.time_in",
+    "time_out": "opti_rec.time_out",
+    "duration": "opti_rec.duration",
+    "salary": "opti_rec.salary",
+}
+LATE_UNDERTIME_FIELDS = {
+    "late_minutes": "opti_rec.late_minutes",
+    "undertime_minutes": "opti_rec.undertime_minutes",
+}
+EMPLOYEE_FIELDS = ["id_employee", "name", "age", "sex", "email", "number", "rfid"]
+
+
+def encode_cursor(key):
+    return base64.urlsafe_b64encode(json.dumps(key, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    try:
+        return json.loads(base64.urlsafe_b64decode(token + "=" * (-len(token) % 4)))
+    except (ValueError, TypeError):
+        raise ValueError("invalid cursor")
+
+
+def _page_size(args):
+    try:
+        limit = int(args.get("limit", DEFAULT_PAGE_SIZE))
+    except ValueError:
+        raise ValueError("limit must be an integer")
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def _fields(args, allowed):
+    requested = args.get("fields")
+    if not requested:
+        return list(allowed)
+    fields = [f.strip() for f in requested.split(",") if f.strip()]
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def attendance_page(cursor, args, with_late_undertime=False):
+    """One page of attendance rows; raises ValueError on bad parameters.
+
+    Accepts the export filters too (from / to / employee), defaulting to
+    today like /api/export_today."""
+    columns = dict(ATTENDANCE_FIELDS)
+    if with_late_undertime:
+        columns.update(LATE_UNDERTIME_FIELDS)
+    limit = _page_size(args)
+    fields = _fields(args, columns)
+    first, last, employee = parse_export_args(args)
+    start, end = period_range(first, last)
+
+    where = ["opti_rec.time_in >= %s", "opti_rec.time_in < %s"]
+    params = [start, end]
+    if employee is not None:
+        where.append("opti_rec.id_employee = %s")
+        params.append(employee)
+    if args.get("cursor"):
+        key = decode_cursor(args["cursor"])
+        try:
+            after_time, after_id = datetime.fromisoformat(key["t"]), int(key["i"])
+        except (KeyError, ValueError, TypeError):
+            raise ValueError("invalid cursor")
+        # (time_in, id) < (after_time, after_id), spelled so the leading
+        # time_in bound stays a plain range on idx_opti_rec_time_in
+        where.append("opti_rec.time_in <= %s AND (opti_rec.time_in < %s OR opti_rec.id < %s)")
+        params += [after_time, after_time, after_id]
+
+    select = ", ".join(f"{columns[f]} AS {f}" for f in dict.fromkeys(fields + ["time_in", "id"]))
+    cursor.execute(f"""
+        SELECT {select}
+        FROM opti_rec
+        JOIN opti ON opti_rec.id_employee = opti.id_employee
+        WHERE {" AND ".join(where)}
+        ORDER BY opti_rec.time_in DESC, opti_rec.id DESC
+        LIMIT %s
+    """, (*params, limit + 1))
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last_row = rows[-1]
+        next_cursor = encode_cursor({"t": last_row["time_in"].isoformat(), "i": last_row["id"]})
+    return {
+        "records": [{f: row[f] for f in fields} for row in rows],
+        "next_cursor": next_cursor,
+    }
+
+
+def employees_page(cursor, args):
+    limit = _page_size(args)
+    fields = _fields(args, EMPLOYEE_FIELDS)
+    after_id = 0
+    if args.get("cursor"):
+        try:
+            after_id = int(decode_cursor(args["cursor"])["i"])
+        except (KeyError, ValueError, TypeError):
+            raise ValueError("invalid cursor")
+
+    select = ", ".join(dict.fromkeys(fields + ["id_employee"]))
+    cursor.execute(f"""
+        SELECT {select} FROM opti
+        WHERE id_employee > %s
+        ORDER BY id_employee ASC
+        LIMIT %s
+    """, (after_id, limit + 1))
+    rows = cursor.fetchall()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor({"i": rows[-1]["id_employee"]})
+    return {
+        "employees": [{f: row[f] for f in fields} for row in rows],
+        "next_cursor": next_cursor,
+    }
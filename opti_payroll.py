@@ -0,0 +1,325 @@
+import calendar
+import time
+from datetime import date, time as dt_time, timedelta
+
+import pymysql
+
+from opti_scan import ScanRules
+from opti_sql import period_range
+
+try:
+    import numpy as np
+except ImportError:  # only the bulk recompute needs it
+    np = None
+
+# -----------------------------
+# Daily Pay Rollup
+# -----------------------------
+# opti_daily_pay holds one row per employee per work day (the day of
+# time_in) with the sums payroll needs. The scan paths add to it in the same
+# transaction as their opti_rec write, so a payroll period of any length is
+# answered from at most employees x days rows instead of re-aggregating
+# opti_rec. rebuild() recomputes a date range set-based from opti_rec (batch
+# ingestion, recomputes, backfill).
+
+
+class PayrollRollup:
+    TIME_IN_SQL = """
+        INSERT INTO opti_daily_pay (id_employee, work_date, shifts, late_minutes)
+        VALUES (%s, %s, 1, %s)
+        ON DUPLICATE KEY UPDATE shifts = shifts + 1, late_minutes = late_minutes + VALUES(late_minutes)
+    """
+    TIME_OUT_SQL = """
+        INSERT INTO opti_daily_pay (id_employee, work_date, minutes, salary, undertime_minutes)
+        VALUES (%s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE minutes = minutes + VALUES(minutes),
+                                salary = salary + VALUES(salary),
+                                undertime_minutes = undertime_minutes + VALUES(undertime_minutes)
+    """
+
+    def time_in(self, cursor, id_employee, time_in, late_minutes):
+        cursor.execute(self.TIME_IN_SQL, (id_employee, time_in.date(), late_minutes))
+
+    def time_out(self, cursor, id_employee, time_in, duration, salary, undertime_minutes):
+        cursor.execute(self.TIME_OUT_SQL, (id_employee, time_in.date(), duration, salary, undertime_minutes))
+
+    def time_in_many(self, cursor, rows):
+        """rows: (id_employee, time_in, late_minutes)"""
+        if rows:
+            cursor.executemany(self.TIME_IN_SQL, [(e, t.date(), late) for e, t, late in rows])
+
+    def time_out_many(self, cursor, rows):
+        """rows: (id_employee, time_in, duration, salary, undertime_minutes)"""
+        if rows:
+            cursor.executemany(self.TIME_OUT_SQL, [(e, t.date(), d, s, u) for e, t, d, s, u in rows])
+
+    def rebuild(self, cursor, first, last):
+        """Recompute work days first..last (inclusive) from opti_rec; caller commits."""
+        start, end = period_range(first, last)
+        cursor.execute("DELETE FROM opti_daily_pay WHERE work_date >= %s AND work_date <= %s", (first, last))
+        cursor.execute("""
+            INSERT INTO opti_daily_pay
+                (id_employee, work_date, shifts, minutes, salary, late_minutes, undertime_minutes)
+            SELECT id_employee, DATE(time_in), COUNT(*),
+                   IFNULL(SUM(duration), 0), IFNULL(SUM(salary), 0),
+                   IFNULL(SUM(late_minutes), 0), IFNULL(SUM(undertime_minutes), 0)
+            FROM opti_rec
+            WHERE time_in >= %s AND time_in < %s
+            GROUP BY id_employee, DATE(time_in)
+        """, (start, end))
+
+
+# -----------------------------
+# Pay Periods
+# -----------------------------
+PAY_PERIODS = ("month", "semi_monthly", "week", "custom")
+
+
+def _iso_day(args, key):
+    # args may be a JSON body, so the value can be any JSON type
+    value = args.get(key)
+    if not isinstance(value, str):
+        raise ValueError(f"'{key}' must be a YYYY-MM-DD string")
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise ValueError(f"'{key}' is not a YYYY-MM-DD date: {value!r}")
+
+
+def pay_period(args, today=None):
+    """(first_day, last_day, label) from ?period=&date=&from=&to=.
+
+    month / semi_monthly (1-15, 16-end) / week (Mon-Sun) contain ?date=
+    (default today); custom uses ?from= and ?to=. Raises ValueError."""
+    today = today or date.today()
+    period = args.get("period", "month")
+    if not isinstance(period, str) or period not in PAY_PERIODS:
+        raise ValueError(f"period must be one of: {', '.join(PAY_PERIODS)}")
+    if period == "custom":
+        if not args.get("from") or not args.get("to"):
+            raise ValueError("custom period needs 'from' and 'to'")
+        first, last = _iso_day(args, "from"), _iso_day(args, "to")
+        if last < first:
+            raise ValueError("'to' is before 'from'")
+        return first, last, f"{first.isoformat()} to {last.isoformat()}"
+
+    anchor = _iso_day(args, "date") if args.get("date") else today
+    month_end = calendar.monthrange(anchor.year, anchor.month)[1]
+    if period == "month":
+        first, last = anchor.replace(day=1), anchor.replace(day=month_end)
+        label = anchor.strftime("%B %Y")
+    elif period == "semi_monthly":
+        if anchor.day <= 15:
+            first, last = anchor.replace(day=1), anchor.replace(day=15)
+        else:
+            first, last = anchor.replace(day=16), anchor.replace(day=month_end)
+        label = f"{first.strftime('%B')} {first.day}-{last.day}, {first.year}"
+    else:
+        first = anchor - timedelta(days=anchor.weekday())
+        last = first + timedelta(days=6)
+        label = f"Week of {first.isoformat()}"
+    return first, last, label
+
+
+def payroll_totals(cursor, first, last):
+    """Per-employee totals for work days first..last from opti_daily_pay."""
+    cursor.execute("""
+        SELECT o.name,
+               SUM(p.minutes) AS total_minutes,
+               SUM(p.salary) AS total_salary,
+               SUM(p.late_minutes) AS total_late,
+               SUM(p.undertime_minutes) AS total_undertime
+        FROM opti_daily_pay p
+        JOIN opti o ON p.id_employee = o.id_employee
+        WHERE p.work_date >= %s AND p.work_date <= %s
+        GROUP BY o.id_employee
+        ORDER BY o.id_employee ASC
+    """, (first, last))
+    return cursor.fetchall()
+
+
+# -----------------------------
+# Bulk Recompute
+# -----------------------------
+# Re-applies pay rules (rate, shift window) to every opti_rec row in a period
+# after HR changes them. Rows are pulled as plain integers (seconds since
+# 1970-01-01, salary in cents) into NumPy arrays, the ScanRules arithmetic is
+# done column-wise, and only rows whose values change are written back with
+# multi-row upserts on the primary key, in one transaction.
+#
+# Closed shifts get duration / salary / late / undertime; open shifts only
+# get late_minutes. A real run loads the period with SELECT ... FOR UPDATE in
+# the same transaction as the write-back, so a row can't be closed by a live
+# scan or deleted (the upsert would recreate it) in between; scans touching
+# that period wait for the commit.
+
+RECOMPUTE_FETCH_ROWS = 50000
+_DAY = 86400
+
+
+def _seconds(t):
+    return t.hour * 3600 + t.minute * 60 + t.second
+
+
+def _parse_shift_time(value, default):
+    if value in (None, ""):
+        return default
+    try:
+        return dt_time.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"invalid shift time: {value!r}")
+
+
+def parse_recompute_args(body, rules):
+    """(first, last, ScanRules, dry_run) from a recompute request body.
+
+    The period uses the /api/payroll parameters (period, date, from, to);
+    rate_per_minute / shift_start / shift_end default to `rules`, and shift
+    fields are ignored when `rules` has none (opti_db). Raises ValueError."""
+    if not isinstance(body, dict):
+        raise ValueError("body must be a JSON object")
+    first, last, _ = pay_period(body)
+    try:
+        rate = float(body.get("rate_per_minute", rules.rate_per_minute))
+    except (TypeError, ValueError):
+        raise ValueError("rate_per_minute must be a number")
+    if rate < 0:
+        raise ValueError("rate_per_minute must not be negative")
+    shift_start, shift_end = rules.shift_start, rules.shift_end
+    if shift_start is not None:
+        shift_start = _parse_shift_time(body.get("shift_start"), shift_start)
+    if shift_end is not None:
+        shift_end = _parse_shift_time(body.get("shift_end"), shift_end)
+    dry_run = body.get("dry_run", True) not in (False, "false", "0", 0)
+    return first, last, ScanRules(rate, shift_start=shift_start, shift_end=shift_end), dry_run
+
+
+def _load_shifts(connection, rules, start, end, for_update=False):
+    late = "IFNULL(late_minutes, 0)" if rules.shift_start is not None else "0"
+    under = "IFNULL(undertime_minutes, 0)" if rules.shift_end is not None else "0"
+    cursor = connection.cursor(pymysql.cursors.SSCursor)
+    try:
+        cursor.execute(f"""
+            SELECT id, id_employee,
+                   TIMESTAMPDIFF(SECOND, '1970-01-01', time_in),
+                   IFNULL(TIMESTAMPDIFF(SECOND, '1970-01-01', time_out), -1),
+                   IFNULL(duration, 0),
+                   CAST(ROUND(IFNULL(salary, 0) * 100) AS SIGNED),
+                   {late}, {under}
+            FROM opti_rec
+            WHERE time_in >= %s AND time_in < %s
+            {"FOR UPDATE" if for_update else ""}
+        """, (start, end))
+        chunks = []
+        while True:
+            rows = cursor.fetchmany(RECOMPUTE_FETCH_ROWS)
+            if not rows:
+                break
+            chunks.append(np.array(rows, dtype=np.int64))
+    finally:
+        cursor.close()
+    if not chunks:
+        return np.empty((0, 8), dtype=np.int64)
+    return np.concatenate(chunks)
+
+
+def _totals(minutes, cents, late, under):
+    return {
+        "minutes": int(minutes.sum()),
+        "salary": int(cents.sum()) / 100,
+        "late_minutes": int(late.sum()),
+        "undertime_minutes": int(under.sum()),
+    }
+
+
+def recompute_payroll(connection, rules, first, last, dry_run=True, rollup=None):
+    """Recompute opti_rec pay fields for work days first..last under `rules`.
+
+    With dry_run nothing is written and the result is a what-if: totals
+    before and after, and per-employee totals after. Otherwise changed rows
+    are upserted, `rollup` (a PayrollRollup) is rebuilt for the period and
+    the transaction is committed. Raises RuntimeError without NumPy."""
+    if np is None:
+        raise RuntimeError("bulk payroll recompute needs NumPy (pip install numpy)")
+    started = time.perf_counter()
+    start, end = period_range(first, last)
+    data = _load_shifts(connection, rules, start, end, for_update=not dry_run)
+    ids, emp, t_in, t_out, dur0, cents0, late0, under0 = data.T
+    loaded = time.perf_counter()
+
+    closed = t_out >= 0
+    dur = np.where(closed, (t_out - t_in) // 60, dur0)
+    cents = np.where(closed, np.rint(dur * (rules.rate_per_minute * 100)).astype(np.int64), cents0)
+    late = late0
+    if rules.shift_start is not None:
+        tod_in = t_in % _DAY
+        shift_start = _seconds(rules.shift_start)
+        late = np.where(tod_in > shift_start, (tod_in - shift_start) // 60, 0)
+    under = under0
+    if rules.shift_end is not None:
+        tod_out = t_out % _DAY
+        shift_end = _seconds(rules.shift_end)
+        under = np.where(closed, np.where(tod_out < shift_end, (shift_end - tod_out) // 60, 0), under0)
+
+    changed = (dur != dur0) | (cents != cents0) | (late != late0) | (under != under0)
+    close_rows = changed & closed
+    open_rows = changed & ~closed & (late != late0)
+
+    employees, index = np.unique(emp, return_inverse=True)
+    per_employee = [
+        np.bincount(index, weights=column, minlength=len(employees)).astype(np.int64).tolist()
+        for column in (dur, cents, late, under, cents - cents0)
+    ]
+    result = {
+        "from": first.isoformat(),
+        "to": last.isoformat(),
+        "rate_per_minute": rules.rate_per_minute,
+        "shift_start": rules.shift_start.isoformat() if rules.shift_start is not None else None,
+        "shift_end": rules.shift_end.isoformat() if rules.shift_end is not None else None,
+        "dry_run": dry_run,
+        "rows": int(len(ids)),
+        "changed": int(close_rows.sum() + open_rows.sum()),
+        "before": _totals(dur0, cents0, late0, under0),
+        "after": _totals(dur, cents, late, under),
+        "employees": [
+            {"id_employee": e, "minutes": m, "salary": c / 100, "late_minutes": l,
+             "undertime_minutes": u, "salary_change": d / 100}
+            for e, m, c, l, u, d in zip(employees.tolist(), *per_employee)
+        ],
+    }
+
+    if not dry_run:
+        cursor = connection.cursor()
+        out_columns = ["duration", "salary"]
+        if rules.shift_start is not None:
+            out_columns.append("late_minutes")
+        if rules.shift_end is not None:
+            out_columns.append("undertime_minutes")
+        values = {"duration": dur, "salary": cents, "late_minutes": late, "undertime_minutes": under}
+        if close_rows.any():
+            rows = [ids[close_rows].tolist(), emp[close_rows].tolist()]
+            for c in out_columns:
+                column = values[c][close_rows]
+                rows.append((column / 100).tolist() if c == "salary" else column.tolist())
+            _upsert(cursor, out_columns, zip(*rows))
+        if open_rows.any() and rules.shift_start is not None:
+            _upsert(cursor, ["late_minutes"],
+                    zip(ids[open_rows].tolist(), emp[open_rows].tolist(), late[open_rows].tolist()))
+        if rollup is not None:
+            rollup.rebuild(cursor, first, last)
+        connection.commit()
+
+    result["load_ms"] = round((loaded - started) * 1000, 1)
+    result["total_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return result
+
+
+def _upsert(cursor, columns, rows):
+    # pymysql only folds INSERT ... VALUES into multi-row statements, so the
+    # bulk UPDATE is written as an upsert on the primary key.
+    names = ["id", "id_employee"] + columns
+    cursor.executemany(
+        f"INSERT INTO opti_rec ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))}) "
+        f"ON DUPLICATE KEY UPDATE {', '.join(f'{c}=VALUES({c})' for c in columns)}",
+        list(rows),
+    )
@@ -0,0 +1,153 @@
+import queue
+import threading
+import time
+from contextlib import contextmanager
+
+import pymysql
+from pymysql.constants import SERVER_STATUS
+from flask import g, current_app, jsonify
+
+from opti_metrics import metrics
+
+# -----------------------------
+# MySQL Connection Pool
+# -----------------------------
+# Shared by opti_staff.py and opti_test.py. Every request checks out its own
+# connection (see get_db) and hands it back on teardown, so concurrent scans,
+# dashboard loads and exports no longer share one socket and one result set.
+
+
+class PoolTimeout(Exception):
+    """Raised when no connection frees up within the pool's wait time."""
+
+
+class ConnectionPool:
+    def __init__(self, size=10, timeout=5.0, ping_interval=30.0,
+                 connection_class=pymysql.connections.Connection, **connect_kwargs):
+        self.size = size
+        self.timeout = timeout
+        self.ping_interval = ping_interval
+        self.connection_class = connection_class
+        self._connect_kwargs = connect_kwargs
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self._in_use = 0
+        self._created = 0
+
+    def _connect(self):
+        conn = self.connection_class(**self._connect_kwargs)
+        with self._lock:
+            self._created += 1
+        return conn
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def acquire(self, timeout=None):
+        wait = self.timeout if timeout is None else timeout
+        started = time.perf_counter()
+        acquired = self._slots.acquire(timeout=wait)
+        metrics.histogram("db_pool_wait_seconds", help="Time spent waiting for a pooled connection").observe(
+            time.perf_counter() - started)
+        if not acquired:
+            raise PoolTimeout(f"no MySQL connection available after {wait}s")
+        try:
+            conn = self._checkout()
+        except BaseException:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def _checkout(self):
+        while True:
+            try:
+                conn, last_used = self._idle.get_nowait()
+            except queue.Empty:
+                return self._connect()
+            if not conn.open:
+                continue
+            if time.monotonic() - last_used < self.ping_interval:
+                return conn
+            # Idle long enough that MySQL may have dropped it (wait_timeout,
+            # server restart): health-check and transparently reconnect.
+            try:
+                conn.ping(reconnect=True)
+                return conn
+            except pymysql.MySQLError:
+                self._close(conn)
+
+    def release(self, conn):
+        try:
+            if conn.open and conn.server_status & SERVER_STATUS.SERVER_STATUS_IN_TRANS:
+                # A route bailed out mid-transaction; never leak it to the next user.
+                conn.rollback()
+            if conn.open:
+                self._idle.put((conn, time.monotonic()))
+        except pymysql.MySQLError:
+            self._close(conn)
+        finally:
+            with self._lock:
+                self._in_use -= 1
+            self._slots.release()
+
+    @contextmanager
+    def connection(self, timeout=None):
+        conn = self.acquire(timeout)
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": self.size,
+                "in_use": self._in_use,
+                "idle": self._idle.qsize(),
+                "created": self._created,
+            }
+
+    def close(self):
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                return
+            self._close(conn)
+
+
+# -----------------------------
+# Flask Integration
+# -----------------------------
+def init_app(app, pool):
+    app.extensions["opti_pool"] = pool
+    app.teardown_appcontext(_return_connection)
+
+    @app.errorhandler(PoolTimeout)
+    def _pool_exhausted(e):
+        return jsonify({"status": "busy", "error": str(e)}), 503
+
+    @app.errorhandler(pymysql.err.OperationalError)
+    def _database_unavailable(e):
+        # MySQL down / unreachable (or still starting): a retryable 503 rather than a 500
+        return jsonify({"status": "unavailable", "error": str(e)}), 503
+
+
+def get_db():
+    """Connection checked out for the current request; returned on teardown."""
+    if "opti_db" not in g:
+        g.opti_db = current_app.extensions["opti_pool"].acquire()
+    return g.opti_db
+
+
+def _return_connection(exc):
+    conn = g.pop("opti_db", None)
+    if conn is not None:
+        current_app.extensions["opti_pool"].release(conn)
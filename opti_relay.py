@@ -0,0 +1,405 @@
+import itertools
+import json
+import os
+import queue
+import socket
+import socketserver
+import struct
+import threading
+import time
+
+# -----------------------------
+# Worker Relay
+# -----------------------------
+# A small pub/sub hub for the worker processes started by opti_workers.py.
+# Workers connect over a local socket, either TCP (tcp://127.0.0.1:5097, the
+# default, works everywhere) or a Unix socket (unix:///tmp/opti-relay.sock),
+# subscribe to channels and publish JSON messages. The relay numbers the
+# messages of each channel 1, 2, 3, ... and delivers every message, in that
+# order, to every subscriber of the channel, the publisher included. So all
+# workers see the same sequence, which is what lets the change log and the
+# attendance broadcaster hand out the same versions on every worker.
+#
+# Frames on the wire are a 4-byte big-endian length followed by UTF-8 JSON:
+#
+#   worker -> relay  {"op": "sub", "channels": [...]}
+#                    {"op": "pub", "channel": c, "data": ..., "origin": w, "token": t}
+#   relay -> worker  {"channel": null, "subscribed": [...]}   (ack of "sub")
+#                    {"channel": c, "seq": n, "data": ..., "origin": w, "token": t}
+#
+# Channels used by the apps:
+#   socketio    RelayManager: Socket.IO emits / room operations (arduino_data, ...)
+#   attendance  AttendanceBroadcaster.attach
+#   changes     ChangeLog.attach (also drives cross-worker cache invalidation)
+#   serial      RelaySerial: lines for the worker that owns the Arduino port
+
+DEFAULT_ADDRESS = "tcp://127.0.0.1:5097"
+SUBSCRIBER_QUEUE_MAX = 10000
+
+
+def parse_address(address):
+    """"tcp://host:port" -> (AF_INET, (host, port)); "unix:///path" -> (AF_UNIX, path)."""
+    scheme, sep, rest = address.partition("://")
+    if sep and scheme == "unix":
+        return socket.AF_UNIX, rest
+    if sep and scheme == "tcp":
+        host, _, port = rest.rpartition(":")
+        return socket.AF_INET, (host or "127.0.0.1", int(port))
+    raise ValueError("relay address must look like tcp://127.0.0.1:5097 or unix:///path/to.sock")
+
+
+def _send_frame(sock, message):
+    body = json.dumps(message, separators=(",", ":"), default=str).encode("utf-8")
+    sock.sendall(struct.pack(">I", len(body)) + body)
+
+
+def _read_frame(reader):
+    header = reader.read(4)
+    if len(header) < 4:
+        return None
+    (size,) = struct.unpack(">I", header)
+    body = reader.read(size)
+    if len(body) < size:
+        return None
+    return json.loads(body)
+
+
+# -----------------------------
+# Relay (runs in the launcher)
+# -----------------------------
+class _Subscriber:
+    def __init__(self, sock):
+        self.sock = sock
+        self.channels = set()
+        self.outbox = queue.Queue(maxsize=SUBSCRIBER_QUEUE_MAX)
+        self.closed = False
+
+    def write_loop(self):
+        while True:
+            frame = self.outbox.get()
+            if frame is None:
+                return
+            try:
+                self.sock.sendall(frame)
+            except OSError:
+                self.closed = True
+                return
+
+
+class _RelayHandler(socketserver.BaseRequestHandler):
+    def handle(self):
+        relay = self.server.relay
+        sock = self.request
+        if sock.family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber = _Subscriber(sock)
+        writer = threading.Thread(target=subscriber.write_loop, name="relay-writer", daemon=True)
+        writer.start()
+        relay._add(subscriber)
+        try:
+            reader = sock.makefile("rb")
+            while not subscriber.closed:
+                message = _read_frame(reader)
+                if message is None:
+                    return
+                if message.get("op") == "sub":
+                    relay._subscribe(subscriber, message.get("channels", []))
+                elif message.get("op") == "pub":
+                    relay.publish(message["channel"], message.get("data"), message.get("origin"),
+                                  message.get("token"))
+        except (OSError, ValueError):
+            return
+        finally:
+            relay._remove(subscriber)
+            subscriber.outbox.put(None)
+
+
+class _TCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+if hasattr(socketserver, "ThreadingUnixStreamServer"):
+    class _UnixServer(socketserver.ThreadingUnixStreamServer):
+        daemon_threads = True
+else:  # Windows
+    _UnixServer = None
+
+
+class Relay:
+    def __init__(self, address=DEFAULT_ADDRESS):
+        self.address = address
+        self._lock = threading.Lock()
+        self._subscribers = set()
+        self._seq = {}
+        self._server = None
+        # stats
+        self.published = 0
+        self.dropped_subscribers = 0
+
+    def start(self):
+        family, addr = parse_address(self.address)
+        if family == socket.AF_UNIX:
+            if _UnixServer is None:
+                raise ValueError("unix:// relay addresses need a platform with Unix sockets")
+            if os.path.exists(addr):
+                os.unlink(addr)    # left behind by a launcher that was killed
+            self._server = _UnixServer(addr, _RelayHandler)
+        else:
+            self._server = _TCPServer(addr, _RelayHandler)
+        self._server.relay = self
+        threading.Thread(target=self._server.serve_forever, name="relay", daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            family, addr = parse_address(self.address)
+            if family == socket.AF_UNIX and os.path.exists(addr):
+                os.unlink(addr)
+            self._server = None
+
+    def _add(self, subscriber):
+        with self._lock:
+            self._subscribers.add(subscriber)
+
+    def _remove(self, subscriber):
+        with self._lock:
+            self._subscribers.discard(subscriber)
+
+    def _subscribe(self, subscriber, channels):
+        with self._lock:
+            subscriber.channels.update(channels)
+            body = json.dumps({"channel": None, "subscribed": sorted(subscriber.channels)}).encode("utf-8")
+            subscriber.outbox.put(struct.pack(">I", len(body)) + body)
+
+    def publish(self, channel, data, origin=None, token=None):
+        # numbered and queued under one lock: every subscriber gets the
+        # channel's messages in seq order
+        with self._lock:
+            seq = self._seq[channel] = self._seq.get(channel, 0) + 1
+            self.published += 1
+            body = json.dumps({"channel": channel, "seq": seq, "data": data, "origin": origin,
+                               "token": token}, separators=(",", ":"), default=str).encode("utf-8")
+            frame = struct.pack(">I", len(body)) + body
+            for subscriber in list(self._subscribers):
+                if channel not in subscriber.channels:
+                    continue
+                try:
+                    subscriber.outbox.put_nowait(frame)
+                except queue.Full:
+                    # too far behind to ever catch up: cut it off, it will
+                    # reconnect and see the seq gap
+                    self.dropped_subscribers += 1
+                    self._subscribers.discard(subscriber)
+                    subscriber.closed = True
+                    try:
+                        subscriber.sock.shutdown(socket.SHUT_RDWR)
+                    except OSError:
+                        pass
+        return seq
+
+    def stats(self):
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self.published,
+                    "dropped_subscribers": self.dropped_subscribers, "channels": dict(self._seq)}
+
+
+# -----------------------------
+# Relay Client (one per worker)
+# -----------------------------
+class RelayClient:
+    """Connection from a worker to the relay.
+
+    subscribe(channel, handler) registers handler(seq, data, origin); handlers
+    run one at a time on the client's reader thread, in seq order. The reader
+    reconnects with backoff if the relay goes away; a subscriber that missed
+    messages sees the gap in seq and has to resync.
+    """
+
+    def __init__(self, address=DEFAULT_ADDRESS, worker_id=0, timeout=2.0, backoff_max=5.0):
+        self.address = address
+        self.worker_id = worker_id
+        self.timeout = timeout
+        self.backoff_max = backoff_max
+        self._handlers = {}
+        self._sock = None
+        self._send_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._tokens = itertools.count(1)
+        self._waiting = {}          # token -> [Event, seq]
+        self._thread = None
+        # stats
+        self.connects = 0
+        self.publish_failures = 0
+
+    def subscribe(self, channel, handler):
+        with self._send_lock:
+            self._handlers.setdefault(channel, []).append(handler)
+            if self._sock is not None:
+                _send_frame(self._sock, {"op": "sub", "channels": [channel]})
+
+    def start(self, wait=5.0):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="relay-client", daemon=True)
+            self._thread.start()
+        return self._connected.wait(wait)
+
+    def _connect(self):
+        family, addr = parse_address(self.address)
+        sock = socket.socket(family, socket.SOCK_STREAM)
+        try:
+            sock.connect(addr)
+        except OSError:
+            sock.close()
+            raise
+        if family == socket.AF_INET:
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        with self._send_lock:
+            self._sock = sock
+            _send_frame(sock, {"op": "sub", "channels": sorted(self._handlers)})
+        self.connects += 1
+        return sock
+
+    def _run(self):
+        backoff = 0.1
+        while True:
+            try:
+                sock = self._connect()
+            except OSError:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+                continue
+            backoff = 0.1
+            reader = sock.makefile("rb")
+            try:
+                while True:
+                    message = _read_frame(reader)
+                    if message is None:
+                        break
+                    self._dispatch(message)
+            except (OSError, ValueError) as e:
+                print(f"[relay] connection to {self.address} lost: {e}")
+            self._connected.clear()
+            with self._send_lock:
+                self._sock = None
+            try:
+                sock.close()
+            except OSError:
+                pass
+
+    def _dispatch(self, message):
+        if message["channel"] is None:
+            # the relay acknowledged our subscriptions: nothing published
+            # from here on is missed
+            self._connected.set()
+            return
+        channel, seq, data, origin = message["channel"], message["seq"], message["data"], message["origin"]
+        for handler in self._handlers.get(channel, ()):
+            try:
+                handler(seq, data, origin)
+            except Exception as e:
+                print(f"[relay] {channel} handler failed: {e}")
+        token = message.get("token")
+        if token is not None and origin == self.worker_id:
+            waiter = self._waiting.get(token)
+            if waiter is not None:
+                waiter[1] = seq
+                waiter[0].set()
+
+    def _send(self, message):
+        with self._send_lock:
+            if self._sock is None:
+                raise ConnectionError("not connected to the relay")
+            _send_frame(self._sock, message)
+
+    def publish(self, channel, data, wait=False):
+        """Publish to every worker. Returns True once sent, None if the relay
+        is unreachable. With wait=True, block until this worker has handled its
+        own message and return its seq instead (None on timeout/failure)."""
+        message = {"op": "pub", "channel": channel, "data": data, "origin": self.worker_id}
+        waiter = None
+        if wait:
+            message["token"] = token = next(self._tokens)
+            waiter = self._waiting[token] = [threading.Event(), None]
+        try:
+            self._send(message)
+        except OSError as e:
+            self.publish_failures += 1
+            print(f"[relay] publish to {channel} failed: {e}")
+            if waiter is not None:
+                del self._waiting[token]
+            return None
+        if waiter is None:
+            return True
+        waiter[0].wait(self.timeout)
+        del self._waiting[token]
+        return waiter[1]
+
+    def stats(self):
+        return {"address": self.address, "worker": self.worker_id, "connected": self._connected.is_set(),
+                "connects": self.connects, "publish_failures": self.publish_failures}
+
+
+# -----------------------------
+# Socket.IO Client Manager
+# -----------------------------
+def relay_manager(client, channel="socketio"):
+    """python-socketio client manager that fans emits out through the relay,
+    so an emit on any worker reaches clients connected to every worker.
+    Imported lazily: the app must have set up its async mode first."""
+    from socketio import PubSubManager
+
+    class RelayManager(PubSubManager):
+        name = "opti-relay"
+
+        def __init__(self):
+            super().__init__(channel=channel)
+            # python-socketio only starts the listener (_listen) once the
+            # first client connects to this worker; until then there is
+            # nobody to deliver to, so a full inbox just drops
+            self._inbox = queue.Queue(maxsize=SUBSCRIBER_QUEUE_MAX)
+            client.subscribe(channel, self._receive)
+
+        def _receive(self, seq, data, origin):
+            try:
+                self._inbox.put_nowait(data)
+            except queue.Full:
+                pass
+
+        def _publish(self, data):
+            client.publish(self.channel, data)
+
+        def _listen(self):
+            while True:
+                yield self._inbox.get()
+
+    return RelayManager()
+
+
+# -----------------------------
+# Serial Port Forwarding
+# -----------------------------
+class RelaySerial:
+    """Stand-in for SerialLink on workers that don't own the Arduino port:
+    send() forwards the line to the owner (see serve_serial)."""
+
+    def __init__(self, client, port, channel="serial"):
+        self._client = client
+        self.port = port
+        self.channel = channel
+        self.forwarded = 0
+
+    def send(self, line):
+        self.forwarded += 1
+        self._client.publish(self.channel, line)
+        return True
+
+    def stats(self):
+        return {"port": self.port, "owner": False, "forwarded": self.forwarded}
+
+
+def serve_serial(client, link, channel="serial"):
+    """On the owning worker: write lines forwarded by the other workers."""
+    client.subscribe(channel, lambda seq, line, origin: link.send(line) if origin != client.worker_id else None)
@@ -0,0 +1,211 @@
+from datetime import datetime
+
+from opti_sql import period_range
+
+# -----------------------------
+# Attendance Rules
+# -----------------------------
+
+
+class ScanRules:
+    """Pay / late / undertime rules applied when a shift is opened or closed.
+
+    Shared by /api/scan and /api/scan_batch so live taps and replayed taps are
+    judged the same way. shift_start / shift_end are optional because the
+    opti_db schema has no late_minutes / undertime_minutes columns.
+    """
+
+    def __init__(self, rate_per_minute=5, cooldown_seconds=0, shift_start=None, shift_end=None):
+        self.rate_per_minute = rate_per_minute
+        self.cooldown_seconds = cooldown_seconds
+        self.shift_start = shift_start
+        self.shift_end = shift_end
+
+    @property
+    def time_in_columns(self):
+        return ["late_minutes"] if self.shift_start is not None else []
+
+    @property
+    def time_out_columns(self):
+        columns = ["duration", "salary"]
+        if self.shift_end is not None:
+            columns.append("undertime_minutes")
+        return columns
+
+    def late_minutes(self, at):
+        if self.shift_start is None or at.time() <= self.shift_start:
+            return 0
+        return int((at - datetime.combine(at.date(), self.shift_start)).total_seconds() // 60)
+
+    def undertime_minutes(self, at):
+        if self.shift_end is None or at.time() >= self.shift_end:
+            return 0
+        return int((datetime.combine(at.date(), self.shift_end) - at).total_seconds() // 60)
+
+    def time_in_fields(self, at):
+        if self.shift_start is None:
+            return {}
+        return {"late_minutes": self.late_minutes(at)}
+
+    def time_out_fields(self, time_in, at):
+        if isinstance(time_in, str):
+            time_in = datetime.strptime(time_in, "%Y-%m-%d %H:%M:%S")
+        duration_min = int((at - time_in).total_seconds() // 60)
+        fields = {"duration": duration_min, "salary": duration_min * self.rate_per_minute}
+        if self.shift_end is not None:
+            fields["undertime_minutes"] = self.undertime_minutes(at)
+        return fields
+
+
+# -----------------------------
+# Batched Scan Ingestion
+# -----------------------------
+MAX_SCAN_BATCH = 5000
+
+
+def parse_scanned_at(value):
+    """ISO-8601 string or epoch seconds -> naive local datetime in whole
+    seconds (None if unparseable). Truncated like /api/scan's `now`, so the
+    time_in used for duration / salary is the one DATETIME stores."""
+    try:
+        if isinstance(value, bool):
+            return None
+        if isinstance(value, (int, float)):
+            return datetime.fromtimestamp(value).replace(microsecond=0)
+        if isinstance(value, str):
+            parsed = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+            if parsed.tzinfo is not None:
+                parsed = parsed.astimezone().replace(tzinfo=None)
+            return parsed.replace(microsecond=0)
+    except (ValueError, OverflowError, OSError):
+        pass
+    return None
+
+
+def batch_employees(items, lookup):
+    """(employee ids, days) a batch of (uid, scanned_at) taps touches."""
+    employee_ids = set()
+    days = set()
+    for uid, at in items:
+        if at is None or not uid:
+            continue
+        employee = lookup(uid)
+        if employee:
+            employee_ids.add(employee["id_employee"])
+            days.add(at.date())
+    return employee_ids, days
+
+
+def plan_scan_batch(rules, items, lookup, existing):
+    """Replay taps against the day state in `existing` without touching MySQL.
+
+    items    -- [(uid, scanned_at datetime or None)] in terminal order
+    lookup   -- uid -> employee row or None
+    existing -- {(id_employee, date): {"id", "id_employee", "time_in", "time_out"}}
+
+    Taps are applied in scanned_at order (stable for ties) and the per-item
+    results come back in input order; time_in / time_out results carry the
+    employee's id_employee and name. Returns (results, inserts, updates):
+    new opti_rec rows and closed existing rows. A time_in and time_out of
+    the same shift inside one batch become a single complete insert.
+    """
+    results = [None] * len(items)
+    inserts, updates = [], []
+    state = dict(existing)
+    last_seen = {}
+
+    order = sorted(
+        (i for i, (_, at) in enumerate(items) if at is not None),
+        key=lambda i: items[i][1],
+    )
+    for i, (uid, at) in enumerate(items):
+        if at is None or not uid:
+            results[i] = {"status": "invalid"}
+
+    for i in order:
+        uid, at = items[i]
+        if not uid:
+            continue
+        prev = last_seen.get(uid)
+        if prev is not None and (at - prev).total_seconds() < rules.cooldown_seconds:
+            results[i] = {"status": "cooldown"}
+            continue
+        last_seen[uid] = at
+
+        employee = lookup(uid)
+        if not employee:
+            results[i] = {"status": "not_found"}
+            continue
+
+        key = (employee["id_employee"], at.date())
+        record = state.get(key)
+        if record is None:
+            record = {"id": None, "id_employee": employee["id_employee"], "time_in": at, "time_out": None}
+            record.update(rules.time_in_fields(at))
+            state[key] = record
+            inserts.append(record)
+            results[i] = {"status": "time_in", "id_employee": employee["id_employee"], "name": employee["name"],
+                          **rules.time_in_fields(at)}
+        elif not record["time_out"]:
+            fields = rules.time_out_fields(record["time_in"], at)
+            record["time_out"] = at
+            record.update(fields)
+            if record["id"] is not None:
+                updates.append(record)
+            results[i] = {"status": "time_out", "id_employee": employee["id_employee"], "name": employee["name"],
+                          **fields}
+        else:
+            results[i] = {"status": "already_done"}
+    return results, inserts, updates
+
+
+def apply_scan_batch(connection, rules, items, lookup, rollup=None):
+    """Plan and write a batch in one transaction: one range read of the days
+    involved, one multi-row INSERT for new shifts and one multi-row upsert
+    closing already-open shifts. A PayrollRollup, if given, is rebuilt for
+    the touched days in the same transaction. Returns (results, days_touched).
+
+    The range read is a locking read (FOR UPDATE), so a live scan from
+    another process can't insert a time_in for these employees and days
+    between the read and the commit. Within one process the caller also
+    holds ShiftState.lock_all_for() of the batch's employees."""
+    employee_ids, days = batch_employees(items, lookup)
+
+    existing = {}
+    cursor = connection.cursor()
+    if employee_ids:
+        start, end = period_range(min(days), max(days))
+        id_list = sorted(employee_ids)
+        cursor.execute(f"""
+            SELECT id, id_employee, time_in, time_out FROM opti_rec
+            WHERE time_in >= %s AND time_in < %s
+              AND id_employee IN ({",".join(["%s"] * len(id_list))})
+            ORDER BY id ASC
+            FOR UPDATE
+        """, (start, end, *id_list))
+        for row in cursor.fetchall():
+            existing.setdefault((row["id_employee"], row["time_in"].date()), row)
+
+    results, inserts, updates = plan_scan_batch(rules, items, lookup, existing)
+
+    out_columns = ["time_out"] + rules.time_out_columns
+    if inserts:
+        columns = ["id_employee", "time_in"] + rules.time_in_columns + out_columns
+        cursor.executemany(
+            f"INSERT INTO opti_rec ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))})",
+            [tuple(row.get(c, None if c == "time_out" else 0) for c in columns) for row in inserts],
+        )
+    if updates:
+        # pymysql only folds INSERT ... VALUES into one multi-row statement, so
+        # closing existing rows is written as an upsert on the primary key.
+        columns = ["id", "id_employee", "time_in"] + out_columns
+        cursor.executemany(
+            f"INSERT INTO opti_rec ({', '.join(columns)}) VALUES ({', '.join(['%s'] * len(columns))}) "
+            f"ON DUPLICATE KEY UPDATE {', '.join(f'{c}=VALUES({c})' for c in out_columns)}",
+            [tuple(row[c] for c in columns) for row in updates],
+        )
+    touched = {row["time_in"].date() for row in inserts + updates}
+    if rollup is not None and touched:
+        rollup.rebuild(cursor, min(touched), max(touched))
+    connection.commit()
+    return results, touched
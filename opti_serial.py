@@ -0,0 +1,324 @@
+import os
+import queue
+import threading
+import time
+
+from opti_async import blocking_call
+from opti_metrics import metrics
+
+# -----------------------------
+# Arduino Serial Link
+# -----------------------------
+# One reader thread owns the port: it opens it (retrying with exponential
+# backoff while it is missing), blocks in read() until bytes arrive, splits
+# them into lines and hands each line to on_line. Writes (beeps, forwarded
+# UIDs) go through a bounded queue drained by a writer thread, so request
+# threads never block on the serial port; while the port is down queued
+# writes are dropped and counted rather than replayed late. Port calls go
+# through blocking_call so under eventlet they run on a real OS thread
+# instead of stalling every green thread.
+
+
+class SerialLink:
+    def __init__(self, port, baudrate=9600, on_line=None, open_serial=None, settle_seconds=2,
+                 read_timeout=1, backoff_initial=0.5, backoff_max=30, write_queue_max=256):
+        self.port = port
+        self.baudrate = baudrate
+        self.on_line = on_line
+        self._open_serial = open_serial or self._pyserial
+        self.settle_seconds = settle_seconds
+        self.read_timeout = read_timeout
+        self.backoff_initial = backoff_initial
+        self.backoff_max = backoff_max
+        self._writes = queue.Queue(maxsize=write_queue_max)
+        self._serial = None
+        self._serial_lock = threading.Lock()
+        self._connected = threading.Event()
+        self._stop = threading.Event()
+        self._threads = []
+        # stats
+        self.connects = 0
+        self.lines_in = 0
+        self.lines_out = 0
+        self.dropped_writes = 0
+        self.last_error = None
+
+    def _pyserial(self):
+        import serial
+        return serial.Serial(self.port, self.baudrate, timeout=self.read_timeout, write_timeout=1)
+
+    @property
+    def connected(self):
+        return self._connected.is_set()
+
+    # -- lifecycle ---------------------------------------------------------
+    def start(self):
+        if self._open_serial == self._pyserial:
+            try:
+                import serial  # noqa: F401
+            except ImportError:
+                print("pyserial not installed: Arduino disabled.")
+                return
+        for target, name in ((self._read_loop, "arduino-reader"), (self._write_loop, "arduino-writer")):
+            thread = threading.Thread(target=target, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def stop(self, timeout=2):
+        self._stop.set()
+        try:
+            self._writes.put_nowait(None)
+        except queue.Full:
+            pass    # the writer has lines to get, and sees _stop on the next one
+        self._disconnect()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def wait_connected(self, timeout=None):
+        return self._connected.wait(timeout)
+
+    # -- connection --------------------------------------------------------
+    def _connect(self):
+        backoff = self.backoff_initial
+        failed = False
+        while not self._stop.is_set():
+            try:
+                ser = blocking_call(self._open_serial)
+            except Exception as e:
+                self.last_error = str(e)
+                if not failed:
+                    print(f"Arduino not connected ({self.port}): {e}; retrying.")
+                    failed = True
+                self._stop.wait(backoff)
+                backoff = min(backoff * 2, self.backoff_max)
+                continue
+            if self.settle_seconds:
+                # opening the port resets the board; let the sketch boot
+                self._stop.wait(self.settle_seconds)
+            with self._serial_lock:
+                self._serial = ser
+            self.connects += 1
+            self._connected.set()
+            print(f"Arduino connected on {self.port}.")
+            return ser
+        return None
+
+    def _disconnect(self, error=None):
+        self._connected.clear()
+        with self._serial_lock:
+            ser, self._serial = self._serial, None
+        if ser is not None:
+            if error is not None:
+                self.last_error = str(error)
+                print(f"Arduino connection lost ({self.port}): {error}")
+            try:
+                ser.close()
+            except Exception:
+                pass
+
+    # -- reader thread -----------------------------------------------------
+    def _read_loop(self):
+        while not self._stop.is_set():
+            ser = self._connect()
+            if ser is None:
+                return
+            buffer = b""
+            while not self._stop.is_set():
+                try:
+                    # blocks until at least one byte (or read_timeout), then
+                    # takes whatever else is already waiting
+                    chunk = blocking_call(ser.read, ser.in_waiting or 1)
+                except Exception as e:
+                    if not self._stop.is_set():
+                        self._disconnect(e)
+                    break
+                if not chunk:
+                    continue
+                buffer += chunk
+                *lines, buffer = buffer.split(b"\n")
+                for raw in lines:
+                    line = raw.decode(errors="replace").strip()
+                    if not line:
+                        continue
+                    self.lines_in += 1
+                    if self.on_line is not None:
+                        try:
+                            self.on_line(line)
+                        except Exception as e:
+                            print(f"Arduino line handler failed: {e}")
+
+    # -- writer thread -----------------------------------------------------
+    def send(self, line):
+        """Queue one line for the Arduino; never blocks. False if dropped."""
+        if not self.connected:
+            self.dropped_writes += 1
+            return False
+        try:
+            self._writes.put_nowait(f"{line}\n".encode())
+        except queue.Full:
+            self.dropped_writes += 1
+            return False
+        return True
+
+    def _write_loop(self):
+        while True:
+            data = self._writes.get()
+            if data is None or self._stop.is_set():
+                return
+            with self._serial_lock:
+                ser = self._serial
+            if ser is None:
+                self.dropped_writes += 1
+                continue
+            try:
+                started = time.perf_counter()
+                blocking_call(ser.write, data)
+                metrics.histogram("serial_write_seconds", help="Arduino serial write latency").observe(
+                    time.perf_counter() - started)
+                self.lines_out += 1
+            except Exception as e:
+                self.dropped_writes += 1
+                self._disconnect(e)
+
+    def stats(self):
+        return {
+            "port": self.port,
+            "connected": self.connected,
+            "connects": self.connects,
+            "lines_in": self.lines_in,
+            "lines_out": self.lines_out,
+            "dropped_writes": self.dropped_writes,
+            "write_queue": self._writes.qsize(),
+            "last_error": self.last_error,
+        }
+
+
+# -----------------------------
+# Batched Fan-out
+# -----------------------------
+class LineBatcher:
+    """Collects lines (or any items) and calls flush(items) at most once per
+    interval.
+
+    The flusher thread sleeps until an item arrives, then waits `interval`
+    (or until max_batch items are pending) so a burst becomes one emit.
+    Nothing runs until start(); items added before that are kept."""
+
+    def __init__(self, flush, interval=0.05, max_batch=100, name="arduino-fanout"):
+        self._flush = flush
+        self.interval = interval
+        self.max_batch = max_batch
+        self.name = name
+        self._pending = []
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+            self._thread.start()
+        return self
+
+    def add(self, line):
+        with self._cond:
+            self._pending.append(line)
+            self._cond.notify()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending)
+                deadline = time.monotonic() + self.interval
+                while len(self._pending) < self.max_batch:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                lines, self._pending = self._pending, []
+            try:
+                self._flush(lines)
+            except Exception as e:
+                print(f"{self.name} flush failed: {e}")
+
+
+# -----------------------------
+# pty Fake Arduino (POSIX)
+# -----------------------------
+class FakeArduino:
+    """Pseudo-terminal standing in for the board: point SerialLink at
+    fake.port, write lines from the "device" side with send(), read what the
+    app wrote with readline(), and unplug()/plug() to drop the port."""
+
+    def __init__(self):
+        self.plug()
+
+    def plug(self):
+        import tty
+        self._master, slave = os.openpty()
+        tty.setraw(slave)
+        self.port = os.ttyname(slave)
+        self._slave = slave
+        self._buffer = b""
+
+    def unplug(self):
+        for fd in (self._master, self._slave):
+            try:
+                os.close(fd)
+            except OSError:
+                pass
+
+    def send(self, line):
+        os.write(self._master, f"{line}\n".encode())
+
+    def readline(self, timeout=2):
+        import select
+        deadline = time.monotonic() + timeout
+        while b"\n" not in self._buffer:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not select.select([self._master], [], [], remaining)[0]:
+                return None
+            self._buffer += os.read(self._master, 1024)
+        line, self._buffer = self._buffer.split(b"\n", 1)
+        return line.decode()
+
+
+def _self_check():
+    # python opti_serial.py: round-trip, burst coalescing and reconnect
+    # against FakeArduino (needs pyserial and a POSIX pty)
+    fake = FakeArduino()
+    batches = []
+    batcher = LineBatcher(batches.append, interval=0.05).start()
+    link = SerialLink(fake.port, on_line=batcher.add, settle_seconds=0, read_timeout=0.2,
+                      backoff_initial=0.05, backoff_max=0.2)
+    link.start()
+    assert link.wait_connected(2), "never connected"
+
+    for i in range(20):
+        fake.send(f"UID{i}")
+    time.sleep(0.3)
+    lines = [line for batch in batches for line in batch]
+    assert lines == [f"UID{i}" for i in range(20)], lines
+    print(f"burst of 20 lines -> {len(batches)} emit(s)")
+
+    link.send("BEEP_SUCCESS")
+    assert fake.readline() == "BEEP_SUCCESS"
+
+    port = fake.port
+    fake.unplug()
+    deadline = time.monotonic() + 2
+    while link.connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert not link.connected, "disconnect not noticed"
+    fake.plug()
+    link.port = fake.port
+    assert link.wait_connected(2), "did not reconnect"
+    fake.send("AFTER")
+    time.sleep(0.2)
+    assert batches[-1][-1] == "AFTER"
+    print(f"reconnected ({port} -> {fake.port}), stats: {link.stats()}")
+    link.stop()
+    fake.unplug()
+
+
+if __name__ == "__main__":
+    _self_check()
@@ -0,0 +1,197 @@
+import json
+import logging
+import logging.handlers
+import queue
+import re
+import threading
+from datetime import datetime
+
+import pymysql
+from flask import has_request_context, request
+
+from opti_pool import PoolTimeout
+
+# -----------------------------
+# Slow Query Log
+# -----------------------------
+# InstrumentedCursor (opti_metrics.py) hands every statement's duration to
+# SlowQueryLog.observe; anything at or over threshold_ms is written as one
+# JSON line to a rotating log file and aggregated in memory per normalized
+# statement (literals and placeholders -> ?, IN / VALUES lists collapsed):
+#
+#   {"ts": ..., "ms": 412.7, "rows": 1830, "route": "/admin_dashboard",
+#    "sql": "SELECT ... WHERE opti_rec.time_in >= ? AND ...", "params": ["datetime", "datetime"]}
+#
+# Parameter values are never logged, only their types. The first time a
+# normalized statement is slow its EXPLAIN plan is captured once on a
+# background thread (with its own pooled connection, so the request that hit
+# the slow query doesn't wait for it) and kept alongside it for
+# /admin/diagnostics.
+
+EXPLAINABLE = ("select", "insert", "update", "delete", "replace")
+
+_STRING = re.compile(r"'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_PLACEHOLDER = re.compile(r"%\(\w+\)s|%s")
+_IN_LIST = re.compile(r"\bIN\s*\(\s*\?(?:\s*,\s*\?)*\s*\)", re.I)
+_VALUES_LIST = re.compile(r"(\(\s*\?(?:\s*,\s*\?)*\s*\))(?:\s*,\s*\(\s*\?(?:\s*,\s*\?)*\s*\))+")
+_SPACE = re.compile(r"\s+")
+
+
+def normalize_sql(query):
+    if isinstance(query, bytes):
+        query = query.decode("utf-8", "replace")
+    sql = _STRING.sub("?", query)
+    sql = _PLACEHOLDER.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _IN_LIST.sub("IN (?+)", sql)
+    sql = _VALUES_LIST.sub(r"\1, ...", sql)
+    return _SPACE.sub(" ", sql).strip()
+
+
+def params_shape(args, limit=20):
+    """Types of the bound parameters, never their values."""
+    if args is None:
+        return None
+    if isinstance(args, dict):
+        return {k: type(v).__name__ for k, v in list(args.items())[:limit]}
+    if isinstance(args, (list, tuple)):
+        shape = [type(v).__name__ for v in args[:limit]]
+        if len(args) > limit:
+            shape.append(f"+{len(args) - limit} more")
+        return shape
+    return type(args).__name__
+
+
+class SlowQueryLog:
+    def __init__(self, pool, threshold_ms=200, path="slow_queries.log", max_bytes=5 * 1024 * 1024,
+                 backup_count=3, max_statements=500):
+        self.pool = pool
+        self.threshold = threshold_ms / 1000
+        self.max_statements = max_statements
+        self._lock = threading.Lock()
+        self._statements = {}            # normalized sql -> aggregate + plan
+        self._explain_queue = queue.Queue(maxsize=100)
+        self._explainer = None
+
+        # the log file is opened by the first slow query, not at import
+        self.path = path
+        self._max_bytes = max_bytes
+        self._backup_count = backup_count
+        self._log = None
+
+        # stats
+        self.slow = 0
+        self.explained = 0
+        self.explain_failures = 0
+
+    def _open_log(self):
+        with self._lock:
+            if self._log is None:
+                log = logging.getLogger(f"opti.slow_queries.{self.path}")
+                log.setLevel(logging.INFO)
+                log.propagate = False
+                if not log.handlers:
+                    handler = logging.handlers.RotatingFileHandler(self.path, maxBytes=self._max_bytes,
+                                                                   backupCount=self._backup_count,
+                                                                   encoding="utf-8")
+                    handler.setFormatter(logging.Formatter("%(message)s"))
+                    log.addHandler(handler)
+                self._log = log
+        return self._log
+
+    def observe(self, cursor, query, args, seconds):
+        if seconds < self.threshold:
+            return
+        log = self._log or self._open_log()
+        sql = normalize_sql(query)
+        ms = round(seconds * 1000, 3)
+        rows = cursor.rowcount if cursor.rowcount is not None and cursor.rowcount >= 0 else None
+        route = request.path if has_request_context() else None
+        shape = params_shape(args)
+        now = datetime.now().isoformat(timespec="seconds")
+        log.info(json.dumps({"ts": now, "ms": ms, "rows": rows, "route": route,
+                             "sql": sql, "params": shape}, default=str))
+
+        explain = False
+        with self._lock:
+            self.slow += 1
+            entry = self._statements.get(sql)
+            if entry is None:
+                if len(self._statements) >= self.max_statements:
+                    return
+                entry = self._statements[sql] = {
+                    "sql": sql, "count": 0, "total_ms": 0.0, "max_ms": 0.0,
+                    "plan": None, "plan_error": None, "explain_pending": False,
+                }
+            entry["count"] += 1
+            entry["total_ms"] = round(entry["total_ms"] + ms, 3)
+            entry["max_ms"] = max(entry["max_ms"], ms)
+            entry.update(last_ms=ms, last_rows=rows, last_seen=now, route=route, params=shape)
+            if (entry["plan"] is None and not entry["explain_pending"]
+                    and sql.split(" ", 1)[0].lower() in EXPLAINABLE):
+                entry["explain_pending"] = explain = True
+
+        if explain:
+            try:
+                # the literal statement: EXPLAIN needs the real values
+                full_sql = cursor.mogrify(query, args)
+                self._explain_queue.put_nowait((sql, full_sql))
+            except Exception:
+                with self._lock:
+                    entry["explain_pending"] = False
+                return
+            self._start_explainer()
+
+    # -- EXPLAIN capture -----------------------------------------------------
+    def _start_explainer(self):
+        with self._lock:
+            if self._explainer is None:
+                self._explainer = threading.Thread(target=self._explain_loop, name="slow-query-explain",
+                                                   daemon=True)
+                self._explainer.start()
+
+    def _explain_loop(self):
+        while True:
+            sql, full_sql = self._explain_queue.get()
+            plan, error = None, None
+            try:
+                with self.pool.connection(timeout=1) as conn:
+                    # plain DictCursor: the EXPLAIN itself isn't instrumented
+                    with conn.cursor(pymysql.cursors.DictCursor) as cursor:
+                        cursor.execute("EXPLAIN " + full_sql)
+                        plan = cursor.fetchall()
+            except PoolTimeout:
+                # pool is busy; try again the next time the statement is slow
+                pass
+            except Exception as e:
+                error = str(e)
+            with self._lock:
+                entry = self._statements.get(sql)
+                if entry is not None:
+                    entry["explain_pending"] = False
+                    entry["plan"] = plan
+                    entry["plan_error"] = error
+                if plan is not None:
+                    self.explained += 1
+                elif error is not None:
+                    self.explain_failures += 1
+            if plan is not None or error is not None:
+                self._log.info(json.dumps({"ts": datetime.now().isoformat(timespec="seconds"),
+                                           "explain": sql, "plan": plan, "error": error}, default=str))
+
+    def statements(self):
+        """Aggregates of every slow statement, worst total time first."""
+        with self._lock:
+            entries = [dict(e) for e in self._statements.values()]
+        entries.sort(key=lambda e: e["total_ms"], reverse=True)
+        return entries
+
+    def reset(self):
+        with self._lock:
+            self._statements.clear()
+
+    def stats(self):
+        return {"threshold_ms": round(self.threshold * 1000, 3), "statements": len(self._statements),
+                "slow": self.slow, "explained": self.explained,
+                "explain_failures": self.explain_failures}
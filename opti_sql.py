@@ -0,0 +1,135 @@
+import sys
+from datetime import datetime, date, timedelta, time as dt_time
+
+import pymysql
+
+# -----------------------------
+# Sargable Date Ranges
+# -----------------------------
+# Filtering with DATE(opti_rec.time_in)=%s wraps the column in a function, so
+# MySQL cannot use an index on time_in and scans the whole history. Routes
+# compare the raw column against half-open bounds instead:
+#     time_in >= %s AND time_in < %s
+
+
+def day_range(day=None):
+    """[00:00 of day, 00:00 of the next day) as datetimes."""
+    if day is None:
+        day = date.today()
+    elif isinstance(day, datetime):
+        day = day.date()
+    start = datetime.combine(day, dt_time.min)
+    return start, start + timedelta(days=1)
+
+
+def period_range(first, last):
+    """Half-open bounds covering the whole days first..last (inclusive)."""
+    return day_range(first)[0], day_range(last)[1]
+
+
+# -----------------------------
+# Employee Deletion
+# -----------------------------
+def delete_employee(connection, emp_id):
+    """Delete one employee in a single transaction; returns rows deleted.
+
+    Ids are sparse and stable: no other row is renumbered, and the freed id
+    is reused by the next add (see opti_cache.IdAllocator). Their attendance
+    and rollup rows go with them through the ON DELETE CASCADE foreign keys.
+    """
+    cursor = connection.cursor()
+    cursor.execute("DELETE FROM opti WHERE id_employee=%s", (emp_id,))
+    deleted = cursor.rowcount
+    connection.commit()
+    return deleted
+
+
+# -----------------------------
+# Index Plan Check
+# -----------------------------
+# EXPLAIN for every hot query, with the index each one is expected to use.
+# Run after applying migrations/001_opti_rec_time_indexes.sql (and, for
+# opti_test, 002_opti_daily_pay.sql):
+#     python opti_sql.py opti_db
+# Note: on a nearly empty opti_rec the optimizer may legitimately prefer a
+# full scan; seed some history first for a meaningful plan.
+HOT_QUERY_PLANS = [
+    ("employee day lookup",
+     "SELECT * FROM opti_rec WHERE id_employee=%s AND time_in >= %s AND time_in < %s",
+     lambda start, end: (1, start, end),
+     "idx_opti_rec_emp_time"),
+    ("shift_state rebuild",
+     "SELECT id, id_employee, time_in, time_out FROM opti_rec WHERE time_in >= %s AND time_in < %s",
+     lambda start, end: (start, end),
+     "idx_opti_rec_time_in"),
+    ("admin_dashboard / export records",
+     """SELECT opti.name, opti_rec.time_in, opti_rec.time_out, opti_rec.duration, opti_rec.salary
+        FROM opti_rec
+        JOIN opti ON opti_rec.id_employee = opti.id_employee
+        WHERE opti_rec.time_in >= %s AND opti_rec.time_in < %s
+        ORDER BY opti_rec.time_in DESC""",
+     lambda start, end: (start, end),
+     "idx_opti_rec_time_in"),
+    ("admin_dashboard present",
+     "SELECT COUNT(*) AS present FROM opti_rec WHERE time_in >= %s AND time_in < %s",
+     lambda start, end: (start, end),
+     "idx_opti_rec_time_in"),
+    ("admin_dashboard salary",
+     "SELECT IFNULL(SUM(salary),0) AS total_salary FROM opti_rec WHERE time_in >= %s AND time_in < %s",
+     lambda start, end: (start, end),
+     "idx_opti_rec_time_in"),
+    ("monthly_payroll (opti_daily_pay rollup, opti_test only)",
+     """SELECT o.name,
+               SUM(p.minutes) AS total_minutes,
+               SUM(p.salary) AS total_salary,
+               SUM(p.late_minutes) AS total_late,
+               SUM(p.undertime_minutes) AS total_undertime
+        FROM opti_daily_pay p
+        JOIN opti o ON p.id_employee = o.id_employee
+        WHERE p.work_date >= %s AND p.work_date <= %s
+        GROUP BY o.id_employee
+        ORDER BY o.id_employee ASC""",
+     lambda start, end: (start.date() - timedelta(days=30), start.date()),
+     "idx_opti_daily_pay_date"),
+]
+
+
+def explain(cursor, sql, params=None):
+    cursor.execute("EXPLAIN " + sql, params)
+    return cursor.fetchall()
+
+
+def check_index_plans(cursor, day=None):
+    """Return (name, expected_index, used_key, ok) for each hot query; ok is
+    None for a query on a table this database doesn't have (opti_daily_pay
+    exists in opti_test only)."""
+    start, end = day_range(day)
+    results = []
+    for name, sql, make_params, expected in HOT_QUERY_PLANS:
+        try:
+            plan = explain(cursor, sql, make_params(start, end))
+        except pymysql.err.ProgrammingError as e:
+            if e.args[0] != 1146:   # ER_NO_SUCH_TABLE
+                raise
+            results.append((name, expected, None, None))
+            continue
+        rec_rows = [row for row in plan if row.get("table") in ("opti_rec", "r", "p")]
+        used = rec_rows[0].get("key") if rec_rows else None
+        results.append((name, expected, used, used == expected))
+    return results
+
+
+if __name__ == "__main__":
+    database = sys.argv[1] if len(sys.argv) > 1 else "opti_db"
+    conn = pymysql.connect(host="localhost", user="root", password="saquilon",
+                           database=database, cursorclass=pymysql.cursors.DictCursor)
+    failed = 0
+    with conn.cursor() as cur:
+        for name, expected, used, ok in check_index_plans(cur):
+            if ok is None:
+                print(f"SKIP {name}: table not in {database}")
+                continue
+            print(f"{'OK  ' if ok else 'FAIL'} {name}: key={used} (expected {expected})")
+            failed += not ok
+    conn.close()
+    sys.exit(1 if failed else 0)
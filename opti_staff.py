@@ -1,66 +1,188 @@
-from flask import Flask, render_template, request, redirect, url_for, session, jsonify, send_file
+import os
+from opti_async import setup_async_mode
+
+# "threading" (default) or "eventlet" (cooperative green threads: thousands
+# of idle Socket.IO clients on one process, see opti_async.py). Runs before
+# every other import so eventlet can patch sockets, threads and time.
+ASYNC_MODE = setup_async_mode(os.environ.get("OPTI_ASYNC_MODE", "threading"))
+
+from flask import Flask, render_template, request, redirect, url_for, session, jsonify, Response
 from flask_socketio import SocketIO
 from datetime import datetime
 import pymysql
-from werkzeug.security import generate_password_hash, check_password_hash
-import io, csv
-import threading, time
+from opti_pool import ConnectionPool, init_app, get_db
+import opti_metrics
+from opti_metrics import metrics, InstrumentedCursor, InstrumentedConnection, instrument_socketio
+from opti_cache import RfidIndex, ShiftState, IdAllocator, DailySummary
+from opti_sql import day_range, delete_employee
+from opti_scan import ScanRules, MAX_SCAN_BATCH, parse_scanned_at, batch_employees, apply_scan_batch
+import opti_writer
+from opti_writer import AttendanceWriter
+from opti_serial import SerialLink, LineBatcher
+from opti_broadcast import AttendanceBroadcaster
+from opti_changes import ChangeLog, changes_since
+from opti_httpcache import ResponseCache
+from opti_slowlog import SlowQueryLog
+import opti_health
+from opti_health import Warmup
+from opti_relay import RelayClient, RelaySerial, relay_manager, serve_serial
+from opti_payroll import parse_recompute_args, recompute_payroll
+from opti_pages import attendance_page, employees_page
+from opti_export import (parse_export_args, export_filename, stream_attendance_csv,
+                         stream_attendance_xlsx, XLSX_MIMETYPE)
+from werkzeug.security import check_password_hash
 
 # -----------------------------
 # App Config
 # -----------------------------
 app = Flask(__name__)
-socketio = SocketIO(app, cors_allowed_origins="*", async_mode="threading")
+socketio = SocketIO(cors_allowed_origins="*", async_mode=ASYNC_MODE)   # bound to app in create_app()
+instrument_socketio(socketio)
 app.secret_key = "blackpower"
 
+# opti_workers.py runs several copies of this app behind one port and sets
+# these for each of them; unset, the app is a single process. Workers share
+# state through the relay (opti_relay.py) and only worker 0 opens the
+# Arduino port. Browsers must use the websocket transport: a long-polling
+# session's requests could land on different workers.
+RELAY_ADDRESS = os.environ.get("OPTI_RELAY")
+WORKER_ID = int(os.environ.get("OPTI_WORKER", "0"))
+SERIAL_OWNER = WORKER_ID == 0
+app.jinja_env.globals["socketio_websocket_only"] = RELAY_ADDRESS is not None
+
+# Scan updates go out as one "attendance_batch" frame per room every
+# BROADCAST_INTERVAL_MS to clients that subscribe (see opti_broadcast.py).
+# Clients that don't (the mobile app) still get the original per-scan
+# "attendance_update"; None stops sending it.
+BROADCAST_INTERVAL_MS = 250
+BROADCAST_LEGACY_EVENT = "attendance_update"
+broadcaster = AttendanceBroadcaster(socketio, interval=BROADCAST_INTERVAL_MS / 1000,
+                                    legacy_event=BROADCAST_LEGACY_EVENT)
+
+# Versioned log of changed employee / today's attendance rows behind
+# /api/changes (see opti_changes.py).
+change_log = ChangeLog()
+
+# Dashboard / read API bodies cached until the next write, served with
+# ETag + Last-Modified (304s for pollers) and pre-gzipped (opti_httpcache.py).
+RESPONSE_CACHE_GZIP = True
+response_cache = ResponseCache(gzip_bodies=RESPONSE_CACHE_GZIP)
+
 # -----------------------------
 # MySQL Connection
 # -----------------------------
-connection = pymysql.connect(
-    host="localhost",
+DB_POOL_SIZE = 10          # max concurrent connections (scan + dashboard + export)
+DB_POOL_TIMEOUT = 5        # seconds a request waits for a free connection -> 503
+DB_PING_INTERVAL = 30      # idle seconds before a pooled connection is health-checked
+DB_CONNECT_TIMEOUT = 3     # seconds before an unreachable MySQL fails a connect (503)
+DB_READ_TIMEOUT = 30       # seconds a hung MySQL (handshake or statement) may stall a request
+DB_HOST = os.environ.get("OPTI_DB_HOST", "localhost")
+DB_PORT = int(os.environ.get("OPTI_DB_PORT", "3306"))
+DB_NAME = os.environ.get("OPTI_DB_NAME", "opti_db")   # opti_bench points this at its scratch db
+
+db_pool = ConnectionPool(
+    size=DB_POOL_SIZE,
+    timeout=DB_POOL_TIMEOUT,
+    ping_interval=DB_PING_INTERVAL,
+    host=DB_HOST,
+    port=DB_PORT,
+    connect_timeout=DB_CONNECT_TIMEOUT,
+    read_timeout=DB_READ_TIMEOUT,
     user="root",
     password="saquilon",
-    database="opti_db",
-    cursorclass=pymysql.cursors.DictCursor
+    database=DB_NAME,
+    cursorclass=InstrumentedCursor,             # DictCursor + per-statement timings (opti_metrics.py)
+    connection_class=InstrumentedConnection     # commit timings
 )
-cursor = connection.cursor()
+init_app(app, db_pool)
+
+# Statements slower than SLOW_QUERY_MS go to a rotating JSON-lines log with
+# their EXPLAIN plan captured once (opti_slowlog.py, /admin/diagnostics).
+SLOW_QUERY_MS = 200
+SLOW_QUERY_LOG = "slow_queries_%s.log"
+SLOW_QUERY_PATH = SLOW_QUERY_LOG % (DB_NAME if RELAY_ADDRESS is None else f"{DB_NAME}.w{WORKER_ID}")
+slow_query_log = SlowQueryLog(db_pool, threshold_ms=SLOW_QUERY_MS, path=SLOW_QUERY_PATH)
+InstrumentedCursor.query_observer = slow_query_log.observe
+
+# RFID -> employee lookups for /api/scan; unknown uids are negatively cached
+RFID_NEGATIVE_TTL = 60
+rfid_index = RfidIndex(db_pool, negative_ttl=RFID_NEGATIVE_TTL)
+# Today's open/closed shift per employee, so scans don't re-read opti_rec
+shift_state = ShiftState(db_pool)
+# Smallest free id_employee for new employees
+id_allocator = IdAllocator(db_pool)
+# Ids are sparse: they stay stable on delete and the gap is reused by the
+# next add (no 1..n renumbering).
+# Dashboard counters kept up to date by scans / add / drop, rebuilt from
+# MySQL every SUMMARY_RECONCILE_SECONDS to catch drift
+SUMMARY_RECONCILE_SECONDS = 600
+daily_summary = DailySummary(db_pool)
+
+# -----------------------------
+# Attendance Settings
+# -----------------------------
+SALARY_PER_MINUTE = 5
+scan_rules = ScanRules(rate_per_minute=SALARY_PER_MINUTE)
+
+# Write-behind: acknowledge scans once journaled and group-commit them from a
+# writer thread (see opti_writer.py). Off by default: every scan commits inline.
+WRITE_BEHIND = False
+WRITE_BEHIND_FLUSH_MS = 50        # flush at least this often...
+WRITE_BEHIND_MAX_BATCH = 200      # ...or as soon as this many taps are queued
+WRITE_BEHIND_JOURNAL = "attendance_%s.journal"          # failed writes go to <journal>.dead
+WRITE_BEHIND_DRAIN_SECONDS = 5    # requests that need queued taps in MySQL wait this long, then 503
+if WRITE_BEHIND and RELAY_ADDRESS is not None:
+    # other workers re-read what this one wrote from MySQL, so with several
+    # workers a scan has to be committed before it is acknowledged
+    print("WRITE_BEHIND is not supported with several workers; scans commit inline")
+    WRITE_BEHIND = False
+
+attendance_writer = None
+if WRITE_BEHIND:
+    attendance_writer = AttendanceWriter(
+        db_pool,
+        WRITE_BEHIND_JOURNAL % DB_NAME,
+        flush_interval=WRITE_BEHIND_FLUSH_MS / 1000,
+        max_batch=WRITE_BEHIND_MAX_BATCH
+    )
+    opti_writer.init_app(app)
+
+    def drain_writes():
+        attendance_writer.ensure_drained(WRITE_BEHIND_DRAIN_SECONDS)
+
+    shift_state.before_rebuild = drain_writes
+    daily_summary.before_rebuild = drain_writes
+    response_cache.before_rebuild = drain_writes
 
 # -----------------------------
 # Admin Credentials
 # -----------------------------
 ADMIN_USERNAME = "admin"
-ADMIN_PASSWORD_HASH = generate_password_hash("admin123")
+# A werkzeug hash, not the password, so nothing is derived at import. Set
+# OPTI_ADMIN_PASSWORD_HASH to the output of
+#   python -c "from werkzeug.security import generate_password_hash as h; print(h('new password'))"
+# to change it; the default is the hash of "admin123".
+ADMIN_PASSWORD_HASH = os.environ.get(
+    "OPTI_ADMIN_PASSWORD_HASH",
+    "scrypt:32768:8:1$0v9eJ34E0plnLqRS$ec3ebab12a4091a2b713ee3712e731020e6f14d995fb0a5c5c1c9244423106a9c82e4a84b233feca146eba7d8a4b4490632d64c4b5780c60cefed270de07a2ba"
+)
 
 # -----------------------------
 # Arduino Setup
 # -----------------------------
-arduino = None
-arduino_connected = False
-try:
-    import serial
-    arduino = serial.Serial('COM3', 9600, timeout=1)
-    time.sleep(2)
-    arduino_connected = True
-    print("Arduino connected successfully.")
-except Exception as e:
-    print(f"Arduino not connected: {e}")
-
-# Arduino background thread
-def read_from_arduino():
-    if not arduino_connected: return
-    while True:
-        try:
-            if arduino.in_waiting > 0:
-                data = arduino.readline().decode().strip()
-                if data:
-                    socketio.emit("arduino_data", {"data": data})
-        except: pass
-        time.sleep(0.1)
-
-if arduino_connected:
-    thread = threading.Thread(target=read_from_arduino)
-    thread.daemon = True
-    thread.start()
+# SerialLink (opti_serial.py) owns the port from background threads: it
+# reconnects with backoff if the board is unplugged, and writes are queued so
+# request threads never wait on serial I/O. Lines from the board are batched
+# into one "arduino_data" emit per ARDUINO_EMIT_MS.
+ARDUINO_PORT = os.environ.get("OPTI_ARDUINO_PORT", "COM3")   # opti_bench storm uses a pty fake
+ARDUINO_BAUDRATE = 9600
+ARDUINO_EMIT_MS = 50
+
+arduino_events = LineBatcher(
+    lambda lines: socketio.emit("arduino_data", {"data": lines[-1], "lines": lines}),
+    interval=ARDUINO_EMIT_MS / 1000
+)
+arduino = SerialLink(ARDUINO_PORT, ARDUINO_BAUDRATE, on_line=arduino_events.add)
 
 # -----------------------------
 # Admin Web Routes
@@ -79,29 +201,32 @@ def log_in_admin():
     return render_template("admin_login.html", error="Invalid credentials")
 
 @app.route("/admin_dashboard")
+@response_cache.cached
 def admin_dashboard():
     if "admin" not in session:
         return redirect(url_for("landing_page"))
 
-    today = datetime.now().strftime("%Y-%m-%d")
+    # frames after this seq are replayed to the page when it subscribes, and
+    # /api/changes?since=changes_version patches the tables rendered below
+    broadcast_seq = broadcaster.seq
+    changes_version = change_log.version
+    connection = get_db()
+    cursor = connection.cursor()
+    day_start, day_end = day_range()
 
     cursor.execute("""
-        SELECT opti.name, opti_rec.time_in, opti_rec.time_out, opti_rec.duration, opti_rec.salary
+        SELECT opti_rec.id_employee, opti.name, opti_rec.time_in, opti_rec.time_out, opti_rec.duration, opti_rec.salary
         FROM opti_rec
         JOIN opti ON opti_rec.id_employee = opti.id_employee
-        WHERE DATE(opti_rec.time_in)=%s
+        WHERE opti_rec.time_in >= %s AND opti_rec.time_in < %s
         ORDER BY opti_rec.time_in DESC
-    """, (today,))
+    """, (day_start, day_end))
     records = cursor.fetchall()
 
-    cursor.execute("SELECT COUNT(*) AS total FROM opti")
-    total_employees = cursor.fetchone()["total"]
-
-    cursor.execute("SELECT COUNT(*) AS present FROM opti_rec WHERE DATE(time_in)=%s", (today,))
-    present_today = cursor.fetchone()["present"]
-
-    cursor.execute("SELECT IFNULL(SUM(salary),0) AS total_salary FROM opti_rec WHERE DATE(time_in)=%s", (today,))
-    total_salary = cursor.fetchone()["total_salary"]
+    summary = daily_summary.snapshot()
+    total_employees = summary["total_employees"]
+    present_today = summary["present"]
+    total_salary = summary["total_salary"]
 
     cursor.execute("SELECT * FROM opti ORDER BY id_employee ASC")
     employees = cursor.fetchall()
@@ -113,9 +238,64 @@ def admin_dashboard():
         present_today=present_today,
         total_salary=total_salary,
         records=records,
-        employees=employees
+        employees=employees,
+        broadcast_seq=broadcast_seq,
+        changes_version=changes_version,
+        today=day_start.date().isoformat()
     )
 
+@app.route("/admin/reconcile_summary", methods=["POST"])
+def reconcile_summary():
+    if "admin" not in session:
+        return redirect(url_for("landing_page"))
+    drift = daily_summary.reconcile()
+    response_cache.invalidate()
+    return jsonify({"status": "success", "drift": {k: {"cached": c, "actual": a} for k, (c, a) in drift.items()},
+                    "summary": daily_summary.snapshot()})
+
+@app.route("/admin/recompute_payroll", methods=["POST"])
+def admin_recompute_payroll():
+    # Re-price a period of history after a rate / shift window change:
+    # {"period": "custom", "from": "...", "to": "...", "rate_per_minute": 6,
+    #   "shift_start": "08:30", "shift_end": "17:30", "dry_run": true}
+    # Missing rules default to the live scan_rules; dry_run (the default) only
+    # reports totals. New scans keep using the Attendance Settings, so change
+    # those too when a new rule takes effect.
+    if "admin" not in session:
+        return redirect(url_for("landing_page"))
+    try:
+        first, last, rules, dry_run = parse_recompute_args(request.json or {}, scan_rules)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    if attendance_writer is not None:
+        attendance_writer.ensure_drained(WRITE_BEHIND_DRAIN_SECONDS)
+    try:
+        result = recompute_payroll(get_db(), rules, first, last, dry_run=dry_run, rollup=None)
+    except RuntimeError as e:
+        return jsonify({"status": "error", "error": str(e)}), 501
+    if not dry_run:
+        daily_summary.invalidate()
+        change_log.reset()
+        response_cache.invalidate()
+    return jsonify({"status": "success", **result})
+
+@app.route("/admin/diagnostics")
+def admin_diagnostics():
+    if "admin" not in session:
+        return redirect(url_for("landing_page"))
+    return render_template(
+        "admin_diagnostics.html",
+        stats=slow_query_log.stats(),
+        statements=slow_query_log.statements(),
+        log_path=SLOW_QUERY_PATH
+    )
+
+@app.route("/api/slow_queries")
+def api_slow_queries():
+    if "admin" not in session:
+        return jsonify({"status": "error", "error": "admin only"}), 403
+    return jsonify({**slow_query_log.stats(), "statements": slow_query_log.statements()})
+
 @app.route("/logout")
 def logout():
     session.pop("admin", None)
@@ -124,8 +304,56 @@ def logout():
 # -----------------------------
 # Web Routes for jQuery/AJAX (legacy dashboard)
 # -----------------------------
+def _insert_employee(connection, name, age, sex, email, number, rfid):
+    # Smallest available ID from id_allocator; if another process inserted
+    # the same id first, the primary key rejects it and we take the next one.
+    cursor = connection.cursor()
+    while True:
+        next_id = id_allocator.allocate()
+        try:
+            with daily_summary.recording():
+                cursor.execute(
+                    "INSERT INTO opti (id_employee, name, age, sex, email, number, rfid) VALUES (%s,%s,%s,%s,%s,%s,%s)",
+                    (next_id, name, age, sex, email, number, rfid)
+                )
+                connection.commit()
+                daily_summary.employee_added()
+            change_log.record("employees", next_id)
+            response_cache.invalidate()
+            return next_id
+        except pymysql.err.IntegrityError as e:
+            connection.rollback()
+            if "PRIMARY" not in str(e):
+                id_allocator.release(next_id)
+                raise
+
+def _employee_id(data):
+    # employ_id from a form (str) or a JSON body (str / int); ValueError -> 400
+    value = data.get("employ_id") if isinstance(data, dict) else None
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value <= 0:
+        raise ValueError("employ_id must be a positive integer")
+    return value
+
+def _drop_employee(emp_id):
+    if attendance_writer is not None:
+        # queued taps for this employee must land before the FK row goes away
+        attendance_writer.ensure_drained(WRITE_BEHIND_DRAIN_SECONDS)
+    delete_employee(get_db(), emp_id)
+    # the FK cascade also removed their attendance rows: recount
+    daily_summary.invalidate()
+    response_cache.invalidate()
+    rfid_index.discard(emp_id)
+    shift_state.forget(emp_id)
+    id_allocator.release(emp_id)
+    change_log.record("employees", emp_id)
+    change_log.record("attendance", emp_id)
+
 @app.route("/add_employee", methods=["POST"])
 def add_employee():
+    connection = get_db()
+    cursor = connection.cursor()
     data = request.form
     name = data.get('name_inp')
     age = data.get('age_inp')
@@ -134,65 +362,43 @@ def add_employee():
     number = data.get("num_inp")
     rfid = data.get('rfid_inp')
 
-    # Smallest available ID
-    cursor.execute("SELECT id_employee FROM opti ORDER BY id_employee ASC")
-    existing_ids = [row['id_employee'] for row in cursor.fetchall()]
-    next_id = 1
-    for eid in existing_ids:
-        if eid == next_id: next_id += 1
-        else: break
-
-    cursor.execute(
-        "INSERT INTO opti (id_employee, name, age, sex, email, number, rfid) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-        (next_id, name, age, sex, email, number, rfid)
-    )
-    connection.commit()
+    next_id = _insert_employee(connection, name, age, sex, email, number, rfid)
     cursor.execute("SELECT * FROM opti WHERE id_employee=%s", (next_id,))
     new_emp = cursor.fetchone()
+    rfid_index.put(new_emp)
     return jsonify(new_emp)
 
 @app.route("/drop_employee", methods=["POST"])
 def drop_employee():
-    emp_id = int(request.form.get("employ_id"))
-    cursor.execute("DELETE FROM opti WHERE id_employee=%s", (emp_id,))
-    connection.commit()
-    cursor.execute("SELECT id_employee FROM opti ORDER BY id_employee ASC")
-    employees = cursor.fetchall()
-    for index, emp in enumerate(employees, start=1):
-        if emp['id_employee'] != index:
-            cursor.execute("UPDATE opti SET id_employee=%s WHERE id_employee=%s", (index, emp['id_employee']))
-    connection.commit()
+    try:
+        emp_id = _employee_id(request.form)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    _drop_employee(emp_id)
     return jsonify({"status": "success"})
 
 @app.route("/export_excel")
 def export_excel():
-    today = datetime.now().strftime("%Y-%m-%d")
-    cursor.execute("""
-        SELECT opti.name, opti_rec.time_in, opti_rec.time_out, opti_rec.duration, opti_rec.salary
-        FROM opti_rec
-        JOIN opti ON opti_rec.id_employee = opti.id_employee
-        WHERE DATE(opti_rec.time_in)=%s
-        ORDER BY opti_rec.time_in DESC
-    """, (today,))
-    records = cursor.fetchall()
-
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Name", "Time In", "Time Out", "Duration (min)", "Salary"])
-    for r in records:
-        writer.writerow([
-            r["name"],
-            r["time_in"].strftime("%H:%M") if r["time_in"] else "",
-            r["time_out"].strftime("%H:%M") if r["time_out"] else "",
-            r.get("duration",""),
-            r.get("salary","")
-        ])
-    output.seek(0)
-    return send_file(
-        io.BytesIO(output.getvalue().encode()),
+    try:
+        first, last, employee = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return Response(
+        stream_attendance_csv(db_pool, first, last, employee),
         mimetype="text/csv",
-        as_attachment=True,
-        download_name=f"attendance_{today}.csv"
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(first, last, "csv")}"'}
+    )
+
+@app.route("/export_xlsx")
+def export_xlsx():
+    try:
+        first, last, employee = parse_export_args(request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return Response(
+        stream_attendance_xlsx(db_pool, first, last, employee, with_late_undertime=False),
+        mimetype=XLSX_MIMETYPE,
+        headers={"Content-Disposition": f'attachment; filename="{export_filename(first, last, "xlsx")}"'}
     )
 
 # -----------------------------
@@ -200,6 +406,8 @@ def export_excel():
 # -----------------------------
 @app.route("/api/add_employee", methods=["POST"])
 def api_add_employee():
+    connection = get_db()
+    cursor = connection.cursor()
     data = request.json
     name = data.get("name")
     age = data.get("age")
@@ -208,94 +416,295 @@ def api_add_employee():
     number = data.get("number")
     rfid = data.get("rfid")
 
-    # Smallest available ID
-    cursor.execute("SELECT id_employee FROM opti ORDER BY id_employee ASC")
-    existing_ids = [row['id_employee'] for row in cursor.fetchall()]
-    next_id = 1
-    for eid in existing_ids:
-        if eid == next_id: next_id += 1
-        else: break
-
-    cursor.execute(
-        "INSERT INTO opti (id_employee, name, age, sex, email, number, rfid) VALUES (%s,%s,%s,%s,%s,%s,%s)",
-        (next_id, name, age, sex, email, number, rfid)
-    )
-    connection.commit()
+    next_id = _insert_employee(connection, name, age, sex, email, number, rfid)
     cursor.execute("SELECT * FROM opti WHERE id_employee=%s", (next_id,))
     new_emp = cursor.fetchone()
+    rfid_index.put(new_emp)
     return jsonify({"status": "success", "employee": new_emp})
 
 @app.route("/api/drop_employee", methods=["POST"])
 def api_drop_employee():
-    data = request.json
-    emp_id = data.get("employ_id")
-    cursor.execute("DELETE FROM opti WHERE id_employee=%s", (emp_id,))
-    connection.commit()
-    cursor.execute("SELECT id_employee FROM opti ORDER BY id_employee ASC")
-    employees = cursor.fetchall()
-    for index, emp in enumerate(employees, start=1):
-        if emp['id_employee'] != index:
-            cursor.execute("UPDATE opti SET id_employee=%s WHERE id_employee=%s", (index, emp['id_employee']))
-    connection.commit()
+    try:
+        emp_id = _employee_id(request.get_json(silent=True))
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    _drop_employee(emp_id)
     return jsonify({"status": "success"})
 
 @app.route("/api/export_today")
+@response_cache.cached
 def api_export_today():
-    today = datetime.now().strftime("%Y-%m-%d")
+    connection = get_db()
+    cursor = connection.cursor()
+    day_start, day_end = day_range()
     cursor.execute("""
         SELECT opti.name, opti_rec.time_in, opti_rec.time_out, opti_rec.duration, opti_rec.salary
         FROM opti_rec
         JOIN opti ON opti_rec.id_employee = opti.id_employee
-        WHERE DATE(opti_rec.time_in)=%s
+        WHERE opti_rec.time_in >= %s AND opti_rec.time_in < %s
         ORDER BY opti_rec.time_in DESC
-    """, (today,))
+    """, (day_start, day_end))
     records = cursor.fetchall()
     return jsonify({"records": records})
 
+@app.route("/api/attendance")
+def api_attendance():
+    try:
+        page = attendance_page(get_db().cursor(), request.args, with_late_undertime=False)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify(page)
+
+@app.route("/api/employees")
+def api_employees():
+    # email / number / rfid: an RFID uid is all it takes to fake a scan
+    if "admin" not in session:
+        return jsonify({"status": "error", "error": "admin only"}), 403
+    try:
+        page = employees_page(get_db().cursor(), request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "error": str(e)}), 400
+    return jsonify(page)
+
 # -----------------------------
 # Scan API (RFID) for App
 # -----------------------------
+def _record_scan(employee, now):
+    # (response, update) for a resolved employee; caller holds
+    # shift_state.lock_for(employee["id_employee"]) and, once it's released,
+    # publishes `update` (None for already_done)
+    record = shift_state.get(employee["id_employee"], now)
+
+    if not record:
+        with daily_summary.recording():
+            if attendance_writer is not None:
+                attendance_writer.time_in(employee["id_employee"], now)
+                record_id = None
+            else:
+                connection = get_db()
+                cursor = connection.cursor()
+                cursor.execute("INSERT INTO opti_rec (id_employee, time_in) VALUES (%s, %s)",
+                               (employee["id_employee"], now))
+                connection.commit()
+                record_id = cursor.lastrowid
+            shift_state.opened(employee["id_employee"], record_id, now)
+            daily_summary.time_in(now)
+        response_cache.invalidate()
+        update = {
+            "name": employee["name"], "status": "time_in", "time_in": now.strftime("%H:%M")
+        }
+        return jsonify({"status": "time_in"}), update
+    elif record and not record["time_out"]:
+        out = scan_rules.time_out_fields(record["time_in"], now)
+        duration_min = out["duration"]
+        salary = out["salary"]
+        with daily_summary.recording():
+            if attendance_writer is not None:
+                attendance_writer.time_out(record["id"], employee["id_employee"], record["time_in"], now, **out)
+            else:
+                connection = get_db()
+                cursor = connection.cursor()
+                cursor.execute("UPDATE opti_rec SET time_out=%s, duration=%s, salary=%s WHERE id=%s",
+                               (now, duration_min, salary, record["id"]))
+                connection.commit()
+            shift_state.closed(employee["id_employee"], now)
+            daily_summary.time_out(now, salary)
+        response_cache.invalidate()
+        update = {
+            "name": employee["name"], "status": "time_out", "time_out": now.strftime("%H:%M"),
+            "duration": duration_min, "salary": salary
+        }
+        return jsonify({"status": "time_out", "duration": duration_min, "salary": salary}), update
+    else:
+        return jsonify({"status": "already_done"}), None
+
+def _publish_scan(employee, update):
+    # outside the stripe lock: the relay must never hold up the next tap
+    if update is not None:
+        change_log.record("attendance", employee["id_employee"])
+        broadcaster.publish(employee["id_employee"], update)
+
 @app.route("/api/scan", methods=["POST"])
 def api_scan():
     uid = request.json.get("uid")
     # Send to Arduino
-    if arduino_connected:
-        try: arduino.write(f"{uid}\n".encode())
-        except: pass
+    arduino.send(uid)
     # DB logic
-    cursor.execute("SELECT * FROM opti WHERE rfid=%s", (uid,))
-    employee = cursor.fetchone()
+    employee = rfid_index.lookup(uid)
     if not employee:
         return jsonify({"status": "not_found"})
 
-    now = datetime.now()
-    now_str = now.strftime("%Y-%m-%d")
-    cursor.execute("SELECT * FROM opti_rec WHERE id_employee=%s AND DATE(time_in)=%s",
-                   (employee["id_employee"], now_str))
-    record = cursor.fetchone()
+    # whole seconds, so cached / queued time_in values equal what DATETIME stores
+    now = datetime.now().replace(microsecond=0)
+    with shift_state.lock_for(employee["id_employee"]):
+        response, update = _record_scan(employee, now)
+    _publish_scan(employee, update)
+    return response
+
+@app.route("/api/scan_batch", methods=["POST"])
+def api_scan_batch():
+    # Replay of taps a terminal buffered while offline:
+    # {"scans": [{"uid": "...", "scanned_at": "2024-05-01T08:02:11" | epoch}, ...]}
+    body = request.get_json(silent=True)
+    scans = body.get("scans") if isinstance(body, dict) else None
+    if not isinstance(scans, list):
+        return jsonify({"status": "error", "error": "scans must be a list"}), 400
+    if len(scans) > MAX_SCAN_BATCH:
+        return jsonify({"status": "error", "error": f"at most {MAX_SCAN_BATCH} scans per batch"}), 413
+
+    items = [
+        (s.get("uid"), parse_scanned_at(s.get("scanned_at"))) if isinstance(s, dict) else (None, None)
+        for s in scans
+    ]
+    employee_ids, _ = batch_employees(items, rfid_index.lookup)
+    today = datetime.now().date()
+    # live scans of these employees wait until the batch has committed and
+    # shift_state has dropped what it knew about them
+    with shift_state.lock_all_for(employee_ids):
+        if attendance_writer is not None:
+            attendance_writer.ensure_drained(WRITE_BEHIND_DRAIN_SECONDS)
+        results, touched = apply_scan_batch(get_db(), scan_rules, items, rfid_index.lookup)
+        if today in touched:
+            # Live scans for today read shift_state; let it reload what we wrote.
+            shift_state.invalidate()
+    if touched:
+        response_cache.invalidate()
+
+    if today in touched:
+        daily_summary.invalidate()
+        for (_, at), result in zip(items, results):
+            if at is not None and at.date() == today and result["status"] in ("time_in", "time_out"):
+                # the planned row, not a fresh lookup: the card may be gone by now
+                update = {k: v for k, v in result.items() if k != "id_employee"}
+                change_log.record("attendance", result["id_employee"])
+                broadcaster.publish(result["id_employee"], {**update, result["status"]: at.strftime("%H:%M")})
+    return jsonify({"status": "success", "results": results})
+
+@app.route("/api/changes")
+def api_changes():
+    # ?since=<version> from the dashboard (or the previous response); the
+    # employee rows carry email / number / rfid, so admin session only
+    if "admin" not in session:
+        return jsonify({"status": "error", "error": "admin only"}), 403
+    try:
+        since = int(request.args.get("since", ""))
+    except ValueError:
+        return jsonify({"status": "error", "error": "since must be an integer version"}), 400
+    if attendance_writer is not None:
+        # queued taps are already in the log; let them reach opti_rec first
+        attendance_writer.drain(timeout=1)
+    changes = changes_since(get_db().cursor(), change_log, since, with_late_undertime=False)
+    changes["summary"] = daily_summary.snapshot()
+    return jsonify(changes)
+
+# Operational stats below (and /metrics, /readyz) are open to anyone who can
+# reach the port: counters and queue depths only, no employee data. Keep the
+# app behind the LAN / a reverse proxy that limits who can reach them.
+@app.route("/api/http_cache")
+def api_http_cache():
+    return jsonify(response_cache.stats())
+
+@app.route("/api/broadcast")
+def api_broadcast():
+    return jsonify(broadcaster.stats())
+
+@app.route("/api/arduino")
+def api_arduino():
+    return jsonify(arduino.stats())
+
+@app.route("/api/db_pool")
+def api_db_pool():
+    return jsonify(db_pool.stats())
+
+@app.route("/api/write_queue")
+def api_write_queue():
+    if attendance_writer is None:
+        return jsonify({"enabled": False})
+    return jsonify({"enabled": True, **attendance_writer.stats()})
 
-    if not record:
-        cursor.execute("INSERT INTO opti_rec (id_employee, time_in) VALUES (%s, %s)",
-                       (employee["id_employee"], now))
-        connection.commit()
-        socketio.emit("attendance_update", {"name": employee["name"], "status": "time_in"})
-        return jsonify({"status": "time_in"})
-    elif record and not record["time_out"]:
-        time_in_db = record["time_in"]
-        if isinstance(time_in_db, str):
-            time_in_db = datetime.strptime(time_in_db, "%Y-%m-%d %H:%M:%S")
-        duration_min = int((now - time_in_db).total_seconds() // 60)
-        salary = duration_min * 5
-        cursor.execute("UPDATE opti_rec SET time_out=%s, duration=%s, salary=%s WHERE id=%s",
-                       (now, duration_min, salary, record["id"]))
-        connection.commit()
-        socketio.emit("attendance_update", {"name": employee["name"], "status": "time_out"})
-        return jsonify({"status": "time_out", "duration": duration_min, "salary": salary})
+# -----------------------------
+# Health Checks
+# -----------------------------
+# create_app() returns without waiting on MySQL or the Arduino; the first
+# connection and the scan caches are loaded by a background warm-up that
+# retries until MySQL answers (opti_health.py). GET /healthz is liveness,
+# GET /readyz turns 200 once the warm-up is done and MySQL answers a ping.
+warmup = Warmup(db_pool)
+warmup.step("mysql", warmup.ping)
+warmup.step("rfid_index", rfid_index.warm)
+warmup.step("shift_state", shift_state.warm)
+warmup.step("daily_summary", daily_summary.snapshot)
+warmup.info("arduino", lambda: arduino.stats())
+opti_health.init_app(app, warmup)
+
+# -----------------------------
+# Metrics
+# -----------------------------
+# GET /metrics: per-route latency, per-statement MySQL timings and row counts,
+# commit and pool wait latency, Socket.IO emits and serial writes, plus the
+# stats() of the components below, in Prometheus text format.
+opti_metrics.init_app(app)
+metrics.collect("db_pool", db_pool.stats)
+metrics.collect("arduino", lambda: arduino.stats())    # a RelaySerial on workers > 0
+metrics.collect("broadcast", broadcaster.stats)
+metrics.collect("http_cache", response_cache.stats)
+metrics.collect("slow_queries", slow_query_log.stats)
+metrics.collect("warmup", warmup.stats)
+if attendance_writer is not None:
+    metrics.collect("write_queue", attendance_writer.stats)
+
+# -----------------------------
+# App Factory
+# -----------------------------
+def _remote_change(table, key):
+    # another worker wrote (table None: anything may have changed); drop what
+    # this one cached about it
+    response_cache.invalidate()
+    daily_summary.invalidate()
+    if table == "attendance":
+        shift_state.mark_stale(key)
+        return
+    rfid_index.invalidate()
+    id_allocator.invalidate()
+    if table is None:
+        shift_state.invalidate()
     else:
-        return jsonify({"status": "already_done"})
+        shift_state.mark_stale(key)
+
+def create_app():
+    """Start the background work (serial port, write-behind writer, summary
+    reconciler, warm-up), join the relay when running as one of several
+    workers and bind Socket.IO. Neither this nor importing the module waits
+    on MySQL or the serial port; /readyz reports when scans are warm."""
+    global arduino
+    socketio_options = {}
+    if RELAY_ADDRESS is not None:
+        relay = RelayClient(RELAY_ADDRESS, WORKER_ID)
+        socketio_options["client_manager"] = relay_manager(relay)
+        change_log.attach(relay, on_remote=_remote_change)
+        broadcaster.attach(relay)
+        if SERIAL_OWNER:
+            serve_serial(relay, arduino)
+        else:
+            arduino = RelaySerial(relay, ARDUINO_PORT)
+        if not relay.start():
+            print(f"[worker {WORKER_ID}] relay {RELAY_ADDRESS} not reachable yet; retrying in the background")
+        metrics.collect("relay", relay.stats)
+    socketio.init_app(app, **socketio_options)
+
+    if attendance_writer is not None:
+        attendance_writer.start()
+    daily_summary.start_reconciler(SUMMARY_RECONCILE_SECONDS)
+    broadcaster.start()
+    if SERIAL_OWNER:
+        arduino_events.start()
+        arduino.start()
+    warmup.start()
+    return app
 
 # -----------------------------
 # Run App
 # -----------------------------
 if __name__ == "__main__":
+    create_app()
     socketio.run(app, port=5000, debug=True)
\ No newline at end of file
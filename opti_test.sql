@@ -24,5 +24,21 @@ CREATE TABLE IF NOT EXISTS opti_rec (
     late_minutes INT DEFAULT 0,          -- matches backend
     undertime_minutes INT DEFAULT 0,     -- matches backend
     salary DECIMAL(10,2) DEFAULT 0,
+    INDEX idx_opti_rec_emp_time (id_employee, time_in),   -- api_scan: today's record per employee
+    INDEX idx_opti_rec_time_in (time_in),                 -- dashboard / exports / payroll day ranges
+    FOREIGN KEY (id_employee) REFERENCES opti(id_employee) ON DELETE CASCADE
+);
+
+-- Payroll rollup: one row per employee per work day (see opti_payroll.py)
+CREATE TABLE IF NOT EXISTS opti_daily_pay (
+    id_employee INT NOT NULL,
+    work_date DATE NOT NULL,                 -- DATE(opti_rec.time_in)
+    shifts INT NOT NULL DEFAULT 0,
+    minutes INT NOT NULL DEFAULT 0,
+    salary DECIMAL(12,2) NOT NULL DEFAULT 0,
+    late_minutes INT NOT NULL DEFAULT 0,
+    undertime_minutes INT NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_employee, work_date),
+    INDEX idx_opti_daily_pay_date (work_date),
     FOREIGN KEY (id_employee) REFERENCES opti(id_employee) ON DELETE CASCADE
 );
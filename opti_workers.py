@@ -0,0 +1,100 @@
+"""Run opti_staff / opti_test as several worker processes behind one port.
+
+    python opti_workers.py opti_test --workers 4 --port 5000
+    python opti_workers.py opti_staff --workers 4 --relay unix:///tmp/opti-relay.sock
+
+This process hosts the relay (opti_relay.py) and starts --workers copies of
+the app, each with create_app() under eventlet. Every worker listens on the
+same port with SO_REUSEPORT and the kernel spreads connections across them;
+on platforms without it (Windows) worker i listens on port + i instead and a
+front proxy has to balance them. Worker 0 owns the Arduino port; the others
+forward their beeps / uids to it, and its "arduino_data" emits, like all
+Socket.IO emits, reach clients on every worker through the relay. A worker
+that exits is restarted.
+"""
+import argparse
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from opti_relay import DEFAULT_ADDRESS, Relay
+
+WORKER = """
+import sys
+app = __import__(sys.argv[1])
+app.create_app()
+app.socketio.run(app.app, host=sys.argv[2], port=int(sys.argv[3]), log_output=False)
+"""
+
+RESTART_DELAY = 1.0
+
+
+def worker_env(args, worker_id):
+    return {
+        **os.environ,
+        "OPTI_ASYNC_MODE": "eventlet",        # eventlet.listen() sets SO_REUSEPORT
+        "OPTI_COOLDOWN_BACKEND": "socket",    # one scan cooldown for all workers (opti_cooldown.py)
+        "OPTI_RELAY": args.relay,
+        "OPTI_WORKER": str(worker_id),
+        # so the worker can import the app from any working directory
+        "PYTHONPATH": os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)),
+                                                    os.environ.get("PYTHONPATH")])),
+    }
+
+
+def worker_port(args, worker_id):
+    return args.port if hasattr(socket, "SO_REUSEPORT") else args.port + worker_id
+
+
+def start_worker(args, worker_id):
+    return subprocess.Popen([sys.executable, "-c", WORKER, args.app, args.host,
+                             str(worker_port(args, worker_id))], env=worker_env(args, worker_id))
+
+
+def _terminate(signum, frame):
+    raise KeyboardInterrupt
+
+
+def run(args):
+    signal.signal(signal.SIGTERM, _terminate)    # stop the workers too, not just the launcher
+    relay = Relay(args.relay).start()
+    print(f"relay on {args.relay}; {args.workers} x {args.app} on {args.host}:{args.port}"
+          + ("" if hasattr(socket, "SO_REUSEPORT") else f"..{args.port + args.workers - 1}"))
+    workers = {i: start_worker(args, i) for i in range(args.workers)}
+    try:
+        while True:
+            time.sleep(RESTART_DELAY)
+            for i, proc in workers.items():
+                code = proc.poll()
+                if code is not None:
+                    print(f"worker {i} exited with {code}; restarting")
+                    workers[i] = start_worker(args, i)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for proc in workers.values():
+            proc.terminate()
+        for proc in workers.values():
+            try:
+                proc.wait(timeout=10)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        relay.stop()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("app", choices=["opti_staff", "opti_test"])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--relay", default=DEFAULT_ADDRESS,
+                        help="tcp://host:port or unix:///path for the worker relay")
+    run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+import json
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+
+import pymysql
+from flask import jsonify
+
+from opti_async import blocking_call
+from opti_pool import PoolTimeout
+
+# -----------------------------
+# Write-behind Attendance Writer
+# -----------------------------
+# Optional mode for /api/scan: instead of committing each tap synchronously,
+# the validated mutation is appended to a local journal and queued, and the
+# scan is acknowledged right away. A writer thread flushes the queue in
+# groups (every flush_interval seconds or max_batch items, whichever comes
+# first) inside one transaction, so many taps share one MySQL fsync.
+#
+# Journal lines are {"seq", "op", ...} mutations plus {"committed": seq}
+# checkpoints written after each successful flush. On start-up anything past
+# the last checkpoint is replayed; replayed time_ins are skipped if the row
+# already exists and replayed time_outs if the row is already closed, so
+# replay is idempotent (including the optional payroll rollup).
+#
+# Scans journal under a lock but fsync outside it: one fsync covers every
+# line written before it started, so concurrent scans share it the way their
+# MySQL commits are shared. A flush that fails because MySQL is unreachable
+# is retried as a whole with backoff. Retried mutations are flagged like
+# replayed ones, since a connection lost during COMMIT may have committed. Any other failure splits the batch and
+# each mutation is retried on its own; one that still fails after
+# max_attempts is appended to the dead-letter journal (journal_path + ".dead")
+# and logged, so a single bad tap can't stall the writer.
+
+_TIME_KEYS = ("time_in", "time_out")
+# MySQL down / restarting / busy: nothing wrong with the batch itself
+_TRANSIENT_ERRORS = (pymysql.err.OperationalError, pymysql.err.InterfaceError, PoolTimeout, OSError)
+
+
+class WriteBacklog(Exception):
+    """Raised when queued writes don't reach MySQL within the drain timeout."""
+
+
+class AttendanceWriter:
+    def __init__(self, pool, journal_path, flush_interval=0.05, max_batch=200, fsync=True, rollup=None,
+                 max_attempts=3, dead_letter_path=None):
+        self._pool = pool
+        self._rollup = rollup
+        self.journal_path = journal_path
+        self.dead_letter_path = dead_letter_path or journal_path + ".dead"
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_attempts = max_attempts
+        self.fsync = fsync
+        self._queue = queue.Queue()
+        self._journal = None
+        self._journal_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._synced_seq = 0
+        self._seq = 0
+        self._committed_seq = 0
+        self._committed = threading.Condition()
+        self._stop = threading.Event()
+        self._thread = None
+        # stats
+        self.flushes = 0
+        self.flushed_items = 0
+        self.failures = 0
+        self.dead_letters = 0
+        self.fsyncs = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self._total_flush_ms = 0.0
+
+    # -- lifecycle ---------------------------------------------------------
+    def start(self):
+        pending, last_seq = self._read_journal()
+        self._seq = self._committed_seq = self._synced_seq = last_seq
+        # Rewrite the journal with only what still has to reach MySQL.
+        self._journal = open(self.journal_path, "w", encoding="utf-8")
+        for mutation in pending:
+            self._journal.write(self._encode(mutation))
+            mutation["replay"] = True
+            self._queue.put(mutation)
+        self._sync_journal()
+        if pending:
+            self._committed_seq = pending[0]["seq"] - 1
+            print(f"Replaying {len(pending)} journaled attendance writes.")
+        self._thread = threading.Thread(target=self._run, name="attendance-writer", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=5):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _read_journal(self):
+        if not os.path.exists(self.journal_path):
+            return [], 0
+        mutations, committed, last_seq = [], 0, 0
+        with open(self.journal_path, encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # torn final line from a crash mid-write
+                if "committed" in entry:
+                    committed = max(committed, entry["committed"])
+                else:
+                    for key in _TIME_KEYS:
+                        if entry.get(key):
+                            entry[key] = datetime.fromisoformat(entry[key])
+                    mutations.append(entry)
+                    last_seq = max(last_seq, entry["seq"])
+        return [m for m in mutations if m["seq"] > committed], max(last_seq, committed)
+
+    @staticmethod
+    def _encode(entry):
+        return json.dumps(
+            {k: (v.isoformat() if isinstance(v, datetime) else v) for k, v in entry.items()},
+            default=str,
+        ) + "\n"
+
+    def _sync_journal(self):
+        self._journal.flush()
+        if self.fsync:
+            blocking_call(os.fsync, self._journal.fileno())
+
+    # -- producers (request threads) ---------------------------------------
+    def _submit(self, mutation):
+        with self._journal_lock:
+            self._seq += 1
+            seq = mutation["seq"] = self._seq
+            self._journal.write(self._encode(mutation))
+            self._journal.flush()
+            self._queue.put(mutation)
+        self._sync_through(seq)
+        return seq
+
+    def _sync_through(self, seq):
+        # group fsync: whoever gets _sync_lock syncs every line written so far,
+        # and scans that queued behind it find theirs already durable
+        if not self.fsync:
+            return
+        with self._sync_lock:
+            if self._synced_seq >= seq:
+                return
+            with self._journal_lock:
+                target = self._seq
+                fileno = self._journal.fileno()
+            blocking_call(os.fsync, fileno)
+            self._synced_seq = target
+            self.fsyncs += 1
+
+    def time_in(self, id_employee, time_in, **fields):
+        return self._submit({"op": "time_in", "id_employee": id_employee,
+                             "time_in": time_in, "fields": fields})
+
+    def time_out(self, record_id, id_employee, time_in, time_out, **fields):
+        # record_id is None when the time_in is itself still queued; the row is
+        # then addressed by (id_employee, time_in) via idx_opti_rec_emp_time.
+        return self._submit({"op": "time_out", "id": record_id, "id_employee": id_employee,
+                             "time_in": time_in, "time_out": time_out, "fields": fields})
+
+    def drain(self, timeout=None):
+        """Block until everything submitted so far is committed (or
+        dead-lettered); False if `timeout` seconds pass first."""
+        target = self._seq
+        with self._committed:
+            return self._committed.wait_for(lambda: self._committed_seq >= target, timeout)
+
+    def ensure_drained(self, timeout):
+        """drain() for request paths: raises WriteBacklog (a 503, see init_app)
+        instead of hanging when the writer can't keep up or MySQL is down."""
+        if not self.drain(timeout):
+            raise WriteBacklog(f"{self._seq - self._committed_seq} queued scans not written after {timeout}s")
+
+    # -- writer thread -----------------------------------------------------
+    def _run(self):
+        batch = []
+        backoff = self.flush_interval
+        while not (self._stop.is_set() and not batch and self._queue.empty()):
+            if not batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(self.flush_interval, 0.05)))
+                except queue.Empty:
+                    continue
+            deadline = time.monotonic() + self.flush_interval
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    batch.append(self._queue.get(timeout=remaining) if remaining > 0
+                                 else self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                self._flush(batch)
+            except _TRANSIENT_ERRORS as e:
+                self.failures += 1
+                print(f"Attendance flush failed ({len(batch)} queued, retrying): {e}")
+                self._mark_replay(batch)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 5)
+                continue
+            except Exception as e:
+                self.failures += 1
+                print(f"Attendance flush failed ({len(batch)} queued, retrying one by one): {e}")
+                for mutation in batch:
+                    self._flush_one(mutation)
+            backoff = self.flush_interval
+            batch = []
+
+    @staticmethod
+    def _mark_replay(batch):
+        # the failure may have come after MySQL applied the commit (connection
+        # lost during COMMIT): retry with replay's existence checks
+        for m in batch:
+            m["replay"] = True
+
+    def _flush_one(self, mutation):
+        self._mark_replay([mutation])
+        attempts = 0
+        backoff = self.flush_interval
+        while True:
+            try:
+                self._flush([mutation])
+                return
+            except _TRANSIENT_ERRORS as e:
+                print(f"Attendance write {mutation['seq']} failed (retrying): {e}")
+            except Exception as e:
+                attempts += 1
+                if attempts >= self.max_attempts:
+                    self._dead_letter(mutation, e)
+                    return
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 5)
+
+    def _dead_letter(self, mutation, error):
+        entry = {k: v for k, v in mutation.items() if k != "replay"}
+        entry["error"] = str(error)
+        entry["failed_at"] = datetime.now()
+        with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+            f.write(self._encode(entry))
+        self.dead_letters += 1
+        print(f"Attendance write {mutation['seq']} ({mutation['op']} for employee "
+              f"{mutation['id_employee']}) moved to {self.dead_letter_path}: {error}")
+        self._checkpoint(mutation["seq"])
+
+    def _flush(self, batch):
+        started = time.perf_counter()
+        with self._pool.connection() as conn, conn.cursor() as cur:
+            inserts = {}
+            rollup_in, rollup_out = [], []
+            for m in batch:
+                if m["op"] != "time_in":
+                    continue
+                if m.get("replay"):
+                    cur.execute("SELECT 1 FROM opti_rec WHERE id_employee=%s AND time_in=%s",
+                                (m["id_employee"], m["time_in"]))
+                    if cur.fetchone():
+                        continue
+                columns = tuple(sorted(m["fields"]))
+                inserts.setdefault(columns, []).append(
+                    (m["id_employee"], m["time_in"], *(m["fields"][c] for c in columns)))
+                rollup_in.append((m["id_employee"], m["time_in"], m["fields"].get("late_minutes", 0)))
+            for columns, rows in inserts.items():
+                names = ("id_employee", "time_in") + columns
+                cur.executemany(
+                    f"INSERT INTO opti_rec ({', '.join(names)}) VALUES ({', '.join(['%s'] * len(names))})",
+                    rows)
+
+            for m in batch:
+                if m["op"] != "time_out":
+                    continue
+                if m.get("replay"):
+                    # already closed before the crash: don't count it twice in the rollup
+                    cur.execute("SELECT time_out FROM opti_rec WHERE id_employee=%s AND time_in=%s",
+                                (m["id_employee"], m["time_in"]))
+                    row = cur.fetchone()
+                    if row and row["time_out"]:
+                        continue
+                fields = m["fields"]
+                rollup_out.append((m["id_employee"], m["time_in"], fields.get("duration", 0),
+                                   fields.get("salary", 0), fields.get("undertime_minutes", 0)))
+                columns = sorted(m["fields"])
+                assignments = ", ".join(["time_out=%s"] + [f"{c}=%s" for c in columns])
+                values = [m["time_out"]] + [m["fields"][c] for c in columns]
+                if m.get("id"):
+                    cur.execute(f"UPDATE opti_rec SET {assignments} WHERE id=%s", (*values, m["id"]))
+                else:
+                    cur.execute(f"UPDATE opti_rec SET {assignments} WHERE id_employee=%s AND time_in=%s",
+                                (*values, m["id_employee"], m["time_in"]))
+            if self._rollup is not None:
+                self._rollup.time_in_many(cur, rollup_in)
+                self._rollup.time_out_many(cur, rollup_out)
+            conn.commit()
+
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        self.flushes += 1
+        self.flushed_items += len(batch)
+        self.last_flush_ms = elapsed_ms
+        self.max_flush_ms = max(self.max_flush_ms, elapsed_ms)
+        self._total_flush_ms += elapsed_ms
+        self._checkpoint(max(m["seq"] for m in batch))
+
+    def _checkpoint(self, seq):
+        with self._journal_lock:
+            if seq >= self._seq and self._queue.empty():
+                # Everything journaled is in MySQL: start the journal over.
+                self._journal.seek(0)
+                self._journal.truncate()
+            else:
+                self._journal.write(json.dumps({"committed": seq}) + "\n")
+            self._journal.flush()
+        with self._committed:
+            self._committed_seq = max(self._committed_seq, seq)
+            self._committed.notify_all()
+
+    def stats(self):
+        return {
+            "queue_depth": self._seq - self._committed_seq,
+            "flushes": self.flushes,
+            "flushed_items": self.flushed_items,
+            "failures": self.failures,
+            "dead_letters": self.dead_letters,
+            "fsyncs": self.fsyncs,
+            "last_flush_ms": round(self.last_flush_ms, 3),
+            "max_flush_ms": round(self.max_flush_ms, 3),
+            "avg_flush_ms": round(self._total_flush_ms / self.flushes, 3) if self.flushes else 0.0,
+        }
+
+
+# -----------------------------
+# Flask Integration
+# -----------------------------
+def init_app(app):
+    @app.errorhandler(WriteBacklog)
+    def _write_backlog(e):
+        return jsonify({"status": "busy", "error": str(e)}), 503
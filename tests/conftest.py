@@ -0,0 +1,126 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# -----------------------------
+# Stub Cursors / Pool
+# -----------------------------
+# Just enough of a PyMySQL connection for the pure-logic pieces: every
+# statement is recorded, SELECTs are answered from `results` (a list of
+# callables tried in order, returning rows or None), and `fail` may raise
+# for a statement to simulate a MySQL error. executed() only sees committed
+# statements; a transaction that raises out of StubPool.connection() is
+# rolled back.
+
+
+class StubCursor:
+    def __init__(self, conn):
+        self._conn = conn
+        self._rows = []
+
+    def execute(self, sql, params=None):
+        self._conn.run(sql, params)
+        self._rows = list(self._conn.answer(sql, params) or [])
+        return len(self._rows)
+
+    def executemany(self, sql, rows):
+        rows = list(rows)
+        for params in rows:
+            self._conn.run(sql, params)
+        return len(rows)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def fetchmany(self, size):
+        rows, self._rows = self._rows[:size], self._rows[size:]
+        return rows
+
+    def __iter__(self):
+        while self._rows:
+            yield self._rows.pop(0)
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StubConnection:
+    def __init__(self, results=(), fail=None):
+        self.results = list(results)
+        self.fail = fail
+        self.statements = []
+        self.commits = 0
+        self._committed = 0
+
+    def run(self, sql, params):
+        if self.fail is not None:
+            self.fail(sql, params)
+        self.statements.append((" ".join(sql.split()), params))
+
+    def answer(self, sql, params):
+        for result in self.results:
+            rows = result(" ".join(sql.split()), params)
+            if rows is not None:
+                return rows
+        return []
+
+    def cursor(self, cursor_class=None):
+        return StubCursor(self)
+
+    def close(self):
+        self.closed = True
+
+    def commit(self):
+        self.commits += 1
+        self._committed = len(self.statements)
+
+    def rollback(self):
+        del self.statements[self._committed:]
+
+    def executed(self, prefix):
+        return [params for sql, params in self.statements[:self._committed] if sql.startswith(prefix)]
+
+
+class StubPool:
+    def __init__(self, conn):
+        self.conn = conn
+        self.in_use = 0
+
+    def acquire(self, timeout=None):
+        self.in_use += 1
+        return self.conn
+
+    def release(self, conn):
+        self.in_use -= 1
+
+    @contextmanager
+    def connection(self, timeout=None):
+        try:
+            yield self.conn
+        except Exception:
+            self.conn.rollback()
+            raise
+
+
+@pytest.fixture
+def stub_conn():
+    return StubConnection()
+
+
+@pytest.fixture
+def stub_pool(stub_conn):
+    return StubPool(stub_conn)
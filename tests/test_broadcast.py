@@ -0,0 +1,55 @@
+from opti_broadcast import LEGACY_ROOM, AttendanceBroadcaster
+
+
+class FakeSocketIO:
+    def __init__(self):
+        self.emitted = []
+
+    def on_event(self, event, handler):
+        pass
+
+    def emit(self, event, data, to=None, **options):
+        self.emitted.append((event, data, to))
+
+
+class FakeRelayClient:
+    def __init__(self):
+        self.down = False
+        self.sent = []
+
+    def subscribe(self, channel, handler):
+        self.handler = handler
+
+    def publish(self, channel, data, wait=False):
+        if self.down:
+            return None
+        self.sent.append(data)
+        return True
+
+
+def test_relay_publish_is_emitted_when_the_relay_hands_it_back():
+    socketio, relay = FakeSocketIO(), FakeRelayClient()
+    broadcaster = AttendanceBroadcaster(socketio)
+    broadcaster.attach(relay)
+    assert broadcaster.publish(1, {"name": "Ana", "status": "time_in"}) is None
+    assert socketio.emitted == []
+    relay.handler(1, relay.sent[0], 0)
+    assert broadcaster.seq == 1
+    assert socketio.emitted == [("attendance_update", {"name": "Ana", "status": "time_in"}, LEGACY_ROOM)]
+
+
+def test_publish_falls_back_to_local_clients_while_the_relay_is_down():
+    socketio, relay = FakeSocketIO(), FakeRelayClient()
+    broadcaster = AttendanceBroadcaster(socketio)
+    broadcaster.attach(relay)
+    relay.down = True
+    assert broadcaster.publish(1, {"name": "Ana", "status": "time_in"}) == 1
+    assert socketio.emitted == [("attendance_update", {"name": "Ana", "status": "time_in"}, LEGACY_ROOM)]
+    assert broadcaster.missed("employee:1", 0) == [{"seq": 1, "id_employee": 1, "name": "Ana",
+                                                     "status": "time_in"}]
+
+    # back up with a seq from the relay: the local history can't be replayed
+    relay.down = False
+    relay.handler(7, {"id_employee": 2, "name": "Ben", "status": "time_in"}, 0)
+    assert broadcaster.seq == 7
+    assert broadcaster.missed("all", 0) is None
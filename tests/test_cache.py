@@ -0,0 +1,130 @@
+import threading
+import time
+from datetime import datetime
+
+from opti_cache import DailySummary, ShiftState
+
+
+# -----------------------------
+# DailySummary
+# -----------------------------
+class FakeOpti:
+    """opti / opti_rec totals for today, answered to DailySummary._compute()."""
+
+    def __init__(self, employees=10):
+        self.employees = employees
+        self.present = 0
+        self.salary = 0
+
+    def __call__(self, sql, params):
+        if sql.startswith("SELECT COUNT(*) AS total FROM opti"):
+            return [{"total": self.employees}]
+        if sql.startswith("SELECT COUNT(*) AS present"):
+            return [{"present": self.present, "total_salary": self.salary}]
+        return None
+
+
+def test_summary_counts_from_mysql_then_bumps(stub_pool, stub_conn):
+    db = FakeOpti()
+    stub_conn.results.append(db)
+    summary = DailySummary(stub_pool)
+    assert summary.snapshot() == {"total_employees": 10, "present": 0, "total_salary": 0}
+
+    now = datetime.now()
+    with summary.recording():
+        db.present += 1
+        summary.time_in(now)
+    with summary.recording():
+        db.salary += 250
+        summary.time_out(now, 250)
+    assert summary.snapshot() == {"total_employees": 10, "present": 1, "total_salary": 250}
+    assert summary.reconcile() == {}
+
+
+def test_summary_reconcile_reports_drift(stub_pool, stub_conn):
+    db = FakeOpti()
+    stub_conn.results.append(db)
+    summary = DailySummary(stub_pool)
+    summary.snapshot()
+    db.present = 3      # written by something that didn't bump
+    assert summary.reconcile() == {"present": (0, 3)}
+    assert summary.snapshot()["present"] == 3
+
+
+def test_recount_never_double_counts_writes_in_flight(stub_pool, stub_conn):
+    db = FakeOpti()
+    stub_conn.results.append(db)
+    summary = DailySummary(stub_pool)
+    summary.snapshot()
+    db_lock = threading.Lock()
+    stop = threading.Event()
+    drifts = []
+
+    def scan():
+        now = datetime.now()
+        for _ in range(200):
+            with summary.recording():
+                with db_lock:
+                    db.present += 1             # committed...
+                time.sleep(0.0001)              # ...a recount may land here...
+                summary.time_in(now)            # ...before the bump
+
+    def recount():
+        while not stop.is_set():
+            drifts.append(summary.reconcile())
+            time.sleep(0.001)
+
+    scanners = [threading.Thread(target=scan) for _ in range(4)]
+    reconciler = threading.Thread(target=recount)
+    reconciler.start()
+    for t in scanners:
+        t.start()
+    for t in scanners:
+        t.join()
+    stop.set()
+    reconciler.join()
+
+    assert summary.snapshot()["present"] == db.present == 800
+    assert [d for d in drifts if d] == []
+
+
+def test_invalidated_summary_is_recounted(stub_pool, stub_conn):
+    db = FakeOpti()
+    stub_conn.results.append(db)
+    summary = DailySummary(stub_pool)
+    summary.snapshot()
+    summary.invalidate()
+    with summary.recording():
+        db.present += 1
+        summary.time_in(datetime.now())         # not loaded: no bump...
+    assert summary.snapshot()["present"] == 1   # ...the recount has it
+
+
+# -----------------------------
+# ShiftState stripes
+# -----------------------------
+def test_lock_all_for_holds_every_stripe_of_the_batch(stub_pool):
+    state = ShiftState(stub_pool)
+    ids = [1, 2, 1 + ShiftState.LOCK_STRIPES]
+    with state.lock_all_for(ids):
+        assert all(state.lock_for(i).locked() for i in ids)
+        assert not state.lock_for(3).locked()
+    assert not any(state.lock_for(i).locked() for i in ids)
+
+
+def test_lock_all_for_orders_stripes_so_batches_cannot_deadlock(stub_pool):
+    state = ShiftState(stub_pool)
+    done = []
+
+    def batch(ids):
+        for _ in range(200):
+            with state.lock_all_for(ids):
+                pass
+        done.append(ids)
+
+    threads = [threading.Thread(target=batch, args=(ids,)) for ids in ([1, 2, 3], [3, 2, 1], [2, 3])]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(5)
+    assert len(done) == 3
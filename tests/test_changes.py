@@ -0,0 +1,119 @@
+from opti_changes import LOCAL_BITS, ChangeLog
+
+
+class FakeRelay:
+    """In-process stand-in for RelayClient: publish() queues, deliver() numbers
+    the queue and hands every message to every subscribed worker."""
+
+    def __init__(self):
+        self.queue = []
+        self.seq = 0
+        self.workers = []
+        self.down = False
+
+    def client(self, worker_id):
+        relay = self
+
+        class Client:
+            def subscribe(self, channel, handler):
+                relay.workers.append(handler)
+
+            def publish(self, channel, data, wait=False):
+                assert not wait
+                if relay.down:
+                    return None
+                relay.queue.append((data, worker_id))
+                return True
+
+        client = Client()
+        client.worker_id = worker_id
+        return client
+
+    def deliver(self):
+        while self.queue:
+            data, origin = self.queue.pop(0)
+            self.seq += 1
+            for handler in self.workers:
+                handler(self.seq, data, origin)
+
+
+def test_since_returns_changed_keys():
+    log = ChangeLog()
+    v0 = log.version
+    log.record("attendance", 1)
+    v1 = log.record("employees", 7)
+    log.record("attendance", 2)
+    assert log.since(v0) == (log.version, {"employees": {7}, "attendance": {1, 2}})
+    assert log.since(v1) == (log.version, {"employees": set(), "attendance": {2}})
+
+
+def test_reset_and_unknown_versions():
+    log = ChangeLog()
+    log.record("attendance", 1)
+    v = log.version
+    log.reset()
+    assert log.since(v) == (log.version, None)
+    assert log.since(log.version + 5) == (log.version, None)     # server restarted
+    assert log.since(log.version)[1] == {"employees": set(), "attendance": set()}
+
+
+def test_trimmed_history_resets():
+    log = ChangeLog(history=3)
+    for key in range(5):
+        log.record("attendance", key)
+    assert log.since(1)[1] is None
+    assert log.since(2)[1]["attendance"] == {2, 3, 4}
+
+
+def test_record_is_visible_locally_before_the_relay_delivers():
+    relay = FakeRelay()
+    a, b = ChangeLog(), ChangeLog()
+    a.attach(relay.client("a"))
+    b.attach(relay.client("b"))
+    v0 = a.version
+    a.record("attendance", 1)
+    assert a.since(v0)[1]["attendance"] == {1}
+    relay.deliver()
+    # both workers number the relayed change the same way
+    assert a.version == b.version == 1 << LOCAL_BITS
+    assert b.since(v0)[1]["attendance"] == {1}
+
+
+def test_record_while_relay_is_down_still_advances():
+    relay = FakeRelay()
+    log = ChangeLog()
+    log.attach(relay.client("a"))
+    relay.down = True
+    v0 = log.version
+    log.record("employees", 3)
+    assert log.version > v0
+    assert log.since(v0)[1]["employees"] == {3}
+
+
+def test_client_may_poll_another_worker():
+    relay = FakeRelay()
+    a, b = ChangeLog(), ChangeLog()
+    remote = []
+    a.attach(relay.client("a"))
+    b.attach(relay.client("b"), on_remote=lambda table, key: remote.append((table, key)))
+    a.record("attendance", 1)
+    relay.deliver()
+    a.record("attendance", 2)            # not relayed yet: a is ahead of b
+    version = a.version
+    changes = b.since(version)[1]
+    assert changes is not None
+    relay.deliver()
+    assert b.since(version)[1]["attendance"] == {2}
+    assert remote == [("attendance", 1), ("attendance", 2)]
+
+
+def test_relay_gap_resets():
+    relay = FakeRelay()
+    log = ChangeLog()
+    remote = []
+    log.attach(relay.client("a"), on_remote=lambda table, key: remote.append((table, key)))
+    relay.seq = 10                       # joined late
+    relay.queue.append(({"table": "attendance", "key": 1}, "b"))
+    relay.deliver()
+    assert log.since(0)[1] is None
+    assert remote == [(None, None)]
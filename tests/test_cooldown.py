@@ -0,0 +1,68 @@
+import socket
+
+import pytest
+
+from opti_cooldown import CooldownStore, SharedCooldown, make_cooldown
+
+
+def test_hit_rejects_inside_window_only():
+    store = CooldownStore(5)
+    assert store.hit("A", now=100) is False
+    assert store.hit("A", now=104.9) is True
+    assert store.hit("B", now=104.9) is False
+    assert store.hit("A", now=105) is False
+    assert store.stats()["rejected"] == 1
+
+
+def test_expired_entries_are_dropped():
+    store = CooldownStore(5)
+    for i in range(100):
+        store.hit(i, now=i)
+    assert len(store) == 5
+
+
+def test_capacity_caps_the_map():
+    store = CooldownStore(60, capacity=3)
+    for uid in "ABCD":
+        store.hit(uid, now=0)
+    assert len(store) == 3
+    assert store.evicted == 1
+    assert store.hit("A", now=1) is False       # evicted, so accepted again
+    assert store.hit("D", now=1) is True
+
+
+def test_make_cooldown():
+    assert isinstance(make_cooldown("local", 5), CooldownStore)
+    with pytest.raises(ValueError):
+        make_cooldown("redis", 5)
+
+
+@pytest.fixture
+def address():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()
+
+
+def test_shared_cooldown_across_processes(address):
+    owner = SharedCooldown(5, address=address)
+    other = SharedCooldown(5, address=address)
+    try:
+        assert owner.hit("A") is False
+        assert owner.is_owner
+        assert other.hit("A") is True
+        assert not other.is_owner and other.remote_hits == 1
+        assert owner.hit("A") is True
+        assert other.hit("B") is False
+        assert owner.hit("B") is True
+    finally:
+        other.close()
+        owner.close()
+
+
+def test_shared_cooldown_falls_back_when_owner_unreachable(address, monkeypatch):
+    cooldown = SharedCooldown(5, address=address, timeout=0.1)
+    monkeypatch.setattr(cooldown, "_serve", lambda: False)
+    assert cooldown.hit("A") is False
+    assert cooldown.hit("A") is True
+    assert cooldown.fallbacks == 2
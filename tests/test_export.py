@@ -0,0 +1,70 @@
+import io
+import zipfile
+from xml.etree import ElementTree
+from datetime import date, datetime
+
+import pymysql
+import pytest
+
+from opti_export import _text_cell, stream_attendance_csv, stream_attendance_xlsx
+
+DAY = date(2024, 5, 1)
+ROWS = [
+    {"name": "Ann", "time_in": datetime(2024, 5, 1, 8), "time_out": datetime(2024, 5, 1, 17),
+     "duration": 540, "salary": 2700},
+    {"name": "B\x07en <ops>", "time_in": datetime(2024, 5, 1, 9), "time_out": None,
+     "duration": None, "salary": None},
+]
+PAYROLL = [{"name": "Ann", "total_minutes": 540, "total_salary": 2700}]
+
+
+@pytest.fixture
+def export_db(stub_conn):
+    def answer(sql, params):
+        if sql.startswith("SELECT opti.name"):
+            return [dict(r) for r in ROWS]
+        if sql.startswith("SELECT o.name"):
+            return PAYROLL
+        return None
+    stub_conn.results.append(answer)
+    return stub_conn
+
+
+def test_csv_streams_rows_and_releases_the_connection(export_db, stub_pool):
+    body = "".join(stream_attendance_csv(stub_pool, DAY, DAY))
+    assert body.splitlines()[1] == "2024-05-01,Ann,08:00,17:00,540,2700"
+    assert stub_pool.in_use == 0
+
+
+def test_query_errors_surface_before_streaming(stub_conn, stub_pool):
+    def fail(sql, params):
+        raise pymysql.err.OperationalError(2003, "Can't connect")
+    stub_conn.fail = fail
+    with pytest.raises(pymysql.err.OperationalError):
+        stream_attendance_csv(stub_pool, DAY, DAY)
+    with pytest.raises(pymysql.err.OperationalError):
+        stream_attendance_xlsx(stub_pool, DAY, DAY)
+    assert stub_pool.in_use == 0
+
+
+def test_abandoned_download_drops_the_connection(export_db, stub_pool):
+    chunks = stream_attendance_csv(stub_pool, DAY, DAY)
+    del chunks
+    assert stub_pool.in_use == 0
+    assert export_db.closed
+
+
+def test_xlsx_is_a_valid_workbook(export_db, stub_pool):
+    data = b"".join(stream_attendance_xlsx(stub_pool, DAY, DAY))
+    with zipfile.ZipFile(io.BytesIO(data)) as zf:
+        assert zf.testzip() is None
+        sheet = zf.read("xl/worksheets/sheet1.xml").decode()
+        payroll = zf.read("xl/worksheets/sheet2.xml").decode()
+    ElementTree.fromstring(sheet)
+    assert "Ben &lt;ops&gt;" in sheet
+    assert "Ann" in payroll
+
+
+def test_text_cell_drops_characters_xml_cannot_carry():
+    assert _text_cell("a\x00b\x0bc\x1fd\te\nf") == \
+        '<c t="inlineStr"><is><t xml:space="preserve">abcd\te\nf</t></is></c>'
@@ -0,0 +1,133 @@
+from datetime import date, datetime, time as dt_time
+
+import pytest
+
+import opti_payroll
+from opti_payroll import parse_recompute_args, pay_period, recompute_payroll
+from opti_scan import ScanRules
+
+TODAY = date(2024, 5, 20)
+
+
+# -----------------------------
+# pay_period
+# -----------------------------
+@pytest.mark.parametrize("args, first, last", [
+    ({}, date(2024, 5, 1), date(2024, 5, 31)),
+    ({"period": "month", "date": "2024-02-10"}, date(2024, 2, 1), date(2024, 2, 29)),
+    ({"period": "semi_monthly", "date": "2024-05-15"}, date(2024, 5, 1), date(2024, 5, 15)),
+    ({"period": "semi_monthly"}, date(2024, 5, 16), date(2024, 5, 31)),
+    ({"period": "week"}, date(2024, 5, 20), date(2024, 5, 26)),
+    ({"period": "custom", "from": "2024-04-28", "to": "2024-05-03"}, date(2024, 4, 28), date(2024, 5, 3)),
+])
+def test_pay_period(args, first, last):
+    assert pay_period(args, today=TODAY)[:2] == (first, last)
+
+
+@pytest.mark.parametrize("args", [
+    {"period": "year"},
+    {"period": ["month"]},
+    {"period": "custom", "from": "2024-05-01"},
+    {"period": "custom", "from": "2024-05-03", "to": "2024-05-01"},
+    {"period": "custom", "from": 20240501, "to": "2024-05-03"},
+    {"period": "custom", "from": "2024-05-01", "to": ["2024-05-03"]},
+    {"period": "month", "date": "05/01/2024"},
+    {"period": "month", "date": {"y": 2024}},
+])
+def test_pay_period_rejects(args):
+    with pytest.raises(ValueError):
+        pay_period(args, today=TODAY)
+
+
+def test_parse_recompute_args():
+    rules = ScanRules(rate_per_minute=5, shift_start=dt_time(8), shift_end=dt_time(17))
+    first, last, new_rules, dry_run = parse_recompute_args(
+        {"period": "custom", "from": "2024-05-01", "to": "2024-05-02", "rate_per_minute": "2.5",
+         "shift_start": "09:00", "dry_run": False}, rules)
+    assert (first, last, dry_run) == (date(2024, 5, 1), date(2024, 5, 2), False)
+    assert new_rules.rate_per_minute == 2.5
+    assert (new_rules.shift_start, new_rules.shift_end) == (dt_time(9), dt_time(17))
+
+
+@pytest.mark.parametrize("body", [
+    ["period", "month"],
+    {"rate_per_minute": "fast"},
+    {"rate_per_minute": -1},
+    {"shift_start": "25:00"},
+])
+def test_parse_recompute_args_rejects(body):
+    with pytest.raises(ValueError):
+        parse_recompute_args(body, ScanRules(shift_start=dt_time(8)))
+
+
+# -----------------------------
+# recompute_payroll (vectorized)
+# -----------------------------
+def _epoch(dt):
+    # what TIMESTAMPDIFF(SECOND, '1970-01-01', col) returns for a DATETIME
+    return int((dt - datetime(1970, 1, 1)).total_seconds())
+
+
+def _shift(id, id_employee, time_in, time_out, duration, salary, late=0, under=0):
+    return (id, id_employee, _epoch(time_in), _epoch(time_out) if time_out else -1,
+            duration, round(salary * 100), late, under)
+
+
+@pytest.fixture
+def shifts(stub_conn, monkeypatch):
+    np = pytest.importorskip("numpy")
+    monkeypatch.setattr(opti_payroll, "np", np)
+    monkeypatch.setattr(opti_payroll, "RECOMPUTE_FETCH_ROWS", 2)
+    rows = [
+        # closed at the old rate (5/min), 08:10-17:00
+        _shift(1, 1, datetime(2024, 5, 1, 8, 10), datetime(2024, 5, 1, 17), 530, 2650, 10, 0),
+        # closed, left early at 16:30
+        _shift(2, 2, datetime(2024, 5, 1, 8), datetime(2024, 5, 1, 16, 30), 510, 2550, 0, 30),
+        # still open, came in at 09:00
+        _shift(3, 1, datetime(2024, 5, 2, 9), None, 0, 0, 60, 0),
+    ]
+    stub_conn.results.append(lambda sql, params: rows if sql.startswith("SELECT id, id_employee") else None)
+    return rows
+
+
+def test_recompute_dry_run_matches_scalar_rules(stub_conn, shifts):
+    rules = ScanRules(rate_per_minute=2, shift_start=dt_time(8, 30), shift_end=dt_time(17))
+    result = recompute_payroll(stub_conn, rules, date(2024, 5, 1), date(2024, 5, 2))
+
+    assert result["rows"] == 3
+    assert result["before"] == {"minutes": 1040, "salary": 5200.0, "late_minutes": 70, "undertime_minutes": 30}
+    # same numbers ScanRules gives a live scan
+    out_1 = rules.time_out_fields(datetime(2024, 5, 1, 8, 10), datetime(2024, 5, 1, 17))
+    out_2 = rules.time_out_fields(datetime(2024, 5, 1, 8), datetime(2024, 5, 1, 16, 30))
+    late_3 = rules.late_minutes(datetime(2024, 5, 2, 9))
+    assert result["after"] == {
+        "minutes": out_1["duration"] + out_2["duration"],
+        "salary": out_1["salary"] + out_2["salary"],
+        "late_minutes": 0 + 0 + late_3,
+        "undertime_minutes": out_1["undertime_minutes"] + out_2["undertime_minutes"],
+    }
+    assert result["changed"] == 3
+    by_employee = {e["id_employee"]: e for e in result["employees"]}
+    assert by_employee[1]["salary_change"] == 1060 - 2650
+    assert stub_conn.commits == 0
+    assert not [sql for sql, _ in stub_conn.statements if sql.startswith("INSERT")]
+    assert not [sql for sql, _ in stub_conn.statements if sql.endswith("FOR UPDATE")]
+
+
+def test_recompute_writes_changed_rows(stub_conn, shifts):
+    rules = ScanRules(rate_per_minute=5, shift_start=dt_time(8, 30), shift_end=dt_time(17))
+    recompute_payroll(stub_conn, rules, date(2024, 5, 1), date(2024, 5, 2), dry_run=False)
+
+    # rows are locked from the load to the commit, so none can vanish in between
+    selects = [sql for sql, _ in stub_conn.statements if sql.startswith("SELECT id, id_employee")]
+    assert len(selects) == 1 and selects[0].endswith("FOR UPDATE")
+    # only the start moved: row 2 is unchanged, the open row 3 gets late_minutes only
+    upserts = stub_conn.executed("INSERT INTO opti_rec")
+    assert sorted(upserts) == [(1, 1, 530, 2650.0, 0, 0), (3, 1, 30)]
+    assert stub_conn.commits == 1
+
+
+def test_recompute_needs_numpy(stub_conn, monkeypatch):
+    monkeypatch.setattr(opti_payroll, "np", None)
+    with pytest.raises(RuntimeError):
+        recompute_payroll(stub_conn, ScanRules(), date(2024, 5, 1), date(2024, 5, 1))
@@ -0,0 +1,122 @@
+from datetime import datetime, time as dt_time
+
+import pytest
+
+from opti_scan import ScanRules, apply_scan_batch, batch_employees, parse_scanned_at, plan_scan_batch
+
+EMPLOYEES = {"A": {"id_employee": 1, "name": "Ann"}, "B": {"id_employee": 2, "name": "Ben"}}
+lookup = EMPLOYEES.get
+
+
+def at(hour, minute=0, second=0, day=1):
+    return datetime(2024, 5, day, hour, minute, second)
+
+
+# -----------------------------
+# parse_scanned_at
+# -----------------------------
+@pytest.mark.parametrize("value, expected", [
+    ("2024-05-01T08:02:11", at(8, 2, 11)),
+    ("2024-05-01T08:02:11.987654", at(8, 2, 11)),
+    (" 2024-05-01 08:02:11 ", at(8, 2, 11)),
+])
+def test_parse_scanned_at_iso(value, expected):
+    assert parse_scanned_at(value) == expected
+
+
+def test_parse_scanned_at_epoch_drops_microseconds():
+    epoch = at(8, 2, 11).timestamp() + 0.75
+    assert parse_scanned_at(epoch) == at(8, 2, 11)
+    assert parse_scanned_at(int(epoch)) == at(8, 2, 11)
+
+
+def test_parse_scanned_at_utc_is_converted_to_local():
+    parsed = parse_scanned_at("2024-05-01T08:02:11Z")
+    assert parsed.tzinfo is None
+    assert parsed == datetime.fromtimestamp(datetime.fromisoformat("2024-05-01T08:02:11+00:00").timestamp())
+
+
+@pytest.mark.parametrize("value", [None, True, False, "", "yesterday", [], {}, 1e20])
+def test_parse_scanned_at_rejects(value):
+    assert parse_scanned_at(value) is None
+
+
+# -----------------------------
+# plan_scan_batch
+# -----------------------------
+def test_plan_pairs_time_in_and_out_into_one_insert():
+    rules = ScanRules(rate_per_minute=5)
+    results, inserts, updates = plan_scan_batch(rules, [("A", at(8)), ("A", at(17))], lookup, {})
+    assert [r["status"] for r in results] == ["time_in", "time_out"]
+    assert [(r["id_employee"], r["name"]) for r in results] == [(1, "Ann"), (1, "Ann")]
+    assert results[1]["duration"] == 540 and results[1]["salary"] == 2700
+    assert updates == []
+    assert len(inserts) == 1
+    assert inserts[0]["time_in"] == at(8) and inserts[0]["time_out"] == at(17)
+
+
+def test_plan_applies_in_time_order_but_answers_in_input_order():
+    results, inserts, _ = plan_scan_batch(ScanRules(), [("A", at(17)), ("A", at(8)), ("A", at(18))], lookup, {})
+    assert [r["status"] for r in results] == ["time_out", "time_in", "already_done"]
+    assert inserts[0]["time_in"] == at(8)
+
+
+def test_plan_closes_existing_open_shift_as_update():
+    existing = {(1, at(0).date()): {"id": 42, "id_employee": 1, "time_in": at(8), "time_out": None}}
+    results, inserts, updates = plan_scan_batch(ScanRules(), [("A", at(12))], lookup, existing)
+    assert results[0]["status"] == "time_out"
+    assert inserts == []
+    assert [u["id"] for u in updates] == [42]
+    assert updates[0]["time_out"] == at(12) and updates[0]["duration"] == 240
+
+
+def test_plan_statuses():
+    rules = ScanRules(cooldown_seconds=60)
+    items = [("A", at(8)), ("A", at(8, 0, 30)), ("Z", at(9)), ("", at(9)), ("B", None)]
+    results, inserts, _ = plan_scan_batch(rules, items, lookup, {})
+    assert [r["status"] for r in results] == ["time_in", "cooldown", "not_found", "invalid", "invalid"]
+    assert len(inserts) == 1
+
+
+def test_plan_one_shift_per_employee_per_day():
+    items = [("A", at(8, day=1)), ("A", at(8, day=2))]
+    results, inserts, _ = plan_scan_batch(ScanRules(), items, lookup, {})
+    assert [r["status"] for r in results] == ["time_in", "time_in"]
+    assert len(inserts) == 2
+
+
+def test_plan_late_and_undertime_fields():
+    rules = ScanRules(rate_per_minute=1, shift_start=dt_time(8), shift_end=dt_time(17))
+    results, inserts, _ = plan_scan_batch(rules, [("A", at(8, 10)), ("A", at(16, 30))], lookup, {})
+    assert results[0]["late_minutes"] == 10
+    assert results[1]["undertime_minutes"] == 30
+    assert inserts[0]["late_minutes"] == 10 and inserts[0]["undertime_minutes"] == 30
+
+
+def test_batch_employees_skips_invalid_and_unknown():
+    ids, days = batch_employees([("A", at(8)), ("B", None), ("Z", at(9)), ("B", at(9, day=2))], lookup)
+    assert ids == {1, 2}
+    assert days == {at(0).date(), at(0, day=2).date()}
+
+
+# -----------------------------
+# apply_scan_batch
+# -----------------------------
+def test_apply_reads_days_with_one_locking_read(stub_conn):
+    existing_row = {"id": 7, "id_employee": 2, "time_in": at(8), "time_out": None}
+    stub_conn.results.append(lambda sql, params: [existing_row] if sql.startswith("SELECT") else None)
+    results, touched = apply_scan_batch(stub_conn, ScanRules(), [("A", at(9)), ("B", at(17))], lookup)
+
+    selects = [sql for sql, _ in stub_conn.statements if sql.startswith("SELECT")]
+    assert len(selects) == 1 and selects[0].endswith("FOR UPDATE")
+    assert [r["status"] for r in results] == ["time_in", "time_out"]
+    assert [p[:2] for p in stub_conn.executed("INSERT INTO opti_rec (id_employee, time_in")] == [(1, at(9))]
+    assert [p[0] for p in stub_conn.executed("INSERT INTO opti_rec (id, id_employee")] == [7]
+    assert touched == {at(0).date()}
+    assert stub_conn.commits == 1
+
+
+def test_apply_without_known_employees_writes_nothing(stub_conn):
+    results, touched = apply_scan_batch(stub_conn, ScanRules(), [("Z", at(9))], lookup)
+    assert results == [{"status": "not_found"}]
+    assert stub_conn.statements == [] and touched == set()
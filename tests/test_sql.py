@@ -0,0 +1,64 @@
+import os
+from datetime import date, datetime
+
+import pymysql
+import pytest
+
+from opti_sql import HOT_QUERY_PLANS, check_index_plans, day_range, period_range
+
+
+def test_day_range_is_half_open():
+    assert day_range(date(2024, 2, 28)) == (datetime(2024, 2, 28), datetime(2024, 2, 29))
+    assert day_range(datetime(2024, 12, 31, 23, 59)) == (datetime(2024, 12, 31), datetime(2025, 1, 1))
+
+
+def test_period_range_covers_whole_days():
+    assert period_range(date(2024, 5, 1), date(2024, 5, 31)) == (datetime(2024, 5, 1), datetime(2024, 6, 1))
+
+
+def test_check_index_plans_reads_the_key_and_skips_missing_tables(stub_conn):
+    def fail(sql, params):
+        if "opti_daily_pay" in sql:
+            raise pymysql.err.ProgrammingError(1146, "Table 'opti_db.opti_daily_pay' doesn't exist")
+    stub_conn.fail = fail
+    expected = {name: index for name, _, _, index in HOT_QUERY_PLANS}
+    stub_conn.results.append(lambda sql, params: [{"table": "o", "key": "PRIMARY"},
+                                                  {"table": "opti_rec", "key": "idx_opti_rec_time_in"}])
+
+    results = {name: (used, ok) for name, _, used, ok in check_index_plans(stub_conn.cursor())}
+    assert results.keys() == expected.keys()
+    for name, (used, ok) in results.items():
+        if "opti_daily_pay" in name:
+            assert (used, ok) == (None, None)
+        else:
+            assert used == "idx_opti_rec_time_in"
+            assert ok == (expected[name] == "idx_opti_rec_time_in")
+
+
+# -----------------------------
+# Integration (MySQL)
+# -----------------------------
+# EXPLAIN checks need a real database with migrations/ applied and some
+# history in opti_rec; they run only when OPTI_TEST_DB names one, e.g.
+#     OPTI_TEST_DB=opti_db OPTI_TEST_DB_PASSWORD=... python -m pytest tests
+@pytest.fixture
+def mysql_cursor():
+    database = os.environ.get("OPTI_TEST_DB")
+    if not database:
+        pytest.skip("OPTI_TEST_DB not set")
+    import pymysql
+    conn = pymysql.connect(host=os.environ.get("OPTI_TEST_DB_HOST", "localhost"),
+                           user=os.environ.get("OPTI_TEST_DB_USER", "root"),
+                           password=os.environ.get("OPTI_TEST_DB_PASSWORD", ""),
+                           database=database, cursorclass=pymysql.cursors.DictCursor)
+    try:
+        with conn.cursor() as cur:
+            yield cur
+    finally:
+        conn.close()
+
+
+def test_hot_queries_use_their_index(mysql_cursor):
+    failed = [(name, expected, used) for name, expected, used, ok in check_index_plans(mysql_cursor)
+              if ok is False]
+    assert failed == []
@@ -0,0 +1,162 @@
+import json
+from datetime import datetime
+
+import pymysql
+import pytest
+
+from opti_payroll import PayrollRollup
+from opti_writer import AttendanceWriter, WriteBacklog
+
+
+def at(hour, minute=0):
+    return datetime(2024, 5, 1, hour, minute)
+
+
+@pytest.fixture
+def make_writer(stub_pool, tmp_path):
+    writers = []
+
+    def make(**kwargs):
+        kwargs.setdefault("flush_interval", 0.01)
+        writer = AttendanceWriter(stub_pool, str(tmp_path / "attendance.journal"), **kwargs)
+        writers.append(writer)
+        return writer
+
+    yield make
+    for writer in writers:
+        writer.stop(1)
+
+
+def test_submits_are_grouped_into_one_transaction(make_writer, stub_conn):
+    writer = make_writer(flush_interval=5, max_batch=4)
+    writer.start()
+    for i in range(4):
+        writer.time_in(i, at(8, i), late_minutes=i)
+    assert writer.drain(2)
+    assert stub_conn.commits == 1
+    assert writer.stats()["flushes"] == 1
+    assert [p[0] for p in stub_conn.executed("INSERT INTO opti_rec")] == [0, 1, 2, 3]
+    # fully committed: the journal starts over
+    with open(writer.journal_path) as f:
+        assert f.read() == ""
+
+
+def test_group_fsync_covers_earlier_lines(make_writer):
+    writer = make_writer(fsync=True, flush_interval=5, max_batch=1000)
+    writer.start()
+    fsyncs = writer.fsyncs
+    with writer._journal_lock:
+        # two lines journaled before anyone syncs: one fsync covers both
+        seqs = []
+        for i in range(2):
+            writer._seq += 1
+            seqs.append(writer._seq)
+            writer._journal.write(writer._encode({"seq": writer._seq, "op": "noop"}))
+    writer._sync_through(seqs[0])
+    writer._sync_through(seqs[1])
+    assert writer.fsyncs == fsyncs + 1
+
+
+def test_replay_skips_work_already_in_mysql(make_writer, stub_conn, tmp_path):
+    journal = tmp_path / "attendance.journal"
+    lines = [
+        {"seq": 1, "op": "time_in", "id_employee": 1, "time_in": at(8).isoformat(), "fields": {}},
+        {"committed": 1},
+        {"seq": 2, "op": "time_in", "id_employee": 2, "time_in": at(8).isoformat(), "fields": {}},
+        {"seq": 3, "op": "time_out", "id": None, "id_employee": 2, "time_in": at(8).isoformat(),
+         "time_out": at(17).isoformat(), "fields": {"duration": 540, "salary": 2700}},
+        {"seq": 4, "op": "time_in", "id_employee": 3, "time_in": at(9).isoformat(), "fields": {}},
+    ]
+    journal.write_text("".join(json.dumps(line) + "\n" for line in lines) + '{"seq": 5, "op": "ti')
+
+    def answer(sql, params):
+        # employee 2's time_in made it before the crash, its time_out did not
+        if sql.startswith("SELECT 1 FROM opti_rec") and params[0] == 2:
+            return [{"1": 1}]
+        if sql.startswith("SELECT time_out FROM opti_rec") and params[0] == 2:
+            return [{"time_out": None}]
+        return None
+    stub_conn.results.append(answer)
+
+    writer = make_writer()
+    writer.start()
+    assert writer.drain(2)
+    assert [p[0] for p in stub_conn.executed("INSERT INTO opti_rec")] == [3]
+    assert stub_conn.executed("UPDATE opti_rec SET time_out=%s") == [(at(17), 540, 2700, 2, at(8))]
+    # numbering continues after the last journaled seq
+    assert writer.time_in(4, at(10)) == 5
+
+
+def test_poison_mutation_is_dead_lettered(make_writer, stub_conn):
+    def fail(sql, params):
+        if sql.lstrip().startswith("INSERT") and params[0] == 13:
+            raise pymysql.err.IntegrityError(1452, "foreign key constraint fails")
+    stub_conn.fail = fail
+
+    writer = make_writer(flush_interval=0.5, max_batch=3, max_attempts=2)
+    writer.start()
+    for id_employee in (12, 13, 14):
+        writer.time_in(id_employee, at(8))
+    assert writer.drain(5)
+
+    assert sorted(p[0] for p in stub_conn.executed("INSERT INTO opti_rec")) == [12, 14]
+    assert writer.stats()["dead_letters"] == 1
+    with open(writer.dead_letter_path) as f:
+        dead = [json.loads(line) for line in f]
+    assert [(d["id_employee"], d["op"]) for d in dead] == [(13, "time_in")]
+    assert "foreign key" in dead[0]["error"]
+
+
+def test_transient_errors_retry_the_batch(make_writer, stub_conn):
+    failures = [pymysql.err.OperationalError(2013, "Lost connection")] * 2
+
+    def fail(sql, params):
+        if failures:
+            raise failures.pop()
+    stub_conn.fail = fail
+
+    writer = make_writer()
+    writer.start()
+    writer.time_in(1, at(8))
+    assert writer.drain(5)
+    assert writer.stats()["failures"] == 2
+    assert writer.stats()["dead_letters"] == 0
+    assert [p[0] for p in stub_conn.executed("INSERT INTO opti_rec")] == [1]
+
+
+def test_ensure_drained_raises_when_mysql_is_down(make_writer, stub_conn):
+    def fail(sql, params):
+        raise pymysql.err.OperationalError(2003, "Can't connect")
+    stub_conn.fail = fail
+
+    writer = make_writer()
+    writer.start()
+    writer.time_in(1, at(8))
+    with pytest.raises(WriteBacklog):
+        writer.ensure_drained(0.1)
+
+
+def test_retry_after_lost_commit_does_not_write_twice(make_writer, stub_conn):
+    commit = stub_conn.commit
+    lost = [pymysql.err.OperationalError(2013, "Lost connection to MySQL server during query")]
+
+    def flaky_commit():
+        commit()                        # applied by MySQL, but the reply never arrives
+        if lost:
+            raise lost.pop()
+    stub_conn.commit = flaky_commit
+
+    def answer(sql, params):
+        if sql.startswith("SELECT 1 FROM opti_rec"):
+            inserted = {p[:2] for p in stub_conn.executed("INSERT INTO opti_rec")}
+            return [{"1": 1}] if tuple(params) in inserted else []
+        return None
+    stub_conn.results.append(answer)
+
+    writer = make_writer(rollup=PayrollRollup())
+    writer.start()
+    writer.time_in(1, at(8))
+    assert writer.drain(5)
+    assert writer.stats()["failures"] == 1
+    assert len(stub_conn.executed("INSERT INTO opti_rec")) == 1
+    assert len(stub_conn.executed("INSERT INTO opti_daily_pay")) == 1